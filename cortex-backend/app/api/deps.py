@@ -4,6 +4,7 @@ from fastapi.security import OAuth2PasswordBearer
 from jwt import PyJWTError, decode as jwt_decode
 from app.core import config, security
 from app.models import User
+from app.services.permission_cache import get_cached_user
 
 # 指向登录接口的 URL
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/login/access-token")
@@ -26,8 +27,8 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]) -> Use
     except PyJWTError:
         raise credentials_exception
 
-    # 从数据库查询用户
-    user = await User.get_or_none(id=user_id)
+    # 从数据库查询用户（进程内短期缓存，资料修改后失效）
+    user = await get_cached_user(user_id)
     if user is None:
         raise credentials_exception
     return user
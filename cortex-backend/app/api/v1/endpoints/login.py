@@ -7,6 +7,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from app.core import security
 from app.models import User
 from app.schemas.token import Token
+from app.services.permission_cache import publish_permission_invalidation
 
 router = APIRouter()
 
@@ -27,7 +28,9 @@ async def login_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Dep
     # 生成 Token (将用户 ID 放入 Token)
     access_token = security.create_access_token(subject=user.id)
     user.last_login_at = datetime.now(timezone.utc)
-    await user.save()
+    await user.save(update_fields=["last_login_at"])
+    # 各进程缓存的用户行随之失效，避免后续基于旧行的写入覆盖 last_login_at
+    await publish_permission_invalidation(user_ids=[user.id])
     return Token(
         access_token=access_token,
         token_type="bearer"
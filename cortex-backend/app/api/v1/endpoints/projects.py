@@ -6,6 +6,7 @@ from app.schemas.project import (
 )
 from app.models import Project, ProjectMember, User, Task
 from app.api.deps import get_current_user
+from app.services.permission_cache import get_visible_projects, publish_permission_invalidation
 
 router = APIRouter()
 
@@ -63,6 +64,7 @@ async def create_project(
         project=project,
         user=current_user
     )
+    await publish_permission_invalidation(user_ids=[current_user.id])
 
     members = await _get_project_members(project)
     return format_project_response(project, members)
@@ -72,15 +74,8 @@ async def create_project(
 async def read_my_projects(
         current_user: User = Depends(get_current_user)
 ):
-    # 查询我可见的所有项目（负责人或成员，不包含已删除的）
-    joined_project_ids = await ProjectMember.filter(
-        user_id=current_user.id
-    ).values_list("project_id", flat=True)
-    owned_project_ids = await Project.filter(
-        owner_id=current_user.id,
-        deleted_at__isnull=True,
-    ).values_list("id", flat=True)
-    visible_project_ids = sorted(set(joined_project_ids) | set(owned_project_ids))
+    # 查询我可见的所有项目（负责人或成员，不包含已删除的；进程内缓存，成员变化时失效）
+    visible_project_ids = sorted(await get_visible_projects(current_user.id))
 
     if not visible_project_ids:
         return []
@@ -158,6 +153,7 @@ async def delete_project(
     # 软删除
     project.deleted_at = datetime.utcnow()
     await project.save()
+    await publish_permission_invalidation(project_ids=[project.id])
 
     return {"message": "项目已删除"}
 
@@ -199,6 +195,7 @@ async def add_project_member(
 
     # 添加成员
     await ProjectMember.create(project=project, user=user)
+    await publish_permission_invalidation(user_ids=[user.id], project_ids=[project.id])
 
     return {"message": "成员添加成功"}
 
@@ -221,5 +218,6 @@ async def remove_project_member(
 
     # 移除成员
     await membership.delete()
+    await publish_permission_invalidation(user_ids=[user_id], project_ids=[project.id])
 
     return {"message": "成员已移除"}
@@ -3,27 +3,47 @@
 
 提供任务语义相似度搜索功能：
 - POST /similarity/search - 搜索相似任务
+- POST /similarity/search/batch - 批量搜索相似任务
+- POST /similarity/duplicates/{project_id}/scan - 触发项目内重复任务检测
+- GET /similarity/duplicates/{project_id} - 查看项目重复任务检测结果
 """
-import asyncio
 import logging
 from typing import Optional
 
 import asyncpg
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends, Query
 from fastapi import HTTPException
+from tortoise import connections
 
-from app.services.vector_store import search_similar_tasks
+from app.core.config import DUPLICATE_SCAN_THRESHOLD
+from app.services.duplicate_detection import (
+    get_project_duplicates,
+    refresh_project_duplicates,
+)
+from app.services.vector_store import (
+    search_similar_tasks,
+    search_similar_tasks_batch,
+    get_embedding_metrics,
+    get_search_cache_metrics,
+)
 from app.schemas.similarity import (
+    ProjectDuplicatesResponse,
+    SimilarityBatchResultItem,
+    SimilarityBatchSearchRequest,
+    SimilarityBatchSearchResponse,
     SimilaritySearchRequest,
     SimilaritySearchResponse,
     SimilarTaskItem,
 )
-from app.models import TaskComment
 from app.api.deps import get_current_user
+from app.services.permission_cache import get_visible_projects
 
 router = APIRouter(tags=["similarity"])
 logger = logging.getLogger(__name__)
 
+_MODEL_UNAVAILABLE_MESSAGE = "本次语义查重请求失败（模型服务暂不可用），不是功能不支持；你可以先创建任务，稍后重试查重"
+_INFRA_UNAVAILABLE_MESSAGE = "本次语义查重请求失败（数据库/网络连接异常），不是功能不支持；你可以先创建任务，稍后重试查重"
+
 
 def _normalize_text(value: str, max_length: int = 120) -> str:
     text = " ".join(value.split())
@@ -32,21 +52,52 @@ def _normalize_text(value: str, max_length: int = 120) -> str:
     return text[:max_length] + "..."
 
 
-async def _build_recommendation(task_id: int, description: Optional[str]) -> Optional[str]:
+async def _get_visible_project_ids(user_id: int, organization_id: Optional[int] = None) -> list[int]:
+    """当前用户可见的项目（负责人或成员，不含已删除），可按组织进一步收窄"""
+    visible_projects = await get_visible_projects(user_id)
+    return sorted(
+        project_id
+        for project_id, project_organization_id in visible_projects.items()
+        if organization_id is None or project_organization_id == organization_id
+    )
+
+
+async def _fetch_latest_comments(task_ids: list[int], per_task: int = 2) -> dict[int, list[str]]:
+    """一次查询取回每个任务最新的若干条评论（窗口函数按任务分组排序），检索结果再多也只有一次往返"""
+    if not task_ids:
+        return {}
+
+    rows = await connections.get("default").execute_query_dict(
+        """
+        SELECT task_id, content
+        FROM (
+            SELECT
+                task_id,
+                content,
+                ROW_NUMBER() OVER (PARTITION BY task_id ORDER BY created_at DESC, id DESC) AS rn
+            FROM task_comments
+            WHERE task_id = ANY($1::int[])
+        ) ranked
+        WHERE rn <= $2
+        ORDER BY task_id, rn
+        """,
+        [task_ids, per_task],
+    )
+    comments: dict[int, list[str]] = {}
+    for row in rows:
+        comments.setdefault(row["task_id"], []).append(row["content"])
+    return comments
+
+
+def _build_recommendation(description: Optional[str], comments: list[str]) -> Optional[str]:
     segments: list[str] = []
 
     if description and description.strip():
         segments.append(_normalize_text(description, max_length=140))
 
-    comments = (
-        await TaskComment.filter(task_id=task_id)
-        .order_by("-created_at", "-id")
-        .limit(2)
-        .all()
-    )
-    for comment in comments:
-        if comment.content and comment.content.strip():
-            segments.append(_normalize_text(comment.content, max_length=100))
+    for content in comments:
+        if content and content.strip():
+            segments.append(_normalize_text(content, max_length=100))
 
     if not segments:
         return None
@@ -54,6 +105,51 @@ async def _build_recommendation(task_id: int, description: Optional[str]) -> Opt
     return " / ".join(segments)
 
 
+async def _resolve_search_project_ids(
+    user_id: int,
+    project_id: Optional[int],
+    organization_id: Optional[int],
+) -> list[int]:
+    """检索范围：当前用户可见的项目，指定 project_id 时收窄到该项目（不可见则 403）"""
+    visible_project_ids = await _get_visible_project_ids(user_id=user_id, organization_id=organization_id)
+    if project_id is not None:
+        if project_id not in visible_project_ids:
+            raise HTTPException(status_code=403, detail="No access to project")
+        visible_project_ids = [project_id]
+    return visible_project_ids
+
+
+async def _build_result_items(result_lists: list[list[dict]]) -> list[list[SimilarTaskItem]]:
+    """把检索结果转换为响应项，所有结果的推荐评论一次查询取回"""
+    task_ids = sorted({r["task_id"] for results in result_lists for r in results})
+    try:
+        latest_comments = await _fetch_latest_comments(task_ids)
+    except Exception as e:
+        # 推荐信息只是辅助展示，查询失败时不影响检索结果返回
+        logger.warning("Failed to build recommendation: %s", e)
+        latest_comments = None
+
+    return [
+        [
+            SimilarTaskItem(
+                task_id=r["task_id"],
+                title=r["title"],
+                description=r["description"],
+                status=r["status"],
+                priority=r["priority"],
+                project_id=r["project_id"],
+                similarity=r["similarity"],
+                created_at=r["created_at"],
+                recommendation=None
+                if latest_comments is None
+                else _build_recommendation(r.get("description"), latest_comments.get(r["task_id"], [])),
+            )
+            for r in results
+        ]
+        for results in result_lists
+    ]
+
+
 @router.post("/search", response_model=SimilaritySearchResponse)
 async def search_similar(
     request: SimilaritySearchRequest,
@@ -64,52 +160,35 @@ async def search_similar(
 
     - 根据输入的文本内容，在已有任务中搜索语义相似的任务
     - 返回相似度超过阈值的结果，按相似度降序排列
+    - 仅在当前用户可见的项目内检索，可通过 project_id / organization_id 进一步收窄
+    - mode=hybrid 时文本与向量两路并发召回并按倒数排名融合，适合含错误码、模块名的短标题
     """
+    visible_project_ids = await _resolve_search_project_ids(
+        user_id=current_user.id,
+        project_id=request.project_id,
+        organization_id=request.organization_id,
+    )
+
     try:
         results = await search_similar_tasks(
             text_content=request.text,
             exclude_task_id=request.exclude_task_id,
             limit=request.limit,
             threshold=request.threshold,
+            ef_search=request.ef_search,
+            probes=request.probes,
+            project_ids=visible_project_ids,
+            organization_id=request.organization_id,
+            mode=request.mode,
+            latency_budget_ms=request.latency_budget_ms,
         )
-
-        recommendations = await asyncio.gather(
-            *[
-                _build_recommendation(
-                    task_id=r["task_id"],
-                    description=r.get("description"),
-                )
-                for r in results
-            ],
-            return_exceptions=True,
-        )
-
-        safe_recommendations = []
-        for recommendation in recommendations:
-            if isinstance(recommendation, Exception):
-                logger.warning("Failed to build recommendation: %s", recommendation)
-                safe_recommendations.append(None)
-            else:
-                safe_recommendations.append(recommendation)
+        items = (await _build_result_items([results]))[0]
 
         return SimilaritySearchResponse(
             success=True,
             query=request.text,
-            results=[
-                SimilarTaskItem(
-                    task_id=r["task_id"],
-                    title=r["title"],
-                    description=r["description"],
-                    status=r["status"],
-                    priority=r["priority"],
-                    project_id=r["project_id"],
-                    similarity=r["similarity"],
-                    created_at=r["created_at"],
-                    recommendation=safe_recommendations[idx],
-                )
-                for idx, r in enumerate(results)
-            ],
-            total=len(results),
+            results=items,
+            total=len(items),
         )
     except RuntimeError as e:
         logger.warning("Similarity search degraded: %s", e)
@@ -118,7 +197,7 @@ async def search_similar(
             query=request.text,
             results=[],
             total=0,
-            message="本次语义查重请求失败（模型服务暂不可用），不是功能不支持；你可以先创建任务，稍后重试查重",
+            message=_MODEL_UNAVAILABLE_MESSAGE,
         )
     except (asyncpg.PostgresError, OSError, ConnectionError) as e:
         logger.warning("Similarity search degraded due to infra dependency: %s", e)
@@ -127,14 +206,103 @@ async def search_similar(
             query=request.text,
             results=[],
             total=0,
-            message="本次语义查重请求失败（数据库/网络连接异常），不是功能不支持；你可以先创建任务，稍后重试查重",
+            message=_INFRA_UNAVAILABLE_MESSAGE,
         )
     except Exception as e:
         logger.exception("Similarity search failed: %s", e)
         raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
 
 
+@router.post("/search/batch", response_model=SimilarityBatchSearchResponse)
+async def search_similar_batch(
+    request: SimilarityBatchSearchRequest,
+    current_user=Depends(get_current_user),
+):
+    """
+    批量搜索相似任务（导入 backlog、批量查重）
+
+    - 全部文本一次批量 encode，ANN 检索合并为一条 SQL，推荐评论一次查询
+    - 结果按输入顺序返回，index 对应 texts 中的下标
+    - 检索范围与单条接口一致
+    """
+    visible_project_ids = await _resolve_search_project_ids(
+        user_id=current_user.id,
+        project_id=request.project_id,
+        organization_id=request.organization_id,
+    )
+
+    try:
+        result_lists = await search_similar_tasks_batch(
+            texts=request.texts,
+            exclude_task_ids=request.exclude_task_ids,
+            limit=request.limit,
+            threshold=request.threshold,
+            ef_search=request.ef_search,
+            probes=request.probes,
+            project_ids=visible_project_ids,
+            organization_id=request.organization_id,
+        )
+        item_lists = await _build_result_items(result_lists)
+
+        return SimilarityBatchSearchResponse(
+            success=True,
+            results=[
+                SimilarityBatchResultItem(index=idx, query=text, results=items, total=len(items))
+                for idx, (text, items) in enumerate(zip(request.texts, item_lists))
+            ],
+            total=len(request.texts),
+        )
+    except RuntimeError as e:
+        logger.warning("Batch similarity search degraded: %s", e)
+        return SimilarityBatchSearchResponse(success=False, results=[], total=0, message=_MODEL_UNAVAILABLE_MESSAGE)
+    except (asyncpg.PostgresError, OSError, ConnectionError) as e:
+        logger.warning("Batch similarity search degraded due to infra dependency: %s", e)
+        return SimilarityBatchSearchResponse(success=False, results=[], total=0, message=_INFRA_UNAVAILABLE_MESSAGE)
+    except Exception as e:
+        logger.exception("Batch similarity search failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"搜索失败: {str(e)}")
+
+
+@router.post("/duplicates/{project_id}/scan", response_model=ProjectDuplicatesResponse, status_code=202)
+async def scan_project_duplicates(
+    project_id: int,
+    background_tasks: BackgroundTasks,
+    threshold: float = Query(DUPLICATE_SCAN_THRESHOLD, ge=0.5, le=1.0, description="视为重复的相似度阈值"),
+    full: bool = Query(False, description="忽略缓存全量重算"),
+    current_user=Depends(get_current_user),
+):
+    """
+    触发项目内近似重复任务检测（后台执行）
+
+    - 已有缓存且阈值不变时只增量处理变化的任务
+    - 返回当前缓存结果，完成后通过 GET /similarity/duplicates/{project_id} 查看
+    """
+    await _resolve_search_project_ids(user_id=current_user.id, project_id=project_id, organization_id=None)
+
+    stored = await get_project_duplicates(project_id)
+    if stored["status"] == "running":
+        return ProjectDuplicatesResponse(**stored)
+
+    background_tasks.add_task(refresh_project_duplicates, project_id, threshold=threshold, full=full)
+    return ProjectDuplicatesResponse(**{**stored, "status": "scheduled"})
+
+
+@router.get("/duplicates/{project_id}", response_model=ProjectDuplicatesResponse)
+async def get_project_duplicate_clusters(
+    project_id: int,
+    current_user=Depends(get_current_user),
+):
+    """查看项目最近一次重复检测的结果（重复簇按规模与相似度降序）"""
+    await _resolve_search_project_ids(user_id=current_user.id, project_id=project_id, organization_id=None)
+    return ProjectDuplicatesResponse(**await get_project_duplicates(project_id))
+
+
 @router.get("/health")
 async def health_check():
-    """健康检查"""
-    return {"status": "ok", "service": "similarity"}
+    """健康检查（附带 embedding 线程池与检索缓存指标）"""
+    return {
+        "status": "ok",
+        "service": "similarity",
+        "embedding": get_embedding_metrics(),
+        "search_cache": get_search_cache_metrics(),
+    }
@@ -1,32 +1,49 @@
+import base64
+import json
 import logging
-from datetime import datetime
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime, timedelta
+from typing import Annotated, List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from tortoise import timezone
+from tortoise.expressions import Q, RawSQL
+from tortoise.transactions import in_transaction
 
 from app.api.deps import get_current_user
+from app.core.config import (
+    TASK_EVENTS_ENABLED,
+    TASK_LIST_DEFAULT_PAGE_SIZE,
+    TASK_LIST_MAX_PAGE_SIZE,
+    TASK_SYNC_LAG_SECONDS,
+)
 from app.schemas.task import (
     TaskCreate,
+    TaskListQuery,
+    TaskSyncResponse,
     TaskRead,
     TaskUpdate,
     TaskCommentCreate,
     TaskCommentRead,
     TaskCommentListResponse,
 )
-from app.models import Task, User, Project, ProjectMember, TaskComment, TaskCollaborator
-from app.services.vector_store import upsert_task_embedding, delete_task_embedding
+from app.models import Task, User, Project, TaskComment, TaskCollaborator
+from app.services.embedding_outbox import enqueue_task_embedding, wake_embedding_outbox_worker
+from app.services.permission_cache import get_project_member_ids, get_visible_projects
+from app.services.task_events import parse_task_event_cursor, stream_task_events
+from app.services.vector_store import publish_similarity_invalidation
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 
 async def _is_project_member(project_id: int, user_id: int) -> bool:
-    return await ProjectMember.filter(project_id=project_id, user_id=user_id).exists()
+    return user_id in await get_project_member_ids(project_id)
 
 
 async def _get_project_participant_ids(project: Project) -> set[int]:
-    participant_ids = set(
-        await ProjectMember.filter(project_id=project.id).values_list("user_id", flat=True)
-    )
+    participant_ids = set(await get_project_member_ids(project.id))
     if project.owner_id:
         participant_ids.add(project.owner_id)
     return participant_ids
@@ -98,6 +115,69 @@ async def _serialize_tasks(tasks: List[Task]) -> List[dict]:
     return [_serialize_task(task, collaborator_map.get(task.id, [])) for task in tasks]
 
 
+def _encode_keyset_token(timestamp: datetime, task_id: int) -> str:
+    payload = json.dumps({"ts": timestamp.isoformat(), "id": task_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_keyset_token(token: str, error_detail: str) -> tuple[datetime, int]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        timestamp = datetime.fromisoformat(payload["ts"])
+        if timestamp.tzinfo is None:
+            raise ValueError("naive timestamp")
+        return timestamp, int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail=error_detail)
+
+
+def _encode_task_cursor(task: Task) -> str:
+    return _encode_keyset_token(task.created_at, task.id)
+
+
+def _decode_task_cursor(cursor: str) -> tuple[datetime, int]:
+    return _decode_keyset_token(cursor, "Invalid cursor")
+
+
+def _build_task_list_filters(query: TaskListQuery) -> dict:
+    filters = {}
+    if query.status:
+        filters["status__in"] = query.status
+    if query.type:
+        filters["type__in"] = query.type
+    if query.priority:
+        filters["priority__in"] = query.priority
+    if query.assignee_id is not None:
+        filters["assignee_id"] = query.assignee_id
+    if query.deadline_from is not None:
+        filters["deadline__gte"] = query.deadline_from
+    if query.deadline_to is not None:
+        filters["deadline__lte"] = query.deadline_to
+    if query.updated_since is not None:
+        filters["updated_at__gte"] = query.updated_since
+    return filters
+
+
+async def _fetch_task_page(queryset, query: TaskListQuery, response: Response) -> List[dict]:
+    """
+    按 (created_at, id) 倒序做 keyset 分页：多取一条判断是否还有下一页，
+    有则把下一页游标写入 X-Next-Cursor 响应头
+    """
+    limit = query.limit or TASK_LIST_DEFAULT_PAGE_SIZE
+    if query.cursor:
+        created_at, task_id = _decode_task_cursor(query.cursor)
+        # created_at <= 游标 可直接作为索引范围条件，OR 部分只在同一时间戳的边界行上生效
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(id__lt=task_id),
+            created_at__lte=created_at,
+        )
+    tasks = await queryset.order_by("-created_at", "-id").limit(limit + 1).all()
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_task_cursor(tasks[-1])
+    return await _serialize_tasks(tasks)
+
+
 async def _ensure_project_access(project_id: int, current_user: User) -> Project:
     project = await Project.get_or_none(id=project_id, deleted_at__isnull=True)
     if not project:
@@ -112,28 +192,53 @@ async def _ensure_project_access(project_id: int, current_user: User) -> Project
     raise HTTPException(status_code=403, detail="No access to project")
 
 
+def _direct_access_sql(user_id: int) -> RawSQL:
+    """当前用户是任务 assignee 或协作者（EXISTS 子查询，与任务查询同一条 SQL 执行）"""
+    user_id = int(user_id)
+    return RawSQL(
+        f'("tasks"."assignee_id" = {user_id} OR EXISTS ('
+        f'SELECT 1 FROM task_collaborators tc WHERE tc.task_id = "tasks"."id" AND tc.user_id = {user_id}))'
+    )
+
+
+def _task_access_annotations(user_id: int) -> dict:
+    """
+    任务访问判定（随任务查询一起计算，一次往返完成鉴权）：
+    - direct_access：当前用户是 assignee 或协作者
+    - project_active：所属项目存在且未删除
+    - project_access：所属项目未删除，且当前用户是 owner 或项目成员
+    """
+    user_id = int(user_id)
+    return {
+        "direct_access": _direct_access_sql(user_id),
+        "project_active": RawSQL(
+            'EXISTS (SELECT 1 FROM projects p WHERE p.id = "tasks"."project_id" AND p.deleted_at IS NULL)'
+        ),
+        "project_access": RawSQL(
+            f'EXISTS (SELECT 1 FROM projects p WHERE p.id = "tasks"."project_id" AND p.deleted_at IS NULL '
+            f'AND (p.owner_id = {user_id} OR EXISTS ('
+            f'SELECT 1 FROM project_members pm WHERE pm.project_id = p.id AND pm.user_id = {user_id})))'
+        ),
+    }
+
+
 async def _ensure_task_access(task_id: int, current_user: User) -> Task:
     """
-    校验任务访问权限：任务 assignee、项目 owner 或项目成员可访问
+    校验任务访问权限：任务 assignee、协作者、项目 owner 或项目成员可访问
     """
-    task = await Task.get_or_none(id=task_id, deleted_at__isnull=True)
+    task = await Task.filter(id=task_id, deleted_at__isnull=True).annotate(
+        **_task_access_annotations(current_user.id)
+    ).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    if task.assignee_id == current_user.id:
+    if task.direct_access:
         return task
 
-    if await TaskCollaborator.filter(task_id=task.id, user_id=current_user.id).exists():
-        return task
-
-    project = await Project.get_or_none(id=task.project_id, deleted_at__isnull=True)
-    if not project:
+    if not task.project_active:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if project.owner_id == current_user.id:
-        return task
-
-    if await _is_project_member(project_id=task.project_id, user_id=current_user.id):
+    if task.project_access:
         return task
 
     raise HTTPException(status_code=403, detail="No access to task")
@@ -143,24 +248,14 @@ async def _ensure_task_restore_access(task_id: int, current_user: User) -> Task:
     """
     校验恢复任务访问权限：任务需存在（可已软删除），且当前用户有访问权限
     """
-    task = await Task.get_or_none(id=task_id)
+    task = await Task.filter(id=task_id).annotate(**_task_access_annotations(current_user.id)).first()
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
 
-    project = await Project.get_or_none(id=task.project_id, deleted_at__isnull=True)
-    if not project:
+    if not task.project_active:
         raise HTTPException(status_code=404, detail="Project not found")
 
-    if task.assignee_id == current_user.id:
-        return task
-
-    if await TaskCollaborator.filter(task_id=task.id, user_id=current_user.id).exists():
-        return task
-
-    if project.owner_id == current_user.id:
-        return task
-
-    if await _is_project_member(project_id=task.project_id, user_id=current_user.id):
+    if task.direct_access or task.project_access:
         return task
 
     raise HTTPException(status_code=403, detail="No access to task")
@@ -184,68 +279,156 @@ async def create_task(
         collaborator_ids=collaborator_ids,
     )
 
-    # 3. 创建任务，自动将当前用户设为 assignee（如果未指定）
-    task = await Task.create(
-        title=task_in.title,
-        description=task_in.description,
-        type=task_in.type,
-        priority=task_in.priority,
-        status=task_in.status,
-        deadline=task_in.deadline,
-        project=project,
-        assignee_id=assignee_id
-    )
+    async with in_transaction():
+        # 3. 创建任务，自动将当前用户设为 assignee（如果未指定）
+        task = await Task.create(
+            title=task_in.title,
+            description=task_in.description,
+            type=task_in.type,
+            priority=task_in.priority,
+            status=task_in.status,
+            deadline=task_in.deadline,
+            project=project,
+            assignee_id=assignee_id
+        )
 
-    # 4. 写入协同人关系
-    await _replace_task_collaborators(task.id, collaborator_ids)
+        # 4. 写入协同人关系
+        await _replace_task_collaborators(task.id, collaborator_ids)
 
-    # 5. 存储任务向量（异步，不阻塞响应）
-    text_content = f"{task_in.title}\n{task_in.description or ''}"
-    await upsert_task_embedding(task.id, text_content)
+        # 5. 登记向量同步（与任务同一事务写入 outbox，由后台 worker 生成 embedding）
+        await enqueue_task_embedding(task.id)
+    wake_embedding_outbox_worker()
+    await publish_similarity_invalidation([project.id])
 
     return _serialize_task(task, collaborator_ids)
 
 
 @router.get("/", response_model=List[TaskRead])
 async def read_my_tasks(
+        response: Response,
+        query: Annotated[TaskListQuery, Query()] = TaskListQuery(),
         current_user: User = Depends(get_current_user)
 ):
     """
-    获取"分配给当前用户"的所有任务（排除已软删除的）
-    CLI 将调用此接口来显示可选任务列表
+    获取"分配给当前用户"或当前用户协作的任务（排除已软删除的），按创建时间倒序分页
+    CLI 将调用此接口来显示可选任务列表；下一页游标见 X-Next-Cursor 响应头
     """
-    assigned_task_ids = await Task.filter(
-        assignee=current_user,
+    # 访问范围与游标、LIMIT 在同一条 SQL 中完成，开销只随页大小增长，不随用户的任务总数增长
+    queryset = Task.annotate(direct_access=_direct_access_sql(current_user.id)).filter(
+        direct_access=True,
         deleted_at__isnull=True,
-    ).values_list("id", flat=True)
-    collaborated_task_ids = await TaskCollaborator.filter(
-        user_id=current_user.id
-    ).values_list("task_id", flat=True)
-
-    visible_task_ids = sorted(set(assigned_task_ids) | set(collaborated_task_ids))
-    if not visible_task_ids:
-        return []
-
-    tasks = await Task.filter(
-        id__in=visible_task_ids,
-        deleted_at__isnull=True,
-    ).all()
-    return await _serialize_tasks(tasks)
+        **_build_task_list_filters(query),
+    )
+    return await _fetch_task_page(queryset, query, response)
 
 @router.get("/project/{project_id}", response_model=List[TaskRead])
 async def get_project_tasks(
     project_id: int,
+    response: Response,
+    query: Annotated[TaskListQuery, Query()] = TaskListQuery(),
     current_user: User = Depends(get_current_user)
 ):
     """
-    获取项目下所有任务（排除已软删除的）
+    获取项目下的任务（排除已软删除的），按创建时间倒序分页，支持按状态/类型/优先级/负责人/截止日期/更新时间过滤
     :param project_id:
+    :param query: 分页与过滤参数，下一页游标见 X-Next-Cursor 响应头
     :param current_user:
     :return:
     """
     await _ensure_project_access(project_id=project_id, current_user=current_user)
-    tasks = await Task.filter(project_id=project_id, deleted_at__isnull=True).all()
-    return await _serialize_tasks(tasks)
+    queryset = Task.filter(
+        project_id=project_id,
+        deleted_at__isnull=True,
+        **_build_task_list_filters(query),
+    )
+    return await _fetch_task_page(queryset, query, response)
+
+
+@router.get("/project/{project_id}/events")
+async def stream_project_events(
+    project_id: int,
+    last_event_id: Optional[str] = Query(None, description="从该事件之后续传（EventSource 首次连接无法设置请求头时使用）"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    项目任务变更事件流（SSE）：task.created / task.updated / task.deleted / task.restored / comment.created
+    事件 id 为不透明游标（"xid-id"），断线重连时带 Last-Event-ID 续传；收到 reset 事件时应重新拉取任务列表
+    """
+    if not TASK_EVENTS_ENABLED:
+        raise HTTPException(status_code=503, detail="Task events are disabled")
+    raw_cursor = last_event_id_header if last_event_id_header is not None else last_event_id
+    try:
+        cursor = parse_task_event_cursor(raw_cursor) if raw_cursor is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    await _ensure_project_access(project_id=project_id, current_user=current_user)
+
+    async def check_access() -> bool:
+        try:
+            await _ensure_project_access(project_id=project_id, current_user=current_user)
+        except HTTPException:
+            return False
+        return True
+
+    return StreamingResponse(
+        stream_task_events(
+            project_id,
+            cursor,
+            check_access,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/sync", response_model=TaskSyncResponse)
+async def sync_tasks(
+    since: Optional[str] = Query(None, description="上次同步返回的 watermark，不传则从头同步"),
+    project_id: Optional[int] = Query(None, description="只同步该项目的任务；不传则同步当前用户可见的全部任务"),
+    limit: int = Query(TASK_LIST_DEFAULT_PAGE_SIZE, ge=1, le=TASK_LIST_MAX_PAGE_SIZE),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    任务增量同步：返回 watermark 之后更新过的任务，按 (updated_at, id) 升序
+    软删除/恢复、协同人变更都会随任务保存更新 updated_at，已软删除的任务作为墓碑返回（deleted_at 非空）；
+    客户端按 id 合并到本地副本，has_more 为 true 时用返回的 watermark 立即继续拉取。
+    失去访问权限的任务不会下发墓碑，客户端应定期不带 since 全量同步一次
+    """
+    if project_id is not None:
+        await _ensure_project_access(project_id=project_id, current_user=current_user)
+        queryset = Task.filter(project_id=project_id)
+    else:
+        visible_projects = await get_visible_projects(current_user.id)
+        scope = Q(direct_access=True)
+        if visible_projects:
+            scope |= Q(project_id__in=sorted(visible_projects))
+        queryset = Task.annotate(direct_access=_direct_access_sql(current_user.id)).filter(scope)
+
+    position = None
+    if since:
+        position = _decode_keyset_token(since, "Invalid watermark")
+        queryset = queryset.filter(
+            Q(updated_at__gt=position[0]) | Q(id__gt=position[1]),
+            updated_at__gte=position[0],
+        )
+
+    # updated_at 在应用侧写入、随事务提交才可见：先取截止时间再查询
+    visible_cutoff = (timezone.now() - timedelta(seconds=TASK_SYNC_LAG_SECONDS), 0)
+    tasks = await queryset.order_by("updated_at", "id").limit(limit + 1).all()
+    has_more = len(tasks) > limit
+    tasks = tasks[:limit]
+    if tasks:
+        position = (tasks[-1].updated_at, tasks[-1].id)
+    if not has_more:
+        # 最后一页的 watermark 不超过截止时间，下次同步重新覆盖最近一段，避免漏掉晚提交的并发写入
+        position = min(position, visible_cutoff) if position is not None else visible_cutoff
+
+    return {
+        "tasks": await _serialize_tasks(tasks),
+        "watermark": _encode_keyset_token(*position),
+        "has_more": has_more,
+    }
 
 
 @router.get("/{task_id}", response_model=TaskRead)
@@ -270,11 +453,13 @@ async def delete_task(
     """
     task = await _ensure_task_access(task_id=task_id, current_user=current_user)
 
-    task.deleted_at = datetime.utcnow()
-    await task.save()
-
-    # 删除任务向量（异步）
-    await delete_task_embedding(task_id)
+    async with in_transaction():
+        task.deleted_at = datetime.utcnow()
+        await task.save()
+        # 登记向量同步（worker 发现任务已软删除后移除向量）
+        await enqueue_task_embedding(task.id)
+    wake_embedding_outbox_worker()
+    await publish_similarity_invalidation([task.project_id])
 
     return {"message": "Task deleted successfully"}
 
@@ -292,15 +477,13 @@ async def restore_task(
     if task.deleted_at is None:
         raise HTTPException(status_code=400, detail="Task is not deleted")
 
-    task.deleted_at = None
-    await task.save()
-
-    # 恢复任务向量
-    text_content = f"{task.title}\n{task.description or ''}"
-    try:
-        await upsert_task_embedding(task.id, text_content)
-    except Exception as exc:
-        logger.warning("Failed to rebuild embedding after restore (task_id=%s): %s", task.id, exc)
+    async with in_transaction():
+        task.deleted_at = None
+        await task.save()
+        # 登记向量同步，由后台 worker 重建向量
+        await enqueue_task_embedding(task.id)
+    wake_embedding_outbox_worker()
+    await publish_similarity_invalidation([task.project_id])
 
     return {"message": "Task restored successfully"}
 
@@ -352,19 +535,28 @@ async def update_task(
     else:
         collaborator_ids = None
 
+    # 标题或描述实际发生变化时才需要重新生成向量
+    should_sync_embedding = any(
+        key in update_data and update_data[key] != getattr(task, key)
+        for key in ("title", "description")
+    )
     for key, value in update_data.items():
         setattr(task, key, value)
 
-    # 4. 保存
-    await task.save()
+    async with in_transaction():
+        # 4. 保存
+        await task.save()
 
-    if should_replace_collaborators:
-        await _replace_task_collaborators(task.id, collaborator_ids)
+        if should_replace_collaborators:
+            await _replace_task_collaborators(task.id, collaborator_ids)
 
-    # 5. 如果标题或描述更新，同步更新向量
-    if "title" in update_data or "description" in update_data:
-        text_content = f"{task.title}\n{task.description or ''}"
-        await upsert_task_embedding(task.id, text_content)
+        # 5. 如果标题或描述有变化，登记向量同步
+        if should_sync_embedding:
+            await enqueue_task_embedding(task.id)
+    if should_sync_embedding:
+        wake_embedding_outbox_worker()
+    # 相似检索结果中包含状态、优先级等字段，任何更新都使所在项目的检索缓存失效
+    await publish_similarity_invalidation([task.project_id])
 
     if collaborator_ids is None:
         collaborator_map = await _get_task_collaborator_map([task.id])
@@ -6,6 +6,7 @@ from app.core.security import get_password_hash, verify_password
 from app.models import User as UserModel
 from app.schemas.user import UserCreate, User, UserUpdateProfile
 from app.api.deps import get_current_user
+from app.services.permission_cache import publish_permission_invalidation
 
 router = APIRouter()
 
@@ -24,21 +25,31 @@ async def update_user_me(
     """
     更新当前登录用户信息
     """
+    # current_user 来自权限缓存，可能落后于数据库：写入前重新读取，并只写回本次修改的字段
+    user = await UserModel.get_or_none(id=current_user.id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    update_fields = []
+
     if user_in.password:
         if not user_in.old_password:
              raise HTTPException(status_code=400, detail="修改密码需要提供旧密码")
-        if not verify_password(user_in.old_password, current_user.hashed_password):
+        if not verify_password(user_in.old_password, user.hashed_password):
              raise HTTPException(status_code=400, detail="旧密码错误")
-        current_user.hashed_password = get_password_hash(user_in.password)
+        user.hashed_password = get_password_hash(user_in.password)
+        update_fields.append("hashed_password")
 
     if user_in.username:
         # Check if username already exists (excluding current user)
-        if await UserModel.filter(username=user_in.username).exclude(id=current_user.id).exists():
+        if await UserModel.filter(username=user_in.username).exclude(id=user.id).exists():
              raise HTTPException(status_code=400, detail="用户名已被使用")
-        current_user.username = user_in.username
+        user.username = user_in.username
+        update_fields.append("username")
 
-    await current_user.save()
-    return current_user
+    if update_fields:
+        await user.save(update_fields=update_fields + ["updated_at"])
+        await publish_permission_invalidation(user_ids=[user.id])
+    return user
 
 @router.post("/", response_model=User)
 async def create_user(user: UserCreate):
@@ -25,4 +25,112 @@ DB_HOST = _db_parsed.hostname if _db_parsed else None
 DB_PORT = _db_parsed.port if _db_parsed else 5432
 DB_USER = _db_parsed.username if _db_parsed else None
 DB_PASSWORD = _db_parsed.password if _db_parsed else None
-DB_NAME = _db_parsed.path.lstrip("/") if _db_parsed else None
\ No newline at end of file
+DB_NAME = _db_parsed.path.lstrip("/") if _db_parsed else None
+# ORM 与向量检索共用的 asyncpg 连接池（经 PgBouncer 事务池连接时 DB_STATEMENT_CACHE_SIZE 需设为 0）
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# 空闲超过该秒数的连接会被关闭（0 表示不关闭）
+DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME = float(os.getenv("DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME", "300"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+# LISTEN/NOTIFY 监听使用的直连地址（LISTEN 需要会话级连接，经 PgBouncer 事务池时需指向数据库本身），默认同 DATABASE_URL
+NOTIFY_DATABASE_URL = os.getenv("NOTIFY_DATABASE_URL") or DATABASE_URL
+
+# ========== Embedding 计算配置 ==========
+# 推理后端：sentence_transformers（PyTorch）/ onnx（onnxruntime，仅 CPU，不依赖 torch）/ hash（无模型兜底）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence_transformers").strip().lower()
+# ONNX 模型目录（含 tokenizer.json 与 .onnx 文件，由 python -m app.scripts.embedding_bench export-onnx 导出）
+EMBEDDING_ONNX_MODEL_DIR = os.getenv("EMBEDDING_ONNX_MODEL_DIR", "models/all-MiniLM-L6-v2-onnx")
+# 使用的 ONNX 文件：model.onnx（fp32）/ model_quantized.onnx（int8 动态量化）
+EMBEDDING_ONNX_MODEL_FILE = os.getenv("EMBEDDING_ONNX_MODEL_FILE", "model_quantized.onnx")
+# onnxruntime 单次推理的线程数（0 表示由 onnxruntime 按 CPU 核数决定）
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+# embedding 专用线程池大小（模型推理在线程池中执行，避免阻塞事件循环）
+EMBEDDING_EXECUTOR_WORKERS = int(os.getenv("EMBEDDING_EXECUTOR_WORKERS", "2"))
+# 等待中的 embedding 请求上限，超过后直接拒绝（接口侧降级处理）
+EMBEDDING_QUEUE_MAX_SIZE = int(os.getenv("EMBEDDING_QUEUE_MAX_SIZE", "64"))
+# 动态微批：并发请求在窗口期内合并为一次 model.encode([...])
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+# 查询文本 -> 向量 LRU 缓存条数（0 表示关闭）
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+# 启动时预加载模型并做一次预热 encode（关闭后在首次请求时才加载）
+EMBEDDING_PRELOAD = os.getenv("EMBEDDING_PRELOAD", "true").lower() in ("1", "true", "yes")
+# 启动等待预热的最长时间（秒），超时后服务照常启动，模型在后台继续加载，/ready 返回未就绪
+EMBEDDING_PRELOAD_TIMEOUT_SECONDS = float(os.getenv("EMBEDDING_PRELOAD_TIMEOUT_SECONDS", "120"))
+
+# ========== Embedding Outbox 配置 ==========
+# 是否在 API 进程内启动 outbox worker（多进程部署可只在部分实例开启）
+EMBEDDING_OUTBOX_WORKER_ENABLED = os.getenv("EMBEDDING_OUTBOX_WORKER_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_OUTBOX_BATCH_SIZE = int(os.getenv("EMBEDDING_OUTBOX_BATCH_SIZE", "64"))
+EMBEDDING_OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("EMBEDDING_OUTBOX_POLL_INTERVAL_SECONDS", "2"))
+# 批量回填每批任务数（python -m app.scripts.vector_admin backfill）
+EMBEDDING_BACKFILL_BATCH_SIZE = int(os.getenv("EMBEDDING_BACKFILL_BATCH_SIZE", "256"))
+
+# ========== 向量索引配置 ==========
+# 索引类型：hnsw（推荐，空表可建、无需训练）/ ivfflat
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", "16"))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", "64"))
+# ivfflat lists，0 表示按当前行数自动推导
+VECTOR_IVFFLAT_LISTS = int(os.getenv("VECTOR_IVFFLAT_LISTS", "0"))
+# 默认检索参数（0 表示使用 pgvector 默认值），单次请求可覆盖
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", "0"))
+VECTOR_IVFFLAT_PROBES = int(os.getenv("VECTOR_IVFFLAT_PROBES", "0"))
+# 带租户过滤的 HNSW 检索使用 iterative scan（需 pgvector >= 0.8，可选 relaxed_order / strict_order，留空关闭）
+VECTOR_HNSW_ITERATIVE_SCAN = os.getenv("VECTOR_HNSW_ITERATIVE_SCAN", "")
+# 向量列存储类型：vector（float32）/ halfvec（float16，表与索引约减半，需 pgvector >= 0.7）
+# 已有表切换类型需执行 python -m app.scripts.vector_admin storage --type halfvec
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "vector").lower()
+# 索引量化：none / binary（索引按 binary_quantize 每维 1 bit，按 hamming 距离召回候选后用存储向量重排，需 pgvector >= 0.7）
+VECTOR_INDEX_QUANTIZATION = os.getenv("VECTOR_INDEX_QUANTIZATION", "none").lower()
+# binary 量化的重排候选倍数（候选数 = limit * 倍数，越大召回越高）
+VECTOR_BINARY_RERANK_FACTOR = int(os.getenv("VECTOR_BINARY_RERANK_FACTOR", "10"))
+
+# ========== 混合检索配置 ==========
+# 每路召回候选数 = limit * 该倍数（融合前）
+SIMILARITY_HYBRID_CANDIDATE_FACTOR = int(os.getenv("SIMILARITY_HYBRID_CANDIDATE_FACTOR", "4"))
+# RRF 融合常数 k（越大越平滑，名次靠后的结果权重下降越慢）
+SIMILARITY_HYBRID_RRF_K = int(os.getenv("SIMILARITY_HYBRID_RRF_K", "60"))
+# 混合检索默认延迟预算（毫秒），超时的一路召回被放弃
+SIMILARITY_HYBRID_LATENCY_BUDGET_MS = float(os.getenv("SIMILARITY_HYBRID_LATENCY_BUDGET_MS", "300"))
+# 相似检索结果缓存有效期（秒，0 关闭缓存；进程内并发的相同查询始终合并执行）
+SIMILARITY_RESULT_CACHE_TTL_SECONDS = float(os.getenv("SIMILARITY_RESULT_CACHE_TTL_SECONDS", "10"))
+# 相似检索结果缓存条数上限
+SIMILARITY_RESULT_CACHE_SIZE = int(os.getenv("SIMILARITY_RESULT_CACHE_SIZE", "512"))
+# 任务变化时经 Postgres NOTIFY 通知其他 worker 进程失效相似检索缓存（关闭时其他进程最多在 TTL 内返回旧结果）
+SIMILARITY_CACHE_NOTIFY_ENABLED = os.getenv("SIMILARITY_CACHE_NOTIFY_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# ========== 项目重复任务检测 ==========
+# 视为重复的余弦相似度阈值
+DUPLICATE_SCAN_THRESHOLD = float(os.getenv("DUPLICATE_SCAN_THRESHOLD", "0.92"))
+# 分块矩阵乘法的块大小（峰值内存约 4 * 块大小² 字节）
+DUPLICATE_SCAN_BLOCK_SIZE = int(os.getenv("DUPLICATE_SCAN_BLOCK_SIZE", "2048"))
+# 每个进程最多保留多少个项目的向量矩阵供增量刷新复用（LRU，约 1.5KB/任务），检测结果本身存数据库
+DUPLICATE_SCAN_CACHE_PROJECTS = int(os.getenv("DUPLICATE_SCAN_CACHE_PROJECTS", "4"))
+
+# ========== 任务列表分页 ==========
+# GET /tasks/、/tasks/project/{id} 未指定 limit 时的每页条数与 limit 上限（下一页游标见 X-Next-Cursor 响应头）
+TASK_LIST_DEFAULT_PAGE_SIZE = int(os.getenv("TASK_LIST_DEFAULT_PAGE_SIZE", "200"))
+TASK_LIST_MAX_PAGE_SIZE = int(os.getenv("TASK_LIST_MAX_PAGE_SIZE", "1000"))
+# GET /tasks/sync 最后一页的 watermark 至多推进到 当前时间 - 该秒数，覆盖并发事务晚于 watermark 提交的写入
+TASK_SYNC_LAG_SECONDS = float(os.getenv("TASK_SYNC_LAG_SECONDS", "5"))
+
+# ========== 权限缓存 ==========
+# 进程内缓存当前用户、用户可见项目与项目成员，有效期（秒，0 关闭缓存）
+PERMISSION_CACHE_TTL_SECONDS = float(os.getenv("PERMISSION_CACHE_TTL_SECONDS", "30"))
+# 每类缓存的条数上限
+PERMISSION_CACHE_SIZE = int(os.getenv("PERMISSION_CACHE_SIZE", "4096"))
+# 成员/项目变化时经 Postgres NOTIFY 通知其他 worker 进程失效缓存
+PERMISSION_CACHE_NOTIFY_ENABLED = os.getenv("PERMISSION_CACHE_NOTIFY_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# ========== 任务变更事件流（SSE） ==========
+# 启动时创建 task_events 表与触发器，并经 LISTEN/NOTIFY 向 /tasks/project/{id}/events 推送变更
+TASK_EVENTS_ENABLED = os.getenv("TASK_EVENTS_ENABLED", "true").lower() in ("1", "true", "yes")
+# 事件保留时长（小时）；Last-Event-ID 早于保留范围时事件流先发送 reset 事件
+TASK_EVENTS_RETENTION_HOURS = float(os.getenv("TASK_EVENTS_RETENTION_HOURS", "24"))
+# 空闲时发送心跳的间隔（秒）；无论是否有事件，每个间隔都复核一次访问权限
+TASK_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("TASK_EVENTS_HEARTBEAT_SECONDS", "15"))
+# 已提交事件被更早的未结束事务阻塞超过该秒数时告警（xmin 为全库范围，长事务会推迟所有项目的事件）
+TASK_EVENTS_DELIVERY_LAG_WARN_SECONDS = float(os.getenv("TASK_EVENTS_DELIVERY_LAG_WARN_SECONDS", "60"))
+# 每次从 task_events 读取的事件条数上限
+TASK_EVENTS_BATCH_SIZE = int(os.getenv("TASK_EVENTS_BATCH_SIZE", "200"))
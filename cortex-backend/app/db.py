@@ -1,10 +1,62 @@
+import logging
 import os
+from typing import Optional
 from urllib.parse import urlparse
+
+import asyncpg
 from dotenv import load_dotenv
+from pgvector.asyncpg import register_vector
 from tortoise import Tortoise
+from tortoise.backends.asyncpg.client import AsyncpgDBClient
+
+from app.core.config import (
+    DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME,
+    DB_POOL_MAX_SIZE,
+    DB_POOL_MIN_SIZE,
+    DB_STATEMENT_CACHE_SIZE,
+)
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+async def init_db_connection(conn):
+    """
+    连接池 init 钩子：每个物理连接只注册一次 vector 类型编解码
+
+    ORM 与向量检索共用同一个连接池，任何一次 acquire 拿到的连接都可以直接读写 vector 列。
+    """
+    try:
+        await register_vector(conn)
+    except ValueError as e:
+        # vector 扩展尚未创建时连接仍可用于非向量查询；init_pgvector() 完成后会重建连接
+        if not str(e).startswith("unknown type:"):
+            raise
+        logger.warning("pgvector 扩展不存在，连接未注册 vector 类型")
+
+
+class SharedPoolAsyncpgClient(AsyncpgDBClient):
+    """记录 Tortoise 建立的 asyncpg 连接池，向量检索、outbox 等直接使用 asyncpg 的模块与 ORM 共用"""
+
+    async def create_pool(self, **kwargs) -> asyncpg.Pool:
+        global _shared_pool
+        _shared_pool = await super().create_pool(**kwargs)
+        return _shared_pool
+
+
+# Tortoise 按 engine 模块的 client_class 创建连接
+client_class = SharedPoolAsyncpgClient
+_shared_pool: Optional[asyncpg.Pool] = None
+
+
+def get_shared_db_pool() -> Optional[asyncpg.Pool]:
+    """ORM 已建立的连接池（尚未建立或已关闭时返回 None）"""
+    if _shared_pool is None or _shared_pool.is_closing():
+        return None
+    return _shared_pool
+
+
 def get_db_config():
     """从 .env 读取数据库配置"""
     database_url = os.getenv("DATABASE_URL")
@@ -20,12 +72,18 @@ def get_db_config():
         "user": parsed.username,
         "password": parsed.password,
         "database": parsed.path.lstrip("/"),
+        # ORM 与向量检索共用的 asyncpg 连接池
+        "minsize": DB_POOL_MIN_SIZE,
+        "maxsize": DB_POOL_MAX_SIZE,
+        "max_inactive_connection_lifetime": DB_POOL_MAX_INACTIVE_CONNECTION_LIFETIME,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "init": init_db_connection,
     }
 
     return {
         "connections": {
             "default": {
-                "engine": "tortoise.backends.asyncpg",
+                "engine": "app.db",
                 "credentials": credentials,
             },
         },
@@ -1,16 +1,109 @@
-from fastapi import FastAPI, Request
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
 from app.api.v1.api import api_router
 from tortoise.contrib.fastapi import register_tortoise
 
-from app.core.config import DATABASE_URL
+from app.core.config import (
+    EMBEDDING_OUTBOX_WORKER_ENABLED,
+    EMBEDDING_PRELOAD,
+    EMBEDDING_PRELOAD_TIMEOUT_SECONDS,
+    PERMISSION_CACHE_NOTIFY_ENABLED,
+    SIMILARITY_CACHE_NOTIFY_ENABLED,
+    TASK_EVENTS_ENABLED,
+)
+from app.db import TORTOISE_ORM
+from app.services.embedding_outbox import start_embedding_outbox_worker, stop_embedding_outbox_worker
+from app.services.notifications import (
+    get_notification_listener_stats,
+    start_notification_listener,
+    stop_notification_listener,
+)
+from app.services.permission_cache import get_permission_cache_metrics, register_permission_cache_listener
+from app.services.task_events import (
+    get_task_events_stats,
+    init_task_events,
+    register_task_events_listener,
+    start_task_events_lag_monitor,
+    start_task_events_pruner,
+    stop_task_events_lag_monitor,
+    stop_task_events_pruner,
+)
+from app.services.vector_store import (
+    adopt_legacy_embeddings,
+    get_db_pool_stats,
+    get_embedding_model_status,
+    init_pgvector,
+    register_similarity_cache_listener,
+    shutdown_embedding_executor,
+    warm_up_embedding_model,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _adopt_legacy_embeddings():
+    try:
+        await adopt_legacy_embeddings()
+    except Exception as e:
+        # 未处理的 legacy 向量保持原状，检索继续按 hybrid 兜底，下次启动再处理
+        logger.warning("legacy 向量处理失败: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await init_pgvector()
+    except Exception as e:
+        # 向量检索不可用时不阻塞主业务启动，相似度接口会自行降级
+        logger.warning("pgvector 初始化失败: %s", e)
+    if EMBEDDING_PRELOAD:
+        # 模型加载与预热完成后才开始接收请求，避免部署后首个请求承担数秒的加载耗时；
+        # 超时则照常启动，预热在后台继续，期间 /ready 返回 503
+        warm_up = asyncio.ensure_future(warm_up_embedding_model())
+        _, pending = await asyncio.wait({warm_up}, timeout=EMBEDDING_PRELOAD_TIMEOUT_SECONDS)
+        if pending:
+            logger.warning("embedding 模型预热超过 %.0fs，转为后台继续加载", EMBEDDING_PRELOAD_TIMEOUT_SECONDS)
+    # legacy 向量需要用实际加载的模型核对来源，放到后台执行，不阻塞启动
+    legacy_adoption = asyncio.ensure_future(_adopt_legacy_embeddings())
+    if EMBEDDING_OUTBOX_WORKER_ENABLED:
+        start_embedding_outbox_worker()
+    if PERMISSION_CACHE_NOTIFY_ENABLED:
+        # 其他 worker 进程修改成员/项目后经 NOTIFY 失效本进程的权限缓存
+        register_permission_cache_listener()
+    if SIMILARITY_CACHE_NOTIFY_ENABLED:
+        # 其他 worker 进程写入任务/向量后经 NOTIFY 失效本进程的相似检索缓存
+        register_similarity_cache_listener()
+    if TASK_EVENTS_ENABLED:
+        try:
+            await init_task_events()
+        except Exception as e:
+            logger.warning("任务事件表/触发器初始化失败: %s", e)
+        # 触发器经 NOTIFY 唤醒本进程订阅对应项目的 SSE 事件流
+        register_task_events_listener()
+        start_task_events_pruner()
+        start_task_events_lag_monitor()
+    if PERMISSION_CACHE_NOTIFY_ENABLED or SIMILARITY_CACHE_NOTIFY_ENABLED or TASK_EVENTS_ENABLED:
+        start_notification_listener()
+    yield
+    # 关闭后台资源（通知监听、事件清理、outbox worker、embedding 推理线程池）；共用的连接池随 Tortoise 关闭
+    legacy_adoption.cancel()
+    await stop_notification_listener()
+    await stop_task_events_pruner()
+    await stop_task_events_lag_monitor()
+    await stop_embedding_outbox_worker()
+    shutdown_embedding_executor(wait=False)
+
 
 app = FastAPI(title="Cortex Project Manager",
-              openapi_url="/api/v1/openapi.json"
+              openapi_url="/api/v1/openapi.json",
+              lifespan=lifespan,
 )
 register_tortoise(
     app,
-    db_url=DATABASE_URL,
-    modules={"models": ["app.models"]}, # 指向模型所在位置
+    config=TORTOISE_ORM, # ORM 与向量检索共用同一个连接池（见 app/db.py）
     generate_schemas=True, # 开发阶段设为 True，重启服务自动建表！(类似 Base.metadata.create_all)
     add_exception_handlers=True,
 )
@@ -18,4 +111,26 @@ register_tortoise(
 def get_root():
     return {"message": "Cortex API is running!"}
 
-app.include_router(api_router, prefix="/api/v1")
\ No newline at end of file
+
+@app.get("/health")
+def health_check():
+    """服务健康检查（附带共用数据库连接池、权限缓存、通知监听与任务事件流的状态）"""
+    return {
+        "status": "ok",
+        "db_pool": get_db_pool_stats(),
+        "permission_cache": get_permission_cache_metrics(),
+        "notifications": get_notification_listener_stats(),
+        "task_events": get_task_events_stats(),
+    }
+
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    """就绪检查：embedding 模型加载并预热完成前返回 503（供负载均衡/编排探针使用）"""
+    embedding_model = get_embedding_model_status()
+    if not embedding_model["ready"]:
+        response.status_code = 503
+    return {"status": "ready" if embedding_model["ready"] else "starting", "embedding_model": embedding_model}
+
+
+app.include_router(api_router, prefix="/api/v1")
@@ -3,5 +3,17 @@ from .project import Project
 from .user import User
 from .task import Task, TaskComment, TaskCollaborator
 from .project_member import ProjectMember
+from .embedding_outbox import TaskEmbeddingOutbox
+from .duplicate_scan import ProjectDuplicateScan
 
-__all__ = ["Organization", "Project", "User", "Task", "TaskComment", "TaskCollaborator", "ProjectMember"]
+__all__ = [
+    "Organization",
+    "Project",
+    "User",
+    "Task",
+    "TaskComment",
+    "TaskCollaborator",
+    "ProjectMember",
+    "TaskEmbeddingOutbox",
+    "ProjectDuplicateScan",
+]
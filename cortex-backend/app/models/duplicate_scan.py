@@ -0,0 +1,27 @@
+from tortoise import fields, models
+
+
+class ProjectDuplicateScan(models.Model):
+    """
+    项目重复任务检测结果（各 worker 进程共享）
+
+    pairs 保存超过阈值的任务对 [a, b, 相似度]，增量刷新据此只重算变化的任务；
+    running_since 作为扫描租约，同一项目同一时间只有一个进程在扫描，超时视为扫描进程已退出。
+    """
+    # 主键即项目 ID（迁移中引用 projects，项目删除时级联删除），不使用自增序列
+    project_id = fields.IntField(pk=True, generated=False)
+    threshold = fields.FloatField(null=True)
+    model_id = fields.CharField(max_length=128, null=True)
+    task_count = fields.IntField(default=0)
+    pairs = fields.JSONField(default=list)
+    clusters = fields.JSONField(default=list)
+    # 增量水位：与 task_embeddings.updated_at 一致按 UTC 比较
+    watermark = fields.DatetimeField(null=True)
+    computed_at = fields.DatetimeField(null=True)
+    refresh_mode = fields.CharField(max_length=16, null=True)
+    changed_tasks = fields.IntField(default=0)
+    duration_seconds = fields.FloatField(default=0)
+    running_since = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "project_duplicate_scans"
@@ -0,0 +1,24 @@
+from tortoise import fields, models
+
+
+class TaskEmbeddingOutbox(models.Model):
+    """
+    任务 embedding 同步 outbox
+
+    与任务变更写在同一事务里，只记录"哪个任务需要同步向量"；
+    后台 worker 按任务当前状态批量 encode 并写入 task_embeddings（已软删除则删除向量）。
+    """
+    id = fields.BigIntField(pk=True)
+    task = fields.ForeignKeyField(
+        "models.Task",
+        related_name="embedding_outbox_entries",
+    )
+    attempts = fields.IntField(default=0)
+    last_error = fields.TextField(null=True)
+    # 失败重试时后移，worker 只处理已到期的记录
+    available_at = fields.DatetimeField(auto_now_add=True, index=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "task_embedding_outbox"
+        ordering = ["id"]
@@ -1,16 +1,47 @@
 """
 相似度检索 API Schema
 """
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, model_validator
+from typing import Annotated, List, Literal, Optional
 
 
 class SimilaritySearchRequest(BaseModel):
     """相似度搜索请求"""
     text: str = Field(..., description="查询文本（任务标题或描述）", min_length=1, max_length=1000)
     exclude_task_id: Optional[int] = Field(None, description="排除的任务 ID（创建新任务时传入）")
+    project_id: Optional[int] = Field(None, description="限定检索的项目 ID（默认检索当前用户可见的全部项目）")
+    organization_id: Optional[int] = Field(None, description="限定检索的组织 ID")
     limit: int = Field(default=5, ge=1, le=20, description="返回结果数量")
     threshold: float = Field(default=0.5, ge=0.0, le=1.0, description="相似度阈值")
+    ef_search: Optional[int] = Field(None, ge=1, le=1000, description="HNSW 检索候选数（召回/延迟权衡）")
+    probes: Optional[int] = Field(None, ge=1, le=1000, description="ivfflat 检索探测 list 数")
+    mode: Literal["vector", "lexical", "hybrid"] = Field(
+        default="vector",
+        description="检索方式：vector 向量 / lexical 文本（pg_trgm）/ hybrid 两路并发召回后融合",
+    )
+    latency_budget_ms: Optional[int] = Field(None, ge=10, le=5000, description="hybrid 模式的延迟预算（毫秒）")
+
+
+class SimilarityBatchSearchRequest(BaseModel):
+    """批量相似度搜索请求"""
+    texts: List[Annotated[str, Field(min_length=1, max_length=1000)]] = Field(
+        ..., min_length=1, max_length=100, description="查询文本列表"
+    )
+    exclude_task_ids: Optional[List[Optional[int]]] = Field(
+        None, description="与 texts 一一对应的排除任务 ID（查重已有任务时排除自身）"
+    )
+    project_id: Optional[int] = Field(None, description="限定检索的项目 ID（默认检索当前用户可见的全部项目）")
+    organization_id: Optional[int] = Field(None, description="限定检索的组织 ID")
+    limit: int = Field(default=5, ge=1, le=20, description="每条查询返回结果数量")
+    threshold: float = Field(default=0.5, ge=0.0, le=1.0, description="相似度阈值")
+    ef_search: Optional[int] = Field(None, ge=1, le=1000, description="HNSW 检索候选数（召回/延迟权衡）")
+    probes: Optional[int] = Field(None, ge=1, le=1000, description="ivfflat 检索探测 list 数")
+
+    @model_validator(mode="after")
+    def validate_exclude_task_ids(self):
+        if self.exclude_task_ids is not None and len(self.exclude_task_ids) != len(self.texts):
+            raise ValueError("exclude_task_ids must have the same length as texts")
+        return self
 
 
 class SimilarTaskItem(BaseModel):
@@ -33,3 +64,39 @@ class SimilaritySearchResponse(BaseModel):
     results: List[SimilarTaskItem]
     total: int
     message: Optional[str] = None
+
+
+class SimilarityBatchResultItem(BaseModel):
+    """批量搜索中单条查询的结果"""
+    index: int = Field(..., description="对应请求 texts 中的下标")
+    query: str
+    results: List[SimilarTaskItem]
+    total: int
+
+
+class SimilarityBatchSearchResponse(BaseModel):
+    """批量相似度搜索响应"""
+    success: bool
+    results: List[SimilarityBatchResultItem]
+    total: int
+    message: Optional[str] = None
+
+
+class DuplicateCluster(BaseModel):
+    """一组互为近似重复的任务"""
+    task_ids: List[int]
+    size: int
+    max_similarity: float
+
+
+class ProjectDuplicatesResponse(BaseModel):
+    """项目重复任务检测结果"""
+    project_id: int
+    status: Literal["not_scanned", "scheduled", "running", "ready"]
+    threshold: Optional[float] = None
+    task_count: int = 0
+    clusters: List[DuplicateCluster] = []
+    computed_at: Optional[str] = None
+    refresh_mode: Optional[str] = None
+    changed_tasks: int = 0
+    duration_seconds: float = 0.0
@@ -2,6 +2,8 @@ from datetime import datetime, date
 from typing import Optional, List
 from pydantic import BaseModel, Field
 
+from app.core.config import TASK_LIST_MAX_PAGE_SIZE
+
 
 def datetime_utc_now():
     """返回当前 UTC 时间"""
@@ -49,6 +51,26 @@ class TaskRead(TaskBase):
         from_attributes = True
 
 
+# 任务列表查询参数（游标分页 + 服务端过滤，status/type/priority 可重复传多个值）
+class TaskListQuery(BaseModel):
+    limit: Optional[int] = Field(None, ge=1, le=TASK_LIST_MAX_PAGE_SIZE)
+    cursor: Optional[str] = None
+    status: Optional[List[str]] = None
+    type: Optional[List[str]] = None
+    priority: Optional[List[str]] = None
+    assignee_id: Optional[int] = None
+    deadline_from: Optional[date] = None
+    deadline_to: Optional[date] = None
+    updated_since: Optional[datetime] = None
+
+
+# 任务增量同步结果：tasks 含已软删除的墓碑记录（deleted_at 非空），has_more 为 true 时用 watermark 继续拉取
+class TaskSyncResponse(BaseModel):
+    tasks: List[TaskRead]
+    watermark: str
+    has_more: bool
+
+
 class TaskCommentAuthor(BaseModel):
     id: int
     username: str
@@ -0,0 +1,180 @@
+"""
+embedding 后端导出与基准测试
+
+用法：
+    python -m app.scripts.embedding_bench export-onnx --output-dir models/all-MiniLM-L6-v2-onnx
+    python -m app.scripts.embedding_bench compare -b sentence_transformers -b onnx:model.onnx -b onnx:model_quantized.onnx
+
+compare 为每个后端单独启动一个子进程运行 run 命令，避免不同后端的导入与模型加载互相影响内存统计；
+结果包含模型加载耗时、单条延迟（p50/p95）、批量吞吐、进程峰值 RSS，
+以及与第一个后端输出向量的最小余弦相似度（一致性）。
+"""
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import typer
+
+from app.core.config import EMBEDDING_ONNX_MODEL_DIR
+from app.services import vector_store
+
+app = typer.Typer(help="Cortex embedding 后端导出与基准测试")
+
+_HF_MODEL_NAME = f"sentence-transformers/{vector_store._EMBEDDING_MODEL_NAME}"
+
+_SAMPLE_TEXTS = [
+    "修复登录接口在 token 过期后返回 500 的问题",
+    "Fix OAuth callback redirect loop on Safari",
+    "任务看板拖拽排序后刷新页面顺序丢失\n复现：拖动任意卡片到其他列后刷新",
+    "优化项目列表查询，按组织过滤时走索引",
+    "Add retry with exponential backoff to the webhook dispatcher when the upstream returns 429 or 503",
+    "导出周报时附件超过 10MB 上传失败",
+    "CLI: ctx task sync should skip archived projects",
+    "评论区支持 @ 成员并发送通知",
+]
+
+
+def _peak_rss_mb() -> float:
+    # Linux 下 ru_maxrss 单位为 KB
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+@app.command("export-onnx")
+def export_onnx_command(
+    output_dir: Path = typer.Option(Path(EMBEDDING_ONNX_MODEL_DIR), "--output-dir", "-o", help="导出目录"),
+    quantize: bool = typer.Option(True, "--quantize/--no-quantize", help="同时生成 int8 动态量化模型"),
+    opset: int = typer.Option(14, "--opset", help="ONNX opset 版本"),
+):
+    """把 sentence-transformers 模型导出为 ONNX（需 torch / transformers / onnxruntime）"""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(_HF_MODEL_NAME)
+    model = AutoModel.from_pretrained(_HF_MODEL_NAME).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["warm up"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = output_dir / "model.onnx"
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            str(fp32_path),
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+    typer.echo(f"已导出 {fp32_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = output_dir / "model_quantized.onnx"
+        quantize_dynamic(str(fp32_path), str(quantized_path), weight_type=QuantType.QInt8)
+        typer.echo(f"已导出 {quantized_path}")
+
+
+@app.command("run")
+def run_command(
+    backend: str = typer.Option(..., "--backend", help="sentence_transformers / onnx"),
+    onnx_file: Optional[str] = typer.Option(None, "--onnx-file", help="onnx 后端使用的模型文件（默认读取配置）"),
+    iterations: int = typer.Option(50, "--iterations", min=1, help="单条延迟测量次数"),
+    batch_size: int = typer.Option(32, "--batch-size", min=1, help="吞吐测量的批大小"),
+    batches: int = typer.Option(10, "--batches", min=1, help="吞吐测量的批次数"),
+):
+    """在当前进程测量单个后端（由 compare 在子进程中调用），输出 JSON"""
+    vector_store._EMBEDDING_BACKEND = backend
+    if onnx_file:
+        vector_store.EMBEDDING_ONNX_MODEL_FILE = onnx_file
+    rss_before = _peak_rss_mb()
+
+    started = time.perf_counter()
+    model = vector_store.get_embedding_model()
+    if model is None:
+        typer.echo(json.dumps({"backend": backend, "error": "模型加载失败（已回退到 hash）"}, ensure_ascii=False))
+        raise typer.Exit(1)
+    load_seconds = time.perf_counter() - started
+    model.encode(["warm up"], normalize_embeddings=True)
+
+    latencies = []
+    for idx in range(iterations):
+        started = time.perf_counter()
+        model.encode([_SAMPLE_TEXTS[idx % len(_SAMPLE_TEXTS)]], normalize_embeddings=True)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    batch = [_SAMPLE_TEXTS[idx % len(_SAMPLE_TEXTS)] for idx in range(batch_size)]
+    started = time.perf_counter()
+    for _ in range(batches):
+        model.encode(batch, normalize_embeddings=True)
+    throughput = batch_size * batches / (time.perf_counter() - started)
+
+    embeddings = np.asarray(model.encode(_SAMPLE_TEXTS, normalize_embeddings=True), dtype=np.float32)
+    typer.echo(json.dumps({
+        "backend": backend if not onnx_file else f"{backend}:{onnx_file}",
+        "model_id": vector_store.get_embedding_model_id(),
+        "load_seconds": round(load_seconds, 3),
+        "latency_p50_ms": round(statistics.median(latencies), 2),
+        "latency_p95_ms": round(_percentile(latencies, 95), 2),
+        "throughput_texts_per_second": round(throughput, 1),
+        "rss_before_load_mb": rss_before,
+        "peak_rss_mb": _peak_rss_mb(),
+        "embeddings": embeddings.tolist(),
+    }, ensure_ascii=False))
+
+
+@app.command("compare")
+def compare_command(
+    backends: List[str] = typer.Option(
+        ["sentence_transformers", "onnx"], "--backend", "-b", help="后端，onnx 可写作 onnx:<模型文件>；第一个作为一致性基准"
+    ),
+    iterations: int = typer.Option(50, "--iterations", min=1, help="单条延迟测量次数"),
+    batch_size: int = typer.Option(32, "--batch-size", min=1, help="吞吐测量的批大小"),
+    batches: int = typer.Option(10, "--batches", min=1, help="吞吐测量的批次数"),
+):
+    """逐个后端在独立子进程中测量并汇总对比"""
+    results = []
+    for spec in backends:
+        backend, _, onnx_file = spec.partition(":")
+        command = [
+            sys.executable, "-m", "app.scripts.embedding_bench", "run",
+            "--backend", backend,
+            "--iterations", str(iterations),
+            "--batch-size", str(batch_size),
+            "--batches", str(batches),
+        ]
+        if onnx_file:
+            command += ["--onnx-file", onnx_file]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            typer.echo(f"{spec} 测量失败: {completed.stdout.strip() or completed.stderr.strip()[-500:]}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    if not results:
+        raise typer.Exit(1)
+
+    baseline = np.asarray(results[0]["embeddings"], dtype=np.float32)
+    for result in results:
+        embeddings = np.asarray(result.pop("embeddings"), dtype=np.float32)
+        result["min_cosine_vs_baseline"] = round(float(np.min(np.sum(baseline * embeddings, axis=1))), 5)
+    typer.echo(json.dumps(results, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,180 @@
+"""
+向量检索运维命令（直连后端数据库执行）
+
+用法：
+    python -m app.scripts.vector_admin index-info
+    python -m app.scripts.vector_admin rebuild-index --type hnsw --quantization binary
+    python -m app.scripts.vector_admin storage --type halfvec
+    python -m app.scripts.vector_admin backfill --checkpoint backfill.json
+    python -m app.scripts.vector_admin versions
+    python -m app.scripts.vector_admin purge-versions
+    python -m app.scripts.vector_admin duplicates --project-id 3
+"""
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+from app.core.config import DUPLICATE_SCAN_BLOCK_SIZE, DUPLICATE_SCAN_THRESHOLD, EMBEDDING_BACKFILL_BATCH_SIZE
+from app.services.duplicate_detection import refresh_project_duplicates
+from app.services.embedding_backfill import (
+    BackfillProgress,
+    backfill_task_embeddings,
+    get_embedding_version_stats,
+    purge_embedding_versions,
+)
+from app.services.vector_store import (
+    close_db_pool,
+    VECTOR_INDEX_QUANTIZATIONS,
+    VECTOR_STORAGE_TYPES,
+    get_vector_index_info,
+    init_pgvector,
+    migrate_vector_storage,
+    rebuild_vector_index,
+)
+
+app = typer.Typer(help="Cortex 向量检索运维命令")
+
+
+def _run(coro):
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await close_db_pool()
+
+    return asyncio.run(runner())
+
+
+def _echo_json(payload: dict):
+    typer.echo(json.dumps(payload, ensure_ascii=False, indent=2, default=str))
+
+
+@app.command("init")
+def init_command():
+    """初始化 task_embeddings 表与向量索引"""
+    _run(init_pgvector())
+    typer.echo("pgvector 初始化完成")
+
+
+@app.command("index-info")
+def index_info_command():
+    """查看向量索引定义、大小与表行数"""
+    _echo_json(_run(get_vector_index_info()))
+
+
+@app.command("rebuild-index")
+def rebuild_index_command(
+    index_type: Optional[str] = typer.Option(None, "--type", "-t", help="索引类型：hnsw / ivfflat（默认读取配置）"),
+    concurrently: bool = typer.Option(True, "--concurrently/--blocking", help="是否在线重建（不阻塞读写）"),
+    quantization: Optional[str] = typer.Option(
+        None, "--quantization", "-q", help="索引量化：none / binary（默认读取配置，需与 VECTOR_INDEX_QUANTIZATION 一致）"
+    ),
+):
+    """重建向量索引（切换类型、调整参数或按当前行数重新训练 ivfflat）"""
+    if index_type and index_type not in ("hnsw", "ivfflat"):
+        typer.echo(f"不支持的索引类型: {index_type}")
+        raise typer.Exit(1)
+    if quantization and quantization not in VECTOR_INDEX_QUANTIZATIONS:
+        typer.echo(f"不支持的索引量化方式: {quantization}")
+        raise typer.Exit(1)
+    _echo_json(_run(rebuild_vector_index(index_type=index_type, concurrently=concurrently, quantization=quantization)))
+
+
+@app.command("storage")
+def storage_command(
+    storage: Optional[str] = typer.Option(None, "--type", "-t", help="向量列存储类型：vector / halfvec（默认读取配置）"),
+):
+    """切换向量列存储类型并重建索引（重写整表，期间阻塞向量读写）"""
+    if storage and storage not in VECTOR_STORAGE_TYPES:
+        typer.echo(f"不支持的存储类型: {storage}")
+        raise typer.Exit(1)
+    _echo_json(_run(migrate_vector_storage(storage)))
+
+
+def _load_checkpoint(path: Path) -> int:
+    if not path.exists():
+        return 0
+    return int(json.loads(path.read_text(encoding="utf-8")).get("last_task_id", 0))
+
+
+def _save_checkpoint(path: Path, progress: BackfillProgress):
+    # 先写临时文件再替换，避免中断时留下半截断点文件
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(progress.to_dict(), ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+@app.command("backfill")
+def backfill_command(
+    batch_size: int = typer.Option(EMBEDDING_BACKFILL_BATCH_SIZE, "--batch-size", "-b", min=1, help="每批任务数"),
+    checkpoint: Optional[Path] = typer.Option(None, "--checkpoint", "-c", help="断点文件：存在时从记录的任务 ID 继续，每批提交后更新"),
+    start_after_id: Optional[int] = typer.Option(None, "--start-after-id", help="从该任务 ID 之后开始（优先于断点文件）"),
+    force: bool = typer.Option(False, "--force", help="忽略内容哈希全部重新生成（模型标识不变但更换了模型文件时使用）"),
+    limit: Optional[int] = typer.Option(None, "--limit", min=1, help="最多处理的任务数"),
+):
+    """流式回填 / 重建 task_embeddings"""
+    if start_after_id is None:
+        start_after_id = _load_checkpoint(checkpoint) if checkpoint else 0
+
+    def report(progress: BackfillProgress):
+        if checkpoint:
+            _save_checkpoint(checkpoint, progress)
+        stats = progress.to_dict()
+        typer.echo(
+            f"[batch {stats['batches']}] last_task_id={stats['last_task_id']} "
+            f"scanned={stats['scanned']} encoded={stats['encoded']} skipped={stats['skipped']} stale={stats['stale']} "
+            f"{stats['tasks_per_second']} tasks/s"
+        )
+
+    progress = _run(backfill_task_embeddings(
+        batch_size=batch_size,
+        start_after_id=start_after_id,
+        force=force,
+        limit=limit,
+        on_progress=report,
+    ))
+    _echo_json(progress.to_dict())
+
+
+@app.command("versions")
+def versions_command():
+    """查看各模型版本的向量数与对未删除任务的覆盖率"""
+    _echo_json(_run(get_embedding_version_stats()))
+
+
+@app.command("purge-versions")
+def purge_versions_command(
+    keep: Optional[str] = typer.Option(None, "--keep", help="保留的模型标识（默认当前配置的模型）"),
+    force: bool = typer.Option(False, "--force", help="保留版本覆盖不完整时仍然清理"),
+):
+    """切换完成后清理其他模型版本的向量"""
+
+    async def purge():
+        stats = await get_embedding_version_stats()
+        keep_model_id = keep or stats["active_model_id"]
+        kept = next((v for v in stats["versions"] if v["model_id"] == keep_model_id), None)
+        covered = kept["covered"] if kept else 0
+        if covered < stats["live_tasks"] and not force:
+            typer.echo(f"{keep_model_id} 只覆盖 {covered}/{stats['live_tasks']} 个任务，先完成回填或使用 --force")
+            raise typer.Exit(1)
+        return await purge_embedding_versions(keep_model_id)
+
+    typer.echo(f"已删除 {_run(purge())} 条其他版本的向量")
+
+
+@app.command("duplicates")
+def duplicates_command(
+    project_id: int = typer.Option(..., "--project-id", "-p", help="项目 ID"),
+    threshold: float = typer.Option(DUPLICATE_SCAN_THRESHOLD, "--threshold", min=0.5, max=1.0, help="视为重复的相似度阈值"),
+    block_size: int = typer.Option(DUPLICATE_SCAN_BLOCK_SIZE, "--block-size", min=1, help="分块矩阵乘法的块大小"),
+):
+    """检测项目内的近似重复任务并输出重复簇"""
+    _echo_json(_run(refresh_project_duplicates(project_id, threshold=threshold, block_size=block_size, full=True)))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,406 @@
+"""
+项目内近似重复任务检测
+
+把项目内全部任务向量载入 NumPy 矩阵，按块计算余弦相似度（内存占用只与块大小有关，
+与任务数无关），超过阈值的任务对用并查集合并为重复簇。
+
+检测结果（重复任务对、簇与增量水位）存 project_duplicate_scans 表，所有 worker 进程读到同一份结果；
+再次扫描时只重新计算向量有变化（updated_at 晚于上次水位）或新增的任务与全体任务的相似度，
+已删除/移出项目的任务直接剔除。扫描以表中 running_since 作为租约，同一项目同一时间只有一个进程在扫描。
+
+向量矩阵只在进程内按 LRU 保留最近 DUPLICATE_SCAN_CACHE_PROJECTS 个项目（且仅当水位与表中一致时复用），
+其余情况增量刷新前从数据库重新载入向量。
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.core.config import DUPLICATE_SCAN_BLOCK_SIZE, DUPLICATE_SCAN_CACHE_PROJECTS, DUPLICATE_SCAN_THRESHOLD
+from app.services.vector_store import get_db_pool, get_embedding_model_id
+
+logger = logging.getLogger(__name__)
+
+_WATERMARK_SKEW_SECONDS = 5
+# 扫描租约：超过该时长仍未完成视为扫描进程已退出，允许其他进程重新扫描
+_SCAN_LEASE_SECONDS = 600
+
+# 项目 ID -> 最近一次扫描后的向量矩阵（进程内工作集，按 LRU 淘汰）
+_working_sets: "OrderedDict[int, _ProjectDuplicateState]" = OrderedDict()
+# 本进程已安排、尚未执行的增量刷新，避免 outbox 连续同步时重复排队
+_scheduled_refreshes: Set[int] = set()
+
+_CLAIM_SCAN_SQL = """
+    INSERT INTO project_duplicate_scans (project_id, pairs, clusters, running_since)
+    VALUES ($1, '[]', '[]', NOW())
+    ON CONFLICT (project_id) DO UPDATE SET running_since = NOW()
+    WHERE project_duplicate_scans.running_since IS NULL
+        OR project_duplicate_scans.running_since < NOW() - make_interval(secs => $2)
+    RETURNING threshold, model_id, pairs::text AS pairs, watermark AT TIME ZONE 'UTC' AS watermark
+"""
+
+_SAVE_SCAN_SQL = """
+    UPDATE project_duplicate_scans SET
+        threshold = $2,
+        model_id = $3,
+        task_count = $4,
+        pairs = $5::jsonb,
+        clusters = $6::jsonb,
+        watermark = $7::timestamp AT TIME ZONE 'UTC',
+        computed_at = NOW(),
+        refresh_mode = $8,
+        changed_tasks = $9,
+        duration_seconds = $10,
+        running_since = NULL
+    WHERE project_id = $1
+"""
+
+
+class _ProjectDuplicateState:
+    """单个项目一次扫描的工作状态：向量矩阵、超过阈值的任务对与增量水位"""
+
+    def __init__(self, threshold: float, model_id: str):
+        self.threshold = threshold
+        self.model_id = model_id
+        self.task_ids: List[int] = []
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+        self.pairs: Dict[Tuple[int, int], float] = {}
+        self.watermark: Optional[datetime] = None
+        self.last_changed = 0
+
+
+def _to_float_vector(value) -> np.ndarray:
+    # pgvector 不同版本的解码结果为 numpy 数组或 Vector 对象
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _find_similar_pairs(
+    query: np.ndarray,
+    matrix: np.ndarray,
+    threshold: float,
+    block_size: int,
+    upper_triangle: bool = False,
+) -> List[Tuple[int, int, float]]:
+    """
+    分块计算 query 与 matrix 的余弦相似度（输入已归一化），返回超过阈值的 (行, 列, 相似度)
+
+    每次只计算 block_size x block_size 的子矩阵，峰值内存约 4 * block_size² 字节。
+    upper_triangle=True 时 query 与 matrix 为同一矩阵，只保留 行 < 列 的任务对。
+    """
+    pairs: List[Tuple[int, int, float]] = []
+    block_size = max(1, block_size)
+    for row_start in range(0, query.shape[0], block_size):
+        row_block = query[row_start:row_start + block_size]
+        col_begin = row_start if upper_triangle else 0
+        for col_start in range(col_begin, matrix.shape[0], block_size):
+            sims = row_block @ matrix[col_start:col_start + block_size].T
+            rows, cols = np.nonzero(sims >= threshold)
+            for row, col in zip(rows.tolist(), cols.tolist()):
+                i, j = row_start + row, col_start + col
+                if upper_triangle and i >= j:
+                    continue
+                pairs.append((i, j, float(sims[row, col])))
+    return pairs
+
+
+def _build_clusters(task_ids: List[int], pairs: Dict[Tuple[int, int], float]) -> List[dict]:
+    """并查集把重复任务对合并为簇，簇内按任务 ID 排序，簇按规模与最高相似度降序"""
+    parent: Dict[int, int] = {}
+
+    def find(task_id: int) -> int:
+        parent.setdefault(task_id, task_id)
+        while parent[task_id] != task_id:
+            parent[task_id] = parent[parent[task_id]]
+            task_id = parent[task_id]
+        return task_id
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    members: Dict[int, List[int]] = {}
+    max_similarity: Dict[int, float] = {}
+    for task_id in parent:
+        members.setdefault(find(task_id), []).append(task_id)
+    for (a, _), similarity in pairs.items():
+        root = find(a)
+        max_similarity[root] = max(max_similarity.get(root, 0.0), similarity)
+
+    clusters = [
+        {
+            "task_ids": sorted(ids),
+            "size": len(ids),
+            "max_similarity": round(max_similarity[root], 3),
+        }
+        for root, ids in members.items()
+    ]
+    clusters.sort(key=lambda cluster: (-cluster["size"], -cluster["max_similarity"], cluster["task_ids"][0]))
+    return clusters
+
+
+async def _fetch_project_embeddings(conn, project_id: int, since: Optional[datetime] = None):
+    """项目内未删除任务当前模型版本的向量；since 不为空时只取该时间之后更新的向量"""
+    since_sql = "AND te.updated_at >= $3" if since is not None else ""
+    args = [project_id, get_embedding_model_id()] + ([since] if since is not None else [])
+    return await conn.fetch(f"""
+        SELECT te.task_id, te.embedding, te.updated_at
+        FROM task_embeddings te
+        JOIN tasks t ON t.id = te.task_id
+        WHERE te.project_id = $1
+            AND te.model_id = $2
+            AND t.deleted_at IS NULL
+            AND te.embedding IS NOT NULL
+            {since_sql}
+        ORDER BY te.task_id
+    """, *args)
+
+
+def _rows_matrix(rows) -> np.ndarray:
+    if not rows:
+        return np.zeros((0, 0), dtype=np.float32)
+    return _normalize_rows(np.vstack([_to_float_vector(row["embedding"]) for row in rows]))
+
+
+def _full_scan(state: _ProjectDuplicateState, rows, block_size: int):
+    state.task_ids = [row["task_id"] for row in rows]
+    state.matrix = _rows_matrix(rows)
+    state.pairs = {
+        (state.task_ids[i], state.task_ids[j]): similarity
+        for i, j, similarity in _find_similar_pairs(
+            state.matrix, state.matrix, state.threshold, block_size, upper_triangle=True
+        )
+    }
+    state.last_changed = len(rows)
+
+
+def _incremental_scan(state: _ProjectDuplicateState, live_ids: List[int], changed_rows, block_size: int):
+    """剔除已删除任务、替换变化任务的向量，只为变化任务重新计算与全体任务的相似度"""
+    changed = {row["task_id"]: _to_float_vector(row["embedding"]) for row in changed_rows}
+    live = set(live_ids)
+    stale = (set(state.task_ids) - live) | set(changed)
+    state.pairs = {pair: sim for pair, sim in state.pairs.items() if pair[0] not in stale and pair[1] not in stale}
+
+    kept = [idx for idx, task_id in enumerate(state.task_ids) if task_id in live and task_id not in changed]
+    task_ids = [state.task_ids[idx] for idx in kept]
+    blocks = [state.matrix[kept]] if kept else []
+    if changed:
+        task_ids.extend(changed)
+        blocks.append(_normalize_rows(np.vstack(list(changed.values()))))
+    state.task_ids = task_ids
+    state.matrix = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+    state.last_changed = len(changed)
+
+    if not changed:
+        return
+    changed_start = len(kept)
+    query = state.matrix[changed_start:]
+    for row, col, similarity in _find_similar_pairs(query, state.matrix, state.threshold, block_size):
+        i = changed_start + row
+        if i == col or (col >= changed_start and col < i):
+            # 自身，或变化任务之间已由另一侧记录
+            continue
+        a, b = sorted((state.task_ids[i], state.task_ids[col]))
+        state.pairs[(a, b)] = similarity
+
+
+async def _load_incremental_input(conn, project_id: int, state: _ProjectDuplicateState):
+    """增量刷新的输入：优先复用本进程与表中水位一致的向量矩阵，否则重新载入全部向量"""
+    cached = _working_sets.get(project_id)
+    if cached is not None and cached.watermark == state.watermark and cached.model_id == state.model_id:
+        _working_sets.move_to_end(project_id)
+        state.task_ids = cached.task_ids
+        state.matrix = cached.matrix
+        live_ids = [
+            row["task_id"]
+            for row in await conn.fetch("""
+                SELECT te.task_id
+                FROM task_embeddings te
+                JOIN tasks t ON t.id = te.task_id
+                WHERE te.project_id = $1
+                    AND te.model_id = $2
+                    AND t.deleted_at IS NULL
+                    AND te.embedding IS NOT NULL
+            """, project_id, state.model_id)
+        ]
+        changed_rows = await _fetch_project_embeddings(conn, project_id, since=state.watermark)
+        return live_ids, changed_rows
+
+    # 本进程没有最新的矩阵（未扫描过、已被淘汰或由其他进程刷新过）：载入全部向量，
+    # 任务对仍沿用表中结果，只对水位之后变化的任务重算
+    rows = await _fetch_project_embeddings(conn, project_id)
+    state.task_ids = [row["task_id"] for row in rows]
+    state.matrix = await asyncio.to_thread(_rows_matrix, rows)
+    return state.task_ids, [row for row in rows if row["updated_at"] >= state.watermark]
+
+
+def _remember_working_set(project_id: int, state: _ProjectDuplicateState):
+    if DUPLICATE_SCAN_CACHE_PROJECTS <= 0:
+        return
+    _working_sets[project_id] = state
+    _working_sets.move_to_end(project_id)
+    while len(_working_sets) > DUPLICATE_SCAN_CACHE_PROJECTS:
+        _working_sets.popitem(last=False)
+
+
+async def _release_scan(project_id: int):
+    try:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            await conn.execute("UPDATE project_duplicate_scans SET running_since = NULL WHERE project_id = $1", project_id)
+    except Exception as e:
+        logger.warning("项目 %s 重复检测租约释放失败（%ss 后过期）: %s", project_id, _SCAN_LEASE_SECONDS, e)
+
+
+async def refresh_project_duplicates(
+    project_id: int,
+    threshold: float = DUPLICATE_SCAN_THRESHOLD,
+    block_size: int = DUPLICATE_SCAN_BLOCK_SIZE,
+    full: bool = False,
+) -> dict:
+    """
+    扫描（或增量刷新）项目内的近似重复任务
+
+    首次扫描、阈值或模型版本变化、full=True 时全量计算，否则只处理上次扫描后变化的向量。
+    其他进程正在扫描同一项目时不重复扫描，直接返回当前结果（status=running）。
+    矩阵运算放到线程中避免阻塞事件循环。
+    """
+    started = time.perf_counter()
+    model_id = get_embedding_model_id()
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        claimed = await conn.fetchrow(_CLAIM_SCAN_SQL, project_id, _SCAN_LEASE_SECONDS)
+    if claimed is None:
+        return await get_project_duplicates(project_id)
+
+    saved = False
+    try:
+        incremental = (
+            not full
+            and claimed["watermark"] is not None
+            and claimed["threshold"] == threshold
+            and claimed["model_id"] == model_id
+        )
+        # 在新对象上计算，完成后整体替换工作集，读取方不会看到计算到一半的矩阵
+        state = _ProjectDuplicateState(threshold, model_id)
+        async with pool.acquire() as conn:
+            # updated_at 由应用以 UTC 写入（不带时区），水位同样取 UTC，并留出少量时钟偏差余量
+            scan_started_at = await conn.fetchval(
+                "SELECT timezone('utc', NOW()) - make_interval(secs => $1)", _WATERMARK_SKEW_SECONDS
+            )
+            if incremental:
+                state.watermark = claimed["watermark"]
+                state.pairs = {(a, b): similarity for a, b, similarity in json.loads(claimed["pairs"])}
+                live_ids, rows = await _load_incremental_input(conn, project_id, state)
+            else:
+                rows = await _fetch_project_embeddings(conn, project_id)
+
+        if incremental:
+            await asyncio.to_thread(_incremental_scan, state, live_ids, rows, block_size)
+        else:
+            await asyncio.to_thread(_full_scan, state, rows, block_size)
+        clusters = _build_clusters(state.task_ids, state.pairs)
+
+        # 水位取扫描开始时的数据库时间，扫描期间写入的向量下次刷新时会被重新处理
+        state.watermark = scan_started_at
+        refresh_mode = "incremental" if incremental else "full"
+        duration = time.perf_counter() - started
+        async with pool.acquire() as conn:
+            await conn.execute(
+                _SAVE_SCAN_SQL,
+                project_id,
+                threshold,
+                model_id,
+                len(state.task_ids),
+                json.dumps([[a, b, round(similarity, 5)] for (a, b), similarity in state.pairs.items()]),
+                json.dumps(clusters),
+                scan_started_at,
+                refresh_mode,
+                state.last_changed,
+                duration,
+            )
+        saved = True
+        _remember_working_set(project_id, state)
+    finally:
+        if not saved:
+            _working_sets.pop(project_id, None)
+            await _release_scan(project_id)
+
+    logger.info(
+        "项目 %s 重复检测完成 (%s): %s 个任务, %s 个变化, %s 个簇, 耗时 %.2fs",
+        project_id,
+        refresh_mode,
+        len(state.task_ids),
+        state.last_changed,
+        len(clusters),
+        duration,
+    )
+    return await get_project_duplicates(project_id)
+
+
+async def get_project_duplicates(project_id: int) -> dict:
+    """读取项目最近一次重复检测结果与状态（not_scanned / running / ready）"""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("""
+            SELECT threshold, task_count, clusters::text AS clusters, computed_at, refresh_mode,
+                changed_tasks, duration_seconds,
+                running_since IS NOT NULL
+                    AND running_since >= NOW() - make_interval(secs => $2) AS running
+            FROM project_duplicate_scans
+            WHERE project_id = $1
+        """, project_id, _SCAN_LEASE_SECONDS)
+    if row is None:
+        return {"project_id": project_id, "status": "not_scanned"}
+    result = {"project_id": project_id, "status": "running" if row["running"] else "not_scanned"}
+    if row["computed_at"] is not None:
+        result.update(
+            status=result["status"] if row["running"] else "ready",
+            threshold=row["threshold"],
+            task_count=row["task_count"],
+            clusters=json.loads(row["clusters"]),
+            computed_at=row["computed_at"].isoformat(),
+            refresh_mode=row["refresh_mode"],
+            changed_tasks=row["changed_tasks"],
+            duration_seconds=round(row["duration_seconds"], 3),
+        )
+    return result
+
+
+async def _refresh_if_scanned(project_id: int):
+    """只刷新已扫描过的项目（结果各进程共享，任一进程刷新即可）"""
+    try:
+        pool = await get_db_pool()
+        async with pool.acquire() as conn:
+            threshold = await conn.fetchval(
+                "SELECT threshold FROM project_duplicate_scans WHERE project_id = $1 AND computed_at IS NOT NULL",
+                project_id,
+            )
+        if threshold is not None:
+            await refresh_project_duplicates(project_id, threshold=threshold)
+    except Exception as e:
+        logger.warning("项目 %s 重复检测增量刷新失败: %s", project_id, e)
+    finally:
+        _scheduled_refreshes.discard(project_id)
+
+
+def schedule_duplicate_refresh(project_ids):
+    """任务向量变化后，为已扫描过的项目安排一次增量刷新（未扫描过的项目不处理）"""
+    for project_id in set(project_ids):
+        if project_id in _scheduled_refreshes:
+            continue
+        _scheduled_refreshes.add(project_id)
+        asyncio.create_task(_refresh_if_scanned(project_id))
@@ -0,0 +1,205 @@
+"""
+任务 embedding 批量回填
+
+切换模型、从备份恢复或首次启用向量检索时，按任务 ID 顺序流式读取 tasks
+（服务端游标，不一次性载入内存），分批 encode 后经二进制 COPY 合并写入 task_embeddings。
+每批提交后回调进度，调用方据此记录断点（最后处理的任务 ID），中断后可从断点继续。
+游标读到的是回填开始时的快照，写入前按任务当前文本复核，回填期间被修改的任务交给 outbox，
+不会用旧文本的向量覆盖 outbox 写入的新向量。
+
+向量按模型版本（task_embeddings.model_id）分别存储，回填只写入当前进程所配置模型的版本。
+切换模型时用新模型配置运行回填，新旧版本并存、线上仍检索旧版本；覆盖完整后切换服务配置，
+再清理旧版本（get_embedding_version_stats / purge_embedding_versions）。
+"""
+import logging
+import time
+from typing import Callable, List, Optional
+
+from app.core.config import EMBEDDING_BACKFILL_BATCH_SIZE
+from app.services.vector_store import (
+    build_task_embedding_text,
+    compute_content_hash,
+    copy_task_embeddings,
+    filter_current_embedding_items,
+    generate_embeddings,
+    get_db_pool,
+    get_embedding_model_id,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillProgress:
+    """回填进度与吞吐统计"""
+
+    def __init__(self, start_after_id: int = 0):
+        self.last_task_id = start_after_id
+        self.scanned = 0
+        self.encoded = 0
+        self.skipped = 0
+        self.stale = 0
+        self.batches = 0
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+        self.started_at = time.perf_counter()
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def to_dict(self) -> dict:
+        elapsed = self.elapsed_seconds
+        return {
+            "last_task_id": self.last_task_id,
+            "scanned": self.scanned,
+            "encoded": self.encoded,
+            "skipped": self.skipped,
+            "stale": self.stale,
+            "batches": self.batches,
+            "elapsed_seconds": round(elapsed, 3),
+            "encode_seconds": round(self.encode_seconds, 3),
+            "write_seconds": round(self.write_seconds, 3),
+            "tasks_per_second": round(self.scanned / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+
+
+async def _backfill_batch(conn, rows: List, progress: BackfillProgress, force: bool):
+    """
+    encode 并写入一批任务；当前模型版本的内容哈希未变化的任务跳过（force 时全部重算）
+
+    写入事务内锁住任务行复核当前文本，encode 后已被修改或删除的任务跳过（计入 stale）。
+    """
+    pending = []
+    for row in rows:
+        text = build_task_embedding_text(row["title"], row["description"])
+        if not force and row["content_hash"] == compute_content_hash(text):
+            progress.skipped += 1
+            continue
+        pending.append((row["id"], text))
+
+    if pending:
+        started = time.perf_counter()
+        unique_texts = list(dict.fromkeys(text for _, text in pending))
+        embeddings_by_text = dict(zip(unique_texts, await generate_embeddings(unique_texts)))
+        progress.encode_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        items = [(task_id, embeddings_by_text[text], text) for task_id, text in pending]
+        async with conn.transaction():
+            current_items = await filter_current_embedding_items(conn, items)
+            await copy_task_embeddings(conn, current_items)
+        progress.write_seconds += time.perf_counter() - started
+        progress.encoded += len(current_items)
+        progress.stale += len(items) - len(current_items)
+
+    progress.scanned += len(rows)
+    progress.batches += 1
+    progress.last_task_id = rows[-1]["id"]
+
+
+async def backfill_task_embeddings(
+    batch_size: int = EMBEDDING_BACKFILL_BATCH_SIZE,
+    start_after_id: int = 0,
+    force: bool = False,
+    limit: Optional[int] = None,
+    on_progress: Optional[Callable[[BackfillProgress], None]] = None,
+) -> BackfillProgress:
+    """
+    流式回填未删除任务的 embedding
+
+    读取与写入使用两个连接：读连接在只读事务中持有服务端游标，
+    写连接每批单独提交，进度回调在写入提交后触发，因此回调里记录的断点总是已落库。
+
+    Args:
+        batch_size: 每批 encode / 写入的任务数
+        start_after_id: 从该任务 ID 之后开始（断点续跑）
+        force: 忽略内容哈希，全部重新 encode（同一模型标识下更换了模型文件时使用）
+        limit: 最多处理的任务数（用于试跑）
+        on_progress: 每批提交后的进度回调
+
+    Returns:
+        最终进度统计
+    """
+    progress = BackfillProgress(start_after_id=start_after_id)
+    pool = await get_db_pool()
+
+    async with pool.acquire() as read_conn, pool.acquire() as write_conn:
+        async with read_conn.transaction(readonly=True):
+            cursor = read_conn.cursor("""
+                SELECT t.id, t.title, t.description, te.content_hash
+                FROM tasks t
+                LEFT JOIN task_embeddings te ON te.task_id = t.id AND te.model_id = $2
+                WHERE t.deleted_at IS NULL AND t.id > $1
+                ORDER BY t.id
+            """, start_after_id, get_embedding_model_id(), prefetch=batch_size)
+
+            rows = []
+            async for row in cursor:
+                rows.append(row)
+                if limit is not None and progress.scanned + len(rows) >= limit:
+                    break
+                if len(rows) >= batch_size:
+                    await _backfill_batch(write_conn, rows, progress, force)
+                    rows = []
+                    if on_progress is not None:
+                        on_progress(progress)
+
+            if rows:
+                await _backfill_batch(write_conn, rows, progress, force)
+                if on_progress is not None:
+                    on_progress(progress)
+
+    logger.info("任务 embedding 回填完成: %s", progress.to_dict())
+    return progress
+
+
+async def get_embedding_version_stats() -> dict:
+    """
+    各模型版本的向量统计：向量数、覆盖的未删除任务数与覆盖率
+
+    覆盖率只反映“有没有向量”，迁移期间被修改的任务需在切换前再跑一次回填，按内容哈希追平。
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        live_tasks = await conn.fetchval("SELECT count(*) FROM tasks WHERE deleted_at IS NULL")
+        rows = await conn.fetch("""
+            SELECT
+                te.model_id,
+                max(te.embedding_dim) AS embedding_dim,
+                count(*) AS embeddings,
+                count(*) FILTER (WHERE t.deleted_at IS NULL) AS covered,
+                max(te.updated_at) AS last_updated_at
+            FROM task_embeddings te
+            LEFT JOIN tasks t ON t.id = te.task_id
+            GROUP BY te.model_id
+            ORDER BY te.model_id
+        """)
+
+    active_model_id = get_embedding_model_id()
+    return {
+        "active_model_id": active_model_id,
+        "live_tasks": live_tasks,
+        "versions": [
+            {
+                "model_id": row["model_id"],
+                "embedding_dim": row["embedding_dim"],
+                "embeddings": row["embeddings"],
+                "covered": row["covered"],
+                "coverage": round(row["covered"] / live_tasks, 4) if live_tasks else 1.0,
+                "active": row["model_id"] == active_model_id,
+                "last_updated_at": row["last_updated_at"].isoformat() if row["last_updated_at"] else None,
+            }
+            for row in rows
+        ],
+    }
+
+
+async def purge_embedding_versions(keep_model_id: Optional[str] = None) -> int:
+    """删除 keep_model_id（默认当前模型）以外所有版本的向量，返回删除的行数"""
+    keep_model_id = keep_model_id or get_embedding_model_id()
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        status = await conn.execute("DELETE FROM task_embeddings WHERE model_id != $1", keep_model_id)
+    deleted = int(status.split()[-1])
+    logger.info("已清理 %s 之外的 embedding 版本: %s 行", keep_model_id, deleted)
+    return deleted
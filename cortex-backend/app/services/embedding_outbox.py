@@ -0,0 +1,225 @@
+"""
+任务 embedding outbox
+
+任务写接口只在同一事务里登记 outbox 记录（不调用模型、不访问 task_embeddings）；
+后台 worker 批量取出到期记录，按任务当前状态 encode 并多行 upsert 到 task_embeddings，
+处理失败的记录按指数退避保留重试，保证不会有任务悄悄缺失向量。
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+import asyncpg
+
+from app.core.config import EMBEDDING_OUTBOX_BATCH_SIZE, EMBEDDING_OUTBOX_POLL_INTERVAL_SECONDS
+from app.models import TaskEmbeddingOutbox
+from app.services.duplicate_detection import schedule_duplicate_refresh
+from app.services.vector_store import (
+    build_task_embedding_text,
+    compute_content_hash,
+    filter_current_embedding_items,
+    generate_embeddings,
+    get_embedding_model_id,
+    get_db_pool,
+    publish_similarity_invalidation,
+    upsert_task_embeddings,
+)
+
+logger = logging.getLogger(__name__)
+
+_MAX_RETRY_DELAY_SECONDS = 300
+# 领取记录的租约：处理中的记录在此期间不会被其他 worker 重复领取
+_CLAIM_LEASE_SECONDS = 300
+
+_worker_task: Optional[asyncio.Task] = None
+_wakeup_event: Optional[asyncio.Event] = None
+
+
+async def enqueue_task_embedding(task_id: int) -> None:
+    """登记任务 embedding 待同步（需在任务变更的同一事务内调用）"""
+    await TaskEmbeddingOutbox.create(task_id=task_id)
+
+
+def wake_embedding_outbox_worker():
+    """事务提交后唤醒本进程的 worker，尽快处理新登记的记录"""
+    if _wakeup_event is not None:
+        _wakeup_event.set()
+
+
+async def _load_pending_embeddings(conn: asyncpg.Connection, task_ids: List[int]):
+    """
+    读取任务当前状态：需要重新 encode 的 (task_id, 文本)、需要移除向量的任务，以及涉及的项目 ID
+
+    当前模型版本的向量内容哈希未变化的任务跳过 encode；已删除/不存在的任务移除所有版本的向量。
+    """
+    rows = await conn.fetch("""
+        SELECT id, title, description, project_id, deleted_at
+        FROM tasks
+        WHERE id = ANY($1::int[])
+    """, task_ids)
+
+    live_rows = [row for row in rows if row["deleted_at"] is None]
+    removed_ids = sorted(set(task_ids) - {row["id"] for row in live_rows})
+    pending = []
+    if live_rows:
+        # 只维护当前模型版本的向量；迁移中的新版本由回填任务按内容哈希追平
+        existing = {
+            row["task_id"]: row["content_hash"]
+            for row in await conn.fetch("""
+                SELECT task_id, content_hash
+                FROM task_embeddings
+                WHERE task_id = ANY($1::int[]) AND model_id = $2
+            """, [row["id"] for row in live_rows], get_embedding_model_id())
+        }
+        for row in live_rows:
+            text = build_task_embedding_text(row["title"], row["description"])
+            if existing.get(row["id"]) != compute_content_hash(text):
+                pending.append((row["id"], text))
+    return pending, removed_ids, {row["project_id"] for row in rows}
+
+
+async def _write_task_embeddings(conn: asyncpg.Connection, items, removed_ids: List[int]):
+    """
+    写入 encode 结果并移除已删除任务的向量（需在事务内调用）
+
+    encode 期间任务可能再次被修改/删除/恢复，对应的新 outbox 记录会重新同步；
+    这里锁住任务行复核当前状态，跳过已过期的结果，避免旧向量覆盖其他 worker 写入的新向量。
+    """
+    items = await filter_current_embedding_items(conn, items)
+    if removed_ids:
+        revived_ids = {
+            row["id"]
+            for row in await conn.fetch("""
+                SELECT id, deleted_at
+                FROM tasks
+                WHERE id = ANY($1::int[])
+                FOR SHARE
+            """, removed_ids)
+            if row["deleted_at"] is None
+        }
+        removed_ids = [task_id for task_id in removed_ids if task_id not in revived_ids]
+    if items:
+        await upsert_task_embeddings(conn, items)
+    if removed_ids:
+        await conn.execute("DELETE FROM task_embeddings WHERE task_id = ANY($1::int[])", removed_ids)
+
+
+async def drain_embedding_outbox(batch_size: int = EMBEDDING_OUTBOX_BATCH_SIZE) -> int:
+    """
+    处理一批到期的 outbox 记录
+
+    分三步，encode 期间不持有事务与连接：
+    1. 单条语句领取记录（FOR UPDATE SKIP LOCKED），并把 available_at 后移 _CLAIM_LEASE_SECONDS 作为租约，
+       多个 worker 并行时互不重复处理，worker 中途退出时租约到期后记录自动重新可领取；
+    2. 读取任务当前状态后归还连接，在连接外 encode；
+    3. 短事务写入向量并删除 outbox 记录。
+
+    Returns:
+        成功处理的记录数
+    """
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        entries = await conn.fetch("""
+            UPDATE task_embedding_outbox
+            SET available_at = NOW() + make_interval(secs => $2)
+            WHERE id IN (
+                SELECT id
+                FROM task_embedding_outbox
+                WHERE available_at <= NOW()
+                ORDER BY id
+                LIMIT $1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, task_id
+        """, batch_size, _CLAIM_LEASE_SECONDS)
+        if not entries:
+            return 0
+        entry_ids = [entry["id"] for entry in entries]
+        task_ids = sorted({entry["task_id"] for entry in entries})
+
+        try:
+            pending, removed_ids, project_ids = await _load_pending_embeddings(conn, task_ids)
+        except Exception as e:
+            await _schedule_retry(conn, entry_ids, task_ids, e)
+            return 0
+
+    try:
+        items = []
+        if pending:
+            # 同一批内文本相同的任务只 encode 一次
+            unique_texts = list(dict.fromkeys(text for _, text in pending))
+            embeddings_by_text = dict(zip(unique_texts, await generate_embeddings(unique_texts)))
+            items = [(task_id, embeddings_by_text[text], text) for task_id, text in pending]
+
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await _write_task_embeddings(conn, items, removed_ids)
+                await conn.execute("DELETE FROM task_embedding_outbox WHERE id = ANY($1::bigint[])", entry_ids)
+    except Exception as e:
+        async with pool.acquire() as conn:
+            await _schedule_retry(conn, entry_ids, task_ids, e)
+        return 0
+
+    # 事务提交后再失效检索缓存、刷新重复检测缓存，保证读到本批写入的向量
+    await publish_similarity_invalidation(project_ids)
+    schedule_duplicate_refresh(project_ids)
+    return len(entries)
+
+
+async def _schedule_retry(conn: asyncpg.Connection, entry_ids: List[int], task_ids: List[int], error: Exception):
+    """同步失败：保留 outbox 记录，按指数退避登记重试"""
+    logger.warning("同步任务 embedding 失败，稍后重试 (task_ids=%s): %s", task_ids, error)
+    await conn.execute("""
+        UPDATE task_embedding_outbox
+        SET attempts = attempts + 1,
+            last_error = $2,
+            available_at = NOW() + make_interval(secs => LEAST(POWER(2, attempts + 1), $3))
+        WHERE id = ANY($1::bigint[])
+    """, entry_ids, str(error), _MAX_RETRY_DELAY_SECONDS)
+
+
+async def run_embedding_outbox_worker(
+    batch_size: int = EMBEDDING_OUTBOX_BATCH_SIZE,
+    poll_interval: float = EMBEDDING_OUTBOX_POLL_INTERVAL_SECONDS,
+):
+    """outbox worker 主循环：有积压时连续处理，空闲时等待唤醒或轮询间隔"""
+    global _wakeup_event
+    _wakeup_event = asyncio.Event()
+
+    while True:
+        try:
+            processed = await drain_embedding_outbox(batch_size=batch_size)
+        except Exception as e:
+            logger.warning("embedding outbox 处理异常: %s", e)
+            processed = 0
+
+        if processed >= batch_size:
+            continue
+
+        _wakeup_event.clear()
+        try:
+            await asyncio.wait_for(_wakeup_event.wait(), timeout=poll_interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_embedding_outbox_worker():
+    """在当前事件循环启动 outbox worker（应用启动时调用）"""
+    global _worker_task
+    if _worker_task is None or _worker_task.done():
+        _worker_task = asyncio.create_task(run_embedding_outbox_worker())
+    return _worker_task
+
+
+async def stop_embedding_outbox_worker():
+    """停止 outbox worker（应用关闭时调用）"""
+    global _worker_task, _wakeup_event
+    if _worker_task is not None:
+        _worker_task.cancel()
+        try:
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+        _worker_task = None
+    _wakeup_event = None
@@ -0,0 +1,162 @@
+"""
+Postgres LISTEN/NOTIFY 跨进程通知
+
+发送方在共用连接池上执行 pg_notify；每个进程用一条专用连接 LISTEN（不占用共用连接池，
+LISTEN 需要会话级连接，经 PgBouncer 事务池部署时由 NOTIFY_DATABASE_URL 直连数据库），
+收到通知后按频道分发给订阅的回调。
+
+连接断开后按指数退避重连，重新 LISTEN 成功后调用订阅方的 on_reconnect：断开期间的通知已经丢失，
+订阅方应据此整体失效本地状态。
+"""
+import asyncio
+import json
+import logging
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+from tortoise import connections
+
+from app.core.config import NOTIFY_DATABASE_URL
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_RECONNECT_DELAY_SECONDS = 1.0
+_MAX_RECONNECT_DELAY_SECONDS = 30
+
+NotificationHandler = Callable[[dict], None]
+
+
+class _Subscription:
+    def __init__(self, handler: NotificationHandler, on_reconnect: Optional[Callable[[], None]]):
+        self.handler = handler
+        self.on_reconnect = on_reconnect
+
+
+class PostgresListener:
+    """单连接 LISTEN 多个频道，回调在事件循环线程中同步执行（应保持轻量）"""
+
+    def __init__(self, dsn: Optional[str]):
+        self.dsn = dsn
+        self._subscriptions: Dict[str, List[_Subscription]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.connected = False
+        self.received = 0
+        self.reconnects = 0
+
+    def subscribe(
+        self,
+        channel: str,
+        handler: NotificationHandler,
+        on_reconnect: Optional[Callable[[], None]] = None,
+    ):
+        """订阅频道（需在 start 之前调用）"""
+        self._subscriptions.setdefault(channel, []).append(_Subscription(handler, on_reconnect))
+
+    def _dispatch(self, connection, pid: int, channel: str, payload: str):
+        self.received += 1
+        try:
+            message = json.loads(payload) if payload else {}
+        except ValueError:
+            logger.warning("忽略无法解析的通知 (channel=%s): %s", channel, payload[:200])
+            return
+        for subscription in self._subscriptions.get(channel, []):
+            try:
+                subscription.handler(message)
+            except Exception as e:
+                logger.warning("处理通知失败 (channel=%s): %s", channel, e)
+
+    def _notify_reconnected(self):
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                if subscription.on_reconnect is not None:
+                    subscription.on_reconnect()
+
+    async def _listen_once(self, reconnected: bool):
+        conn = await asyncpg.connect(self.dsn)
+        closed = asyncio.Event()
+        conn.add_termination_listener(lambda _: closed.set())
+        try:
+            for channel in self._subscriptions:
+                await conn.add_listener(channel, self._dispatch)
+            self.connected = True
+            if reconnected:
+                # 断开期间的通知已丢失；在 LISTEN 生效之后再让订阅方整体失效，避免漏掉中间的通知
+                self.reconnects += 1
+                self._notify_reconnected()
+            await closed.wait()
+        finally:
+            self.connected = False
+            if not conn.is_closed():
+                await conn.close()
+
+    async def run(self):
+        """监听主循环：连接断开后退避重连"""
+        delay = _INITIAL_RECONNECT_DELAY_SECONDS
+        reconnected = False
+        while True:
+            try:
+                await self._listen_once(reconnected)
+                delay = _INITIAL_RECONNECT_DELAY_SECONDS
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("LISTEN 连接异常，%.0fs 后重连: %s", delay, e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_RECONNECT_DELAY_SECONDS)
+            reconnected = True
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "channels": sorted(self._subscriptions),
+            "connected": self.connected,
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
+
+
+_listener = PostgresListener(NOTIFY_DATABASE_URL)
+
+
+def subscribe_notifications(
+    channel: str,
+    handler: NotificationHandler,
+    on_reconnect: Optional[Callable[[], None]] = None,
+):
+    """订阅本进程的通知频道；handler 接收解析后的 JSON 负载"""
+    _listener.subscribe(channel, handler, on_reconnect)
+
+
+def start_notification_listener():
+    """在当前事件循环启动监听（应用启动时、完成订阅后调用）"""
+    return _listener.start()
+
+
+async def stop_notification_listener():
+    """停止监听（应用关闭时调用）"""
+    await _listener.stop()
+
+
+def get_notification_listener_stats() -> dict:
+    return _listener.stats()
+
+
+async def publish_notification(channel: str, message: dict):
+    """经共用连接池发送通知（在事务外调用时立即投递，事务内调用则随事务提交投递）"""
+    await connections.get("default").execute_query(
+        "SELECT pg_notify($1, $2)",
+        [channel, json.dumps(message, separators=(",", ":"))],
+    )
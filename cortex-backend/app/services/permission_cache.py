@@ -0,0 +1,215 @@
+"""
+进程内权限缓存
+
+缓存三类数据，每类都有条数上限（PERMISSION_CACHE_SIZE）与有效期（PERMISSION_CACHE_TTL_SECONDS）：
+- 用户：get_current_user 按 token 中的用户 ID 读取的 User 行
+- 用户可见项目：负责人或成员的未删除项目（项目 ID -> 组织 ID）
+- 项目成员：project_members 中的用户 ID
+
+成员增删、项目创建/修改/删除、用户资料变化后调用 publish_permission_invalidation()：
+先失效本进程缓存，再经 Postgres NOTIFY 通知其他 worker 进程失效。
+监听连接断开期间丢失的通知由重连后整体清空缓存与 TTL 兜底。
+"""
+import copy
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from app.core.config import PERMISSION_CACHE_NOTIFY_ENABLED, PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL_SECONDS
+from app.models import Project, ProjectMember, User
+from app.services.notifications import publish_notification, subscribe_notifications
+
+logger = logging.getLogger(__name__)
+
+PERMISSION_INVALIDATION_CHANNEL = "cortex_permission_invalidation"
+
+# 本进程发出的通知带上来源标识，监听到自己的通知时跳过（本地已失效）
+_ORIGIN = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_MISSING = object()
+
+
+class _TTLCache:
+    """带有效期的 LRU 缓存"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[object, tuple[float, object]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # 每次失效递增；查询期间发生过失效的结果不写入缓存，避免旧权限覆盖失效
+        self.generation = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value, generation: int):
+        if not self.enabled or generation != self.generation:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self.generation += 1
+        self._entries.pop(key, None)
+
+    def pop_where(self, predicate):
+        self.generation += 1
+        for key in [key for key, (_, value) in self._entries.items() if predicate(value)]:
+            del self._entries[key]
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_user_cache = _TTLCache(PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL_SECONDS)
+_visible_projects_cache = _TTLCache(PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL_SECONDS)
+_project_members_cache = _TTLCache(PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL_SECONDS)
+_invalidations = {"local": 0, "remote": 0, "publish_failed": 0}
+
+
+async def get_cached_user(user_id: int) -> Optional[User]:
+    """读取用户行；返回副本，请求内修改字段（如资料更新）不会影响缓存"""
+    user = _user_cache.get(user_id)
+    if user is _MISSING:
+        generation = _user_cache.generation
+        user = await User.get_or_none(id=user_id)
+        if user is None:
+            return None
+        _user_cache.put(user_id, user, generation)
+    return copy.copy(user)
+
+
+async def get_visible_projects(user_id: int) -> Dict[int, Optional[int]]:
+    """用户可见的未删除项目（负责人或成员）：项目 ID -> 组织 ID"""
+    projects = _visible_projects_cache.get(user_id)
+    if projects is _MISSING:
+        generation = _visible_projects_cache.generation
+        joined_project_ids = await ProjectMember.filter(user_id=user_id).values_list("project_id", flat=True)
+        owned_project_ids = await Project.filter(
+            owner_id=user_id,
+            deleted_at__isnull=True,
+        ).values_list("id", flat=True)
+        candidate_ids = set(joined_project_ids) | set(owned_project_ids)
+        projects = {}
+        if candidate_ids:
+            projects = dict(await Project.filter(
+                id__in=sorted(candidate_ids),
+                deleted_at__isnull=True,
+            ).values_list("id", "organization_id"))
+        _visible_projects_cache.put(user_id, projects, generation)
+    return dict(projects)
+
+
+async def get_project_member_ids(project_id: int) -> FrozenSet[int]:
+    """项目成员（project_members）的用户 ID，不含未加入成员表的负责人"""
+    member_ids = _project_members_cache.get(project_id)
+    if member_ids is _MISSING:
+        generation = _project_members_cache.generation
+        member_ids = frozenset(
+            await ProjectMember.filter(project_id=project_id).values_list("user_id", flat=True)
+        )
+        _project_members_cache.put(project_id, member_ids, generation)
+    return member_ids
+
+
+def invalidate_permission_cache(
+    user_ids: Iterable[int] = (),
+    project_ids: Iterable[int] = (),
+):
+    """
+    失效本进程的权限缓存
+
+    user_ids：该用户的用户行与可见项目；project_ids：该项目的成员，以及可见项目中包含它的用户
+    """
+    for user_id in user_ids:
+        _user_cache.pop(user_id)
+        _visible_projects_cache.pop(user_id)
+    project_ids = set(project_ids)
+    if project_ids:
+        for project_id in project_ids:
+            _project_members_cache.pop(project_id)
+        _visible_projects_cache.pop_where(lambda projects: not project_ids.isdisjoint(projects))
+
+
+def clear_permission_cache():
+    _user_cache.clear()
+    _visible_projects_cache.clear()
+    _project_members_cache.clear()
+
+
+async def publish_permission_invalidation(
+    user_ids: Iterable[int] = (),
+    project_ids: Iterable[int] = (),
+):
+    """权限相关数据写入提交后调用：失效本进程缓存并通知其他 worker 进程"""
+    user_ids = sorted(set(user_ids))
+    project_ids = sorted(set(project_ids))
+    invalidate_permission_cache(user_ids, project_ids)
+    _invalidations["local"] += 1
+    if not PERMISSION_CACHE_NOTIFY_ENABLED:
+        return
+    try:
+        await publish_notification(
+            PERMISSION_INVALIDATION_CHANNEL,
+            {"origin": _ORIGIN, "user_ids": user_ids, "project_ids": project_ids},
+        )
+    except Exception as e:
+        # 通知失败时其他进程最多在 TTL 内读到旧权限
+        _invalidations["publish_failed"] += 1
+        logger.warning("权限缓存失效通知发送失败: %s", e)
+
+
+def _handle_invalidation_notification(message: dict):
+    if message.get("origin") == _ORIGIN:
+        return
+    _invalidations["remote"] += 1
+    invalidate_permission_cache(message.get("user_ids", []), message.get("project_ids", []))
+
+
+def register_permission_cache_listener():
+    """订阅其他进程的失效通知（应用启动时、启动监听之前调用）"""
+    subscribe_notifications(
+        PERMISSION_INVALIDATION_CHANNEL,
+        _handle_invalidation_notification,
+        on_reconnect=clear_permission_cache,
+    )
+
+
+def get_permission_cache_metrics() -> dict:
+    caches = {
+        "users": _user_cache,
+        "visible_projects": _visible_projects_cache,
+        "project_members": _project_members_cache,
+    }
+    return {
+        "enabled": _user_cache.enabled,
+        "ttl_seconds": PERMISSION_CACHE_TTL_SECONDS,
+        **{
+            name: {"size": len(cache), "hits": cache.hits, "misses": cache.misses}
+            for name, cache in caches.items()
+        },
+        "invalidations": dict(_invalidations),
+    }
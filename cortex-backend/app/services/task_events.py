@@ -0,0 +1,398 @@
+"""
+任务变更事件流
+
+tasks / task_comments 上的触发器在业务事务内写入 task_events，并 pg_notify 事件所属项目；
+各 worker 进程的 LISTEN 连接收到通知后唤醒订阅该项目的事件流，事件流再从 task_events 读取新事件。
+事件落库后才推送，因此断线后按 Last-Event-ID 续传、多 worker 部署、LISTEN 重连都不会丢事件。
+
+事件 id 的分配顺序与提交顺序不一致（先分配 id 的事务可能后提交），因此每条事件记录写入事务的
+xid（pg_current_xact_id()，需 PostgreSQL 13+），读取方只投递 xid 早于当前快照 xmin 的事件——
+这些事务都已结束，不会再出现新的事件——并按 (xid, id) 排序、以 "xid-id" 作为事件 id 推进游标。
+写入之间不加锁；代价是 xmin 为全库范围：任何仍在运行、已分配 xid 的更早事务（回填、迁移等长事务）
+都会推迟所有项目此后事件的投递，直到它结束。延迟监控定期计算被阻塞的已提交事件的最长等待时间，
+超过 TASK_EVENTS_DELIVERY_LAG_WARN_SECONDS 时记录告警，并在 /health 中展示。
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from app.core.config import (
+    TASK_EVENTS_BATCH_SIZE,
+    TASK_EVENTS_DELIVERY_LAG_WARN_SECONDS,
+    TASK_EVENTS_HEARTBEAT_SECONDS,
+    TASK_EVENTS_RETENTION_HOURS,
+)
+from app.services.notifications import subscribe_notifications
+from app.services.vector_store import get_db_pool
+
+logger = logging.getLogger(__name__)
+
+TASK_EVENTS_CHANNEL = "cortex_task_events"
+
+_PRUNE_INTERVAL_SECONDS = 3600
+_LAG_CHECK_INTERVAL_SECONDS = 30
+
+_TASK_EVENTS_DDL = f"""
+    SELECT pg_advisory_xact_lock(hashtext('cortex_task_events_ddl'));
+
+    CREATE TABLE IF NOT EXISTS task_events (
+        id BIGSERIAL PRIMARY KEY,
+        xid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+        project_id INTEGER NOT NULL,
+        task_id INTEGER NOT NULL,
+        event_type VARCHAR(32) NOT NULL,
+        payload JSONB NOT NULL,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    ALTER TABLE task_events ADD COLUMN IF NOT EXISTS xid XID8 NOT NULL DEFAULT pg_current_xact_id();
+    DROP INDEX IF EXISTS idx_task_events_project_id;
+    CREATE INDEX IF NOT EXISTS idx_task_events_project_xid ON task_events (project_id, xid, id);
+    CREATE INDEX IF NOT EXISTS idx_task_events_created_at ON task_events (created_at);
+    CREATE INDEX IF NOT EXISTS idx_task_events_xid ON task_events (xid);
+
+    CREATE OR REPLACE FUNCTION cortex_record_task_event(
+        p_project_id INTEGER, p_task_id INTEGER, p_event_type TEXT, p_payload JSONB
+    ) RETURNS VOID AS $$
+    DECLARE
+        v_event_id BIGINT;
+    BEGIN
+        INSERT INTO task_events (project_id, task_id, event_type, payload)
+        VALUES (p_project_id, p_task_id, p_event_type, p_payload)
+        RETURNING id INTO v_event_id;
+        PERFORM pg_notify(
+            '{TASK_EVENTS_CHANNEL}',
+            json_build_object('id', v_event_id, 'project_id', p_project_id)::text
+        );
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION cortex_task_events_on_task() RETURNS TRIGGER AS $$
+    DECLARE
+        v_event_type TEXT;
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            v_event_type := 'task.created';
+        ELSIF OLD.deleted_at IS NULL AND NEW.deleted_at IS NOT NULL THEN
+            v_event_type := 'task.deleted';
+        ELSIF OLD.deleted_at IS NOT NULL AND NEW.deleted_at IS NULL THEN
+            v_event_type := 'task.restored';
+        ELSE
+            v_event_type := 'task.updated';
+        END IF;
+        PERFORM cortex_record_task_event(NEW.project_id, NEW.id, v_event_type, to_jsonb(NEW));
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION cortex_task_events_on_comment() RETURNS TRIGGER AS $$
+    DECLARE
+        v_project_id INTEGER;
+    BEGIN
+        SELECT project_id INTO v_project_id FROM tasks WHERE id = NEW.task_id;
+        IF v_project_id IS NOT NULL THEN
+            PERFORM cortex_record_task_event(v_project_id, NEW.task_id, 'comment.created', to_jsonb(NEW));
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_task_events_insert') THEN
+            CREATE TRIGGER trg_task_events_insert AFTER INSERT ON tasks
+                FOR EACH ROW EXECUTE FUNCTION cortex_task_events_on_task();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_task_events_update') THEN
+            CREATE TRIGGER trg_task_events_update AFTER UPDATE ON tasks
+                FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+                EXECUTE FUNCTION cortex_task_events_on_task();
+        END IF;
+        IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'trg_task_events_comment_insert') THEN
+            CREATE TRIGGER trg_task_events_comment_insert AFTER INSERT ON task_comments
+                FOR EACH ROW EXECUTE FUNCTION cortex_task_events_on_comment();
+        END IF;
+    END;
+    $$;
+"""
+
+# 项目 ID -> 本进程中订阅该项目的事件流唤醒信号
+_project_waiters: Dict[int, Set[asyncio.Event]] = {}
+_pruner_task: Optional[asyncio.Task] = None
+_lag_monitor_task: Optional[asyncio.Task] = None
+_stats = {
+    "notifications": 0,
+    "streams_opened": 0,
+    "events_sent": 0,
+    "resets": 0,
+    "access_revoked": 0,
+    "delivery_lag_seconds": None,
+}
+
+
+async def init_task_events():
+    """创建 task_events 表、写入事件的函数与触发器（幂等，应用启动时调用）"""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            await conn.execute(_TASK_EVENTS_DDL)
+
+
+def _handle_task_event_notification(message: dict):
+    _stats["notifications"] += 1
+    for waiter in _project_waiters.get(message.get("project_id"), ()):
+        waiter.set()
+
+
+def _wake_all_streams():
+    # LISTEN 重连期间的通知已丢失，但事件都在表里：唤醒所有事件流重新读取即可
+    for waiters in _project_waiters.values():
+        for waiter in waiters:
+            waiter.set()
+
+
+def register_task_events_listener():
+    """订阅任务事件通知（应用启动时、启动监听之前调用）"""
+    subscribe_notifications(TASK_EVENTS_CHANNEL, _handle_task_event_notification, on_reconnect=_wake_all_streams)
+
+
+TaskEventCursor = Tuple[int, int]
+
+# 只读取写入事务已结束的事件：xid 早于当前快照 xmin 的事务不会再提交新事件
+_SETTLED_SQL = "xid < pg_snapshot_xmin(pg_current_snapshot())"
+
+
+def parse_task_event_cursor(value: str) -> TaskEventCursor:
+    """解析 "xid-id" 形式的事件 id（Last-Event-ID），格式错误抛 ValueError"""
+    xid, _, event_id = value.partition("-")
+    cursor = (int(xid), int(event_id))
+    if min(cursor) < 0:
+        raise ValueError(value)
+    return cursor
+
+
+def format_task_event_cursor(cursor: TaskEventCursor) -> str:
+    return f"{cursor[0]}-{cursor[1]}"
+
+
+async def get_latest_task_event_cursor(project_id: int) -> TaskEventCursor:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow(f"""
+            SELECT xid::text::bigint AS xid, id
+            FROM task_events
+            WHERE project_id = $1 AND {_SETTLED_SQL}
+            ORDER BY xid DESC, id DESC
+            LIMIT 1
+        """, project_id)
+    return (row["xid"], row["id"]) if row is not None else (0, 0)
+
+
+async def is_task_event_cursor_expired(cursor: TaskEventCursor) -> bool:
+    """游标之后的事件是否可能已被清理（保守判断：游标早于表中最早的事务）"""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        oldest_xid = await conn.fetchval("SELECT MIN(xid)::text::bigint FROM task_events")
+    if oldest_xid is None:
+        return cursor != (0, 0)
+    return cursor[0] < oldest_xid
+
+
+async def fetch_task_events(
+    project_id: int,
+    after: TaskEventCursor,
+    limit: int = TASK_EVENTS_BATCH_SIZE,
+) -> List[dict]:
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        rows = await conn.fetch(f"""
+            SELECT xid::text::bigint AS xid, id, project_id, task_id, event_type, payload::text AS payload, created_at
+            FROM task_events
+            WHERE project_id = $1
+                AND (xid, id) > ($2::text::xid8, $3)
+                AND {_SETTLED_SQL}
+            ORDER BY xid, id
+            LIMIT $4
+        """, project_id, str(after[0]), after[1], limit)
+    return [
+        {
+            "id": format_task_event_cursor((row["xid"], row["id"])),
+            "type": row["event_type"],
+            "project_id": row["project_id"],
+            "task_id": row["task_id"],
+            "payload": json.loads(row["payload"]),
+            "created_at": row["created_at"].isoformat(),
+            "cursor": (row["xid"], row["id"]),
+        }
+        for row in rows
+    ]
+
+
+def format_sse(data: dict, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def stream_task_events(
+    project_id: int,
+    cursor: Optional[TaskEventCursor],
+    check_access: Callable[[], Awaitable[bool]],
+    heartbeat_seconds: float = TASK_EVENTS_HEARTBEAT_SECONDS,
+    batch_size: int = TASK_EVENTS_BATCH_SIZE,
+) -> AsyncIterator[str]:
+    """
+    项目事件流（SSE 文本块）
+
+    不带游标时只推送此后的新事件；游标早于保留范围时先发送 reset 事件，
+    客户端应重新全量拉取任务列表。空闲时按心跳间隔发送注释行并重新读取
+    （被更早的长事务推迟的事件在此时投递）。无论项目是否持续有事件，每个心跳间隔都复核一次访问权限，
+    失去权限即结束。
+    """
+    waiter = asyncio.Event()
+    _project_waiters.setdefault(project_id, set()).add(waiter)
+    _stats["streams_opened"] += 1
+    try:
+        if cursor is None:
+            cursor = await get_latest_task_event_cursor(project_id)
+        elif await is_task_event_cursor_expired(cursor):
+            _stats["resets"] += 1
+            cursor = await get_latest_task_event_cursor(project_id)
+            yield format_sse({"project_id": project_id}, event="reset", event_id=format_task_event_cursor(cursor))
+
+        access_checked_at = time.monotonic()
+        while True:
+            if time.monotonic() - access_checked_at >= heartbeat_seconds:
+                if not await check_access():
+                    _stats["access_revoked"] += 1
+                    return
+                access_checked_at = time.monotonic()
+
+            # 先清除信号再读取：读取期间到达的通知会让下一轮立即再读
+            waiter.clear()
+            events = await fetch_task_events(project_id, cursor, batch_size)
+            for event in events:
+                cursor = event.pop("cursor")
+                _stats["events_sent"] += 1
+                yield format_sse(event, event=event["type"], event_id=event["id"])
+            if len(events) >= batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(waiter.wait(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+    finally:
+        waiters = _project_waiters.get(project_id)
+        if waiters is not None:
+            waiters.discard(waiter)
+            if not waiters:
+                del _project_waiters[project_id]
+
+
+async def prune_task_events(retention_hours: float = TASK_EVENTS_RETENTION_HOURS) -> int:
+    """删除超过保留时长的事件，返回删除条数"""
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        result = await conn.execute(
+            "DELETE FROM task_events WHERE created_at < NOW() - make_interval(secs => $1)",
+            retention_hours * 3600,
+        )
+    return int(result.split()[-1])
+
+
+async def run_task_events_pruner(interval_seconds: float = _PRUNE_INTERVAL_SECONDS):
+    while True:
+        try:
+            deleted = await prune_task_events()
+            if deleted:
+                logger.info("已清理 %d 条过期任务事件", deleted)
+        except Exception as e:
+            logger.warning("任务事件清理失败: %s", e)
+        await asyncio.sleep(interval_seconds)
+
+
+def start_task_events_pruner():
+    """在当前事件循环启动过期事件清理（应用启动时调用）"""
+    global _pruner_task
+    if _pruner_task is None or _pruner_task.done():
+        _pruner_task = asyncio.create_task(run_task_events_pruner())
+    return _pruner_task
+
+
+async def stop_task_events_pruner():
+    global _pruner_task
+    if _pruner_task is not None:
+        _pruner_task.cancel()
+        try:
+            await _pruner_task
+        except asyncio.CancelledError:
+            pass
+        _pruner_task = None
+
+
+async def get_task_events_delivery_lag() -> Optional[float]:
+    """
+    已提交但仍被更早的未结束事务阻塞的事件中，最长的等待秒数（没有被阻塞的事件时返回 None）
+
+    未提交事务写入的事件对本查询不可见，因此只统计已提交、仅因 xmin 未推进而无法投递的事件。
+    """
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        return await conn.fetchval("""
+            SELECT EXTRACT(EPOCH FROM clock_timestamp() - MIN(created_at))::float8
+            FROM task_events
+            WHERE xid >= pg_snapshot_xmin(pg_current_snapshot())
+        """)
+
+
+async def run_task_events_lag_monitor(
+    interval_seconds: float = _LAG_CHECK_INTERVAL_SECONDS,
+    warn_seconds: float = TASK_EVENTS_DELIVERY_LAG_WARN_SECONDS,
+):
+    while True:
+        try:
+            lag = await get_task_events_delivery_lag()
+            _stats["delivery_lag_seconds"] = round(lag, 1) if lag is not None else None
+            if lag is not None and lag > warn_seconds:
+                logger.warning(
+                    "任务事件投递被未结束的长事务阻塞 %.0fs（超过 %.0fs），所有项目的事件流都会延迟；"
+                    "请检查 pg_stat_activity 中 backend_xid 非空且 xact_start 较早的事务",
+                    lag,
+                    warn_seconds,
+                )
+        except Exception as e:
+            logger.warning("任务事件投递延迟检查失败: %s", e)
+        await asyncio.sleep(interval_seconds)
+
+
+def start_task_events_lag_monitor():
+    """在当前事件循环启动事件投递延迟监控（应用启动时调用）"""
+    global _lag_monitor_task
+    if _lag_monitor_task is None or _lag_monitor_task.done():
+        _lag_monitor_task = asyncio.create_task(run_task_events_lag_monitor())
+    return _lag_monitor_task
+
+
+async def stop_task_events_lag_monitor():
+    global _lag_monitor_task
+    if _lag_monitor_task is not None:
+        _lag_monitor_task.cancel()
+        try:
+            await _lag_monitor_task
+        except asyncio.CancelledError:
+            pass
+        _lag_monitor_task = None
+
+
+def get_task_events_stats() -> dict:
+    return {
+        "subscribed_projects": len(_project_waiters),
+        "streams": sum(len(waiters) for waiters in _project_waiters.values()),
+        **_stats,
+    }
@@ -6,37 +6,296 @@
 2. 存储任务向量到 pgvector
 3. 检索相似任务
 """
+import asyncio
 import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 from datetime import datetime
 import hashlib
+import json
 import math
 import re
-from difflib import SequenceMatcher
+from collections import OrderedDict
+from functools import lru_cache
 from importlib.metadata import PackageNotFoundError, version as pkg_version
 
-from pgvector.asyncpg import register_vector
 import asyncpg
-
-from app.core.config import DB_HOST, DB_PORT, DB_USER, DB_PASSWORD, DB_NAME
+import numpy as np
+
+from tortoise import Tortoise, connections
+from tortoise.exceptions import ConfigurationError
+
+from app.core.config import (
+    EMBEDDING_BACKEND,
+    EMBEDDING_ONNX_MODEL_DIR,
+    EMBEDDING_ONNX_MODEL_FILE,
+    EMBEDDING_ONNX_THREADS,
+    EMBEDDING_EXECUTOR_WORKERS,
+    EMBEDDING_QUEUE_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_PRELOAD,
+    VECTOR_INDEX_TYPE,
+    VECTOR_HNSW_M,
+    VECTOR_HNSW_EF_CONSTRUCTION,
+    VECTOR_HNSW_EF_SEARCH,
+    VECTOR_IVFFLAT_LISTS,
+    VECTOR_IVFFLAT_PROBES,
+    VECTOR_HNSW_ITERATIVE_SCAN,
+    VECTOR_STORAGE,
+    VECTOR_INDEX_QUANTIZATION,
+    VECTOR_BINARY_RERANK_FACTOR,
+    SIMILARITY_HYBRID_CANDIDATE_FACTOR,
+    SIMILARITY_HYBRID_LATENCY_BUDGET_MS,
+    SIMILARITY_HYBRID_RRF_K,
+    SIMILARITY_CACHE_NOTIFY_ENABLED,
+    SIMILARITY_RESULT_CACHE_SIZE,
+    SIMILARITY_RESULT_CACHE_TTL_SECONDS,
+)
+from app.services.notifications import publish_notification, subscribe_notifications
 
 logger = logging.getLogger(__name__)
 
 # Embedding 模型（使用轻量级模型，本地运行）
 _EMBEDDING_MODEL = None
-_EMBEDDING_BACKEND = "sentence_transformers"
+_EMBEDDING_BACKEND = EMBEDDING_BACKEND
+_EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 _EMBEDDING_DIM = 384  # all-MiniLM-L6-v2 的维度
+_EMBEDDING_MAX_SEQ_LENGTH = 256  # 与 sentence-transformers 中该模型的 max_seq_length 一致
+_HASH_EMBEDDING_MODEL_ID = "hash:v1"
+LEGACY_EMBEDDING_MODEL_ID = "legacy"  # 记录模型标识之前写入、来源后端未知的向量
+_LEGACY_SAMPLE_SIZE = 16  # 认领 legacy 向量前抽样重新 encode 的任务数
+_LEGACY_MATCH_SIMILARITY = 0.99  # 重新 encode 的向量与 legacy 向量的余弦相似度达到该值视为同一模型生成
+_LEGACY_MATCH_RATIO = 0.8  # 抽样中一致的比例达到该值即认领（其余多为写入向量后又被修改的任务）
+_LEGACY_RECHECK_SECONDS = 30.0  # legacy 向量未覆盖期间，检索侧复查覆盖情况的间隔
 _MAX_TEXT_LENGTH = 2000  # 最大文本长度限制
+_HASH_TOKEN_CACHE_SIZE = 65536  # hash embedding 的 token -> (下标, 符号) 缓存条数
+_HASH_INLINE_MAX_TEXTS = 32  # 超过该条数的 hash embedding 批量计算放到线程池
+_VECTOR_INDEX_NAME = "idx_task_embeddings_vector"
+# 文本检索使用的表达式（需与 trigram 索引表达式保持一致才能命中索引）
+_TASK_SEARCH_TEXT_SQL = "lower(t.title || ' ' || coalesce(t.description, ''))"
+# search_similar_tasks 支持的检索方式
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+VECTOR_STORAGE_TYPES = ("vector", "halfvec")
+VECTOR_INDEX_QUANTIZATIONS = ("none", "binary")
+# task_embeddings.embedding 的实际列类型（init_pgvector 从数据库读取，未初始化时取配置）
+_embedding_storage = VECTOR_STORAGE if VECTOR_STORAGE in VECTOR_STORAGE_TYPES else "vector"
+
+_EMBEDDING_MODEL_LOCK = threading.Lock()
+
+
+class EmbeddingQueueFullError(RuntimeError):
+    """embedding 推理队列已满（调用方按 RuntimeError 降级处理）"""
+
+
+class _SearchQueryFailed(Exception):
+    """相似检索的数据库查询失败（search_similar_tasks 降级为空结果，且不写入缓存）"""
+
+
+class _OnnxEmbeddingModel:
+    """
+    onnxruntime 推理的 MiniLM（CPU），encode 接口与 SentenceTransformer 一致
+
+    使用与 sentence-transformers 相同的 tokenizer.json 分词，模型输出 token 向量后
+    按 attention mask 做均值池化，再 L2 归一化，与 PyTorch 版输出对齐。
+    """
 
-# 数据库连接池
-_db_pool: Optional[asyncpg.Pool] = None
+    def __init__(self, session, tokenizer, max_seq_length: int = _EMBEDDING_MAX_SEQ_LENGTH):
+        self.session = session
+        self.tokenizer = tokenizer
+        self.input_names = {item.name for item in session.get_inputs()}
+        tokenizer.enable_truncation(max_length=max_seq_length)
+        # 只补齐到本批最长文本，短文本批次不按 max_seq_length 计算
+        tokenizer.enable_padding()
+
+    @classmethod
+    def load(cls, model_dir: str, model_file: str, num_threads: int = 0) -> "_OnnxEmbeddingModel":
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads > 0:
+            options.intra_op_num_threads = num_threads
+        session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        return cls(session, Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json")))
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(list(texts))
+        attention_mask = np.asarray([item.attention_mask for item in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.asarray([item.ids for item in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([item.type_ids for item in encodings], dtype=np.int64)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[:, :, None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if normalize_embeddings:
+            embeddings = embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings.astype(np.float32)
+
+
+class _EmbeddingCache:
+    """按最近使用淘汰的 文本 -> 向量 缓存（仅在事件循环线程内访问）"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max(0, max_size)
+        self._items: "OrderedDict[tuple[str, str], List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple[str, str]) -> Optional[List[float]]:
+        value = self._items.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple[str, str], value: List[float]):
+        if self.max_size <= 0:
+            return
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# 查询文本 embedding 缓存（前端输入时会反复发起相同查询）
+_query_embedding_cache = _EmbeddingCache(EMBEDDING_CACHE_SIZE)
+
+
+class _SearchResultCache:
+    """带有效期的相似检索结果缓存，可按项目失效（仅在事件循环线程内访问）"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max(0, max_size)
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[tuple, tuple[float, List[dict]]]" = OrderedDict()
+        # 每次失效递增；查询开始后发生过失效的结果不再写入缓存
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key: tuple) -> Optional[List[dict]]:
+        entry = self._items.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: tuple, value: List[dict], generation: int):
+        if self.max_size <= 0 or self.ttl_seconds <= 0 or generation != self.generation:
+            return
+        self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, project_ids=None):
+        """失效与给定项目相关的缓存（未限定项目范围的查询一并失效）；不传项目时全部清空"""
+        self.generation += 1
+        if project_ids is None:
+            self._items.clear()
+            return
+        changed = set(project_ids)
+        for key in [key for key in self._items if key[2] is None or changed.intersection(key[2])]:
+            del self._items[key]
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+# 相似检索结果缓存与进行中的查询（相同查询并发到达时共享同一次 embedding + 数据库往返）
+_search_result_cache = _SearchResultCache(SIMILARITY_RESULT_CACHE_SIZE, SIMILARITY_RESULT_CACHE_TTL_SECONDS)
+_inflight_searches: "dict[tuple, asyncio.Future]" = {}
+
+SIMILARITY_INVALIDATION_CHANNEL = "cortex_similarity_invalidation"
+# 本进程标识：忽略自己发出的失效通知
+_ORIGIN = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_invalidations = {"local": 0, "remote": 0, "publish_failed": 0}
+
+# embedding 推理线程池（模型 encode 是 CPU 密集的同步调用，不能直接跑在事件循环里）
+_embedding_executor: Optional[ThreadPoolExecutor] = None
+_embedding_batcher: Optional["_EmbeddingBatcher"] = None
+_embedding_pending = 0
+_embedding_metrics = {
+    "submitted": 0,
+    "completed": 0,
+    "rejected": 0,
+    "failed": 0,
+    "max_pending": 0,
+    "batches": 0,
+    "batched_texts": 0,
+    "max_batch_size": 0,
+    "encode_seconds_total": 0.0,
+}
+
+# 模型加载 / 预热状态（not_loaded -> loading -> ready；hash 后端为 fallback，预热 encode 失败为 failed）
+_embedding_model_status = {
+    "state": "not_loaded",
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "error": None,
+}
+
+# 是否由本模块初始化了 Tortoise（仅脚本场景；应用内由 register_tortoise 管理生命周期）
+_owns_tortoise = False
+
+# 是否仍有任务只有 legacy 向量（缺当前模型版本）；为 True 时向量检索按 hybrid 执行，由文本召回这些任务
+_legacy_embedding_state = {"pending": False, "checked_at": 0.0}
 
 
 def get_embedding_model():
-    """获取 embedding 模型（懒加载）"""
+    """获取 embedding 模型（懒加载，线程安全）"""
+    if _EMBEDDING_BACKEND == "hash":
+        return None
+    if _EMBEDDING_MODEL is None:
+        with _EMBEDDING_MODEL_LOCK:
+            return _load_embedding_model()
+    return _EMBEDDING_MODEL
+
+
+def _load_embedding_model():
     global _EMBEDDING_MODEL, _EMBEDDING_BACKEND
     if _EMBEDDING_BACKEND == "hash":
         return None
+    if _EMBEDDING_MODEL is None and _EMBEDDING_BACKEND == "onnx":
+        try:
+            _EMBEDDING_MODEL = _OnnxEmbeddingModel.load(
+                EMBEDDING_ONNX_MODEL_DIR, EMBEDDING_ONNX_MODEL_FILE, EMBEDDING_ONNX_THREADS
+            )
+        except Exception as e:
+            logger.warning("ONNX embedding 模型加载失败，切换到 hash embedding fallback: %s", e)
+            _EMBEDDING_BACKEND = "hash"
+            return None
     if _EMBEDDING_MODEL is None:
         try:
             torch_version = pkg_version("torch")
@@ -60,7 +319,7 @@ def get_embedding_model():
 
         try:
             from sentence_transformers import SentenceTransformer
-            _EMBEDDING_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
+            _EMBEDDING_MODEL = SentenceTransformer(_EMBEDDING_MODEL_NAME)
         except Exception as e:
             logger.warning("sentence-transformers 初始化失败，切换到 hash embedding fallback: %s", e)
             _EMBEDDING_BACKEND = "hash"
@@ -68,51 +327,329 @@ def get_embedding_model():
     return _EMBEDDING_MODEL
 
 
+def preload_embedding_model():
+    """
+    只加载模型、不做 encode（供 gunicorn preload 在 master 进程 fork 前调用）
+
+    模型权重在 fork 后以写时复制的方式被各 worker 共享；推理线程池在 master 中
+    尚未启动，避免 fork 继承已运行的线程。
+    """
+    if _EMBEDDING_MODEL is not None or _EMBEDDING_BACKEND == "hash":
+        return _EMBEDDING_MODEL
+    _embedding_model_status["state"] = "loading"
+    started = time.perf_counter()
+    model = get_embedding_model()
+    _embedding_model_status["load_seconds"] = round(time.perf_counter() - started, 3)
+    _embedding_model_status["state"] = "loaded" if model is not None else "fallback"
+    return model
+
+
+def _warm_up_embedding_model():
+    """在线程池中执行：加载模型并 encode 一条文本，完成 CUDA/线程池等首次推理的初始化"""
+    model = preload_embedding_model()
+    if model is None:
+        return
+    started = time.perf_counter()
+    try:
+        model.encode(["warm up"], normalize_embeddings=True)
+    except Exception as e:
+        _embedding_model_status.update(state="failed", error=str(e))
+        logger.warning("embedding 模型预热失败: %s", e)
+        return
+    _embedding_model_status.update(
+        state="ready",
+        warmup_seconds=round(time.perf_counter() - started, 3),
+        error=None,
+    )
+
+
+async def warm_up_embedding_model() -> dict:
+    """加载并预热 embedding 模型（应用启动时调用），返回模型状态"""
+    await _run_in_embedding_executor(_warm_up_embedding_model)
+    status = get_embedding_model_status()
+    logger.info("embedding 模型预热完成: %s", status)
+    return status
+
+
+def get_embedding_model_status() -> dict:
+    """
+    embedding 模型就绪状态（供就绪检查使用）
+
+    hash 后端无需加载模型，视为就绪；关闭预加载（EMBEDDING_PRELOAD=false）时模型在首次请求时加载，
+    不影响就绪状态。
+    """
+    state = _embedding_model_status["state"]
+    return {
+        **_embedding_model_status,
+        "state": "fallback" if _EMBEDDING_BACKEND == "hash" else state,
+        "ready": _EMBEDDING_BACKEND == "hash" or state == "ready" or (not EMBEDDING_PRELOAD and state != "loading"),
+        "backend": _EMBEDDING_BACKEND,
+        "model_id": get_embedding_model_id(),
+        "legacy_pending": _legacy_embedding_state["pending"],
+    }
+
+
+def get_embedding_model_id() -> str:
+    """当前 embedding 后端/模型标识（写入 task_embeddings.model_id，用于判断向量是否需要重新生成）"""
+    if _EMBEDDING_BACKEND == "hash":
+        return _HASH_EMBEDDING_MODEL_ID
+    if _EMBEDDING_BACKEND == "onnx":
+        # fp32 / int8 量化的向量与 PyTorch 版存在细微差异，按文件区分，切换后由 outbox / 回填重新生成
+        return f"onnx:{_EMBEDDING_MODEL_NAME}:{os.path.splitext(EMBEDDING_ONNX_MODEL_FILE)[0]}"
+    return f"{_EMBEDDING_BACKEND}:{_EMBEDDING_MODEL_NAME}"
+
+
+def compute_content_hash(text: str) -> str:
+    """embedding 输入文本的内容哈希（与截断后的实际输入一致）"""
+    return hashlib.sha256(_truncate_text(text).encode("utf-8")).hexdigest()
+
+
 def _tokenize_text(text: str) -> List[str]:
     tokens = re.findall(r"[a-zA-Z0-9_]+|[\u4e00-\u9fff]+", text.lower())
     return tokens or [text.lower()]
 
 
-def _generate_hash_embedding(text: str) -> List[float]:
+@lru_cache(maxsize=_HASH_TOKEN_CACHE_SIZE)
+def _hash_token(token: str) -> tuple[int, float]:
+    """token -> (向量下标, 符号)，结果按 token 缓存"""
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    index = int.from_bytes(digest[:4], "big") % _EMBEDDING_DIM
+    sign = 1.0 if digest[4] % 2 == 0 else -1.0
+    return index, sign
+
+
+def _generate_hash_embeddings(texts: List[str]) -> List[List[float]]:
     """
-    无第三方模型依赖的兜底 embedding。
+    无第三方模型依赖的兜底 embedding（批量）。
     使用哈希 trick 生成固定维度向量并做 L2 归一化。
+
+    各分量累加的都是 ±1，求和与范数均为精确整数运算，结果与逐条计算逐位一致。
     """
-    vector = [0.0] * _EMBEDDING_DIM
-    for token in _tokenize_text(text):
-        digest = hashlib.sha256(token.encode("utf-8")).digest()
-        index = int.from_bytes(digest[:4], "big") % _EMBEDDING_DIM
-        sign = 1.0 if digest[4] % 2 == 0 else -1.0
-        vector[index] += sign
+    row_indexes: List[int] = []
+    column_indexes: List[int] = []
+    signs: List[float] = []
+    for row, text in enumerate(texts):
+        for token in _tokenize_text(text):
+            index, sign = _hash_token(token)
+            row_indexes.append(row)
+            column_indexes.append(index)
+            signs.append(sign)
+
+    matrix = np.zeros((len(texts), _EMBEDDING_DIM), dtype=np.float64)
+    if signs:
+        np.add.at(matrix, (np.asarray(row_indexes), np.asarray(column_indexes)), np.asarray(signs))
+
+    norms = np.sqrt(np.einsum("ij,ij->i", matrix, matrix))
+    nonzero = norms > 0
+    matrix[nonzero] /= norms[nonzero, None]
+    return matrix.tolist()
 
-    norm = math.sqrt(sum(v * v for v in vector))
-    if norm > 0:
-        vector = [v / norm for v in vector]
-    return vector
 
+def _generate_hash_embedding(text: str) -> List[float]:
+    """单条文本的 hash embedding"""
+    return _generate_hash_embeddings([text])[0]
 
-async def get_db_pool() -> asyncpg.Pool:
-    """获取数据库连接池（懒加载）"""
-    global _db_pool
-    if _db_pool is None:
-        _db_pool = await asyncpg.create_pool(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            min_size=2,
-            max_size=10,
+
+def get_embedding_executor() -> ThreadPoolExecutor:
+    """获取 embedding 推理线程池（懒加载）"""
+    global _embedding_executor
+    if _embedding_executor is None:
+        _embedding_executor = ThreadPoolExecutor(
+            max_workers=max(1, EMBEDDING_EXECUTOR_WORKERS),
+            thread_name_prefix="embedding",
+        )
+    return _embedding_executor
+
+
+def shutdown_embedding_executor(wait: bool = True):
+    """关闭 embedding 推理线程池"""
+    global _embedding_executor
+    if _embedding_executor is not None:
+        _embedding_executor.shutdown(wait=wait)
+        _embedding_executor = None
+
+
+def get_embedding_metrics() -> dict:
+    """embedding 线程池 / 微批运行指标（供健康检查/监控使用）"""
+    batches = _embedding_metrics["batches"]
+    return {
+        **_embedding_metrics,
+        "encode_seconds_total": round(_embedding_metrics["encode_seconds_total"], 3),
+        "avg_batch_size": round(_embedding_metrics["batched_texts"] / batches, 2) if batches else 0.0,
+        "pending": _embedding_pending,
+        "workers": max(1, EMBEDDING_EXECUTOR_WORKERS),
+        "queue_max_size": EMBEDDING_QUEUE_MAX_SIZE,
+        "batch_max_size": EMBEDDING_BATCH_MAX_SIZE,
+        "batch_max_wait_ms": EMBEDDING_BATCH_MAX_WAIT_MS,
+        "query_cache_size": len(_query_embedding_cache),
+        "query_cache_hits": _query_embedding_cache.hits,
+        "query_cache_misses": _query_embedding_cache.misses,
+        "backend": _EMBEDDING_BACKEND,
+        "model_id": get_embedding_model_id(),
+    }
+
+
+def _encode_texts(model, texts: List[str]) -> tuple[List[List[float]], float]:
+    """在线程池中执行：批量 encode 并返回耗时"""
+    started = time.perf_counter()
+    embeddings = model.encode(texts, normalize_embeddings=True)
+    return [embedding.tolist() for embedding in embeddings], time.perf_counter() - started
+
+
+async def _run_in_embedding_executor(func, *args):
+    """将同步函数提交到 embedding 线程池执行"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_embedding_executor(), func, *args)
+
+
+class _EmbeddingBatcher:
+    """
+    embedding 动态微批
+
+    在 max_wait_ms 内（或攒满 max_batch_size 条）合并并发的 encode 请求，
+    一次 model.encode([...]) 后再把结果分发回各个等待中的协程。
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.loop = asyncio.get_running_loop()
+        self._pending: List[tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._running: set[asyncio.Task] = set()
+
+    async def submit(self, texts: List[str]) -> List[List[float]]:
+        """
+        提交一组文本并等待其 embedding
+
+        Raises:
+            EmbeddingQueueFullError: 等待中的文本数超过 EMBEDDING_QUEUE_MAX_SIZE 时抛出
+        """
+        global _embedding_pending
+        if _embedding_pending + len(texts) > EMBEDDING_QUEUE_MAX_SIZE:
+            _embedding_metrics["rejected"] += len(texts)
+            raise EmbeddingQueueFullError("embedding 请求排队过多，请稍后重试")
+
+        _embedding_pending += len(texts)
+        _embedding_metrics["submitted"] += len(texts)
+        _embedding_metrics["max_pending"] = max(_embedding_metrics["max_pending"], _embedding_pending)
+
+        futures = []
+        for text in texts:
+            future = self.loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.max_wait, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = self.loop.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[tuple[str, asyncio.Future]]):
+        global _embedding_pending
+        texts = [text for text, _ in batch]
+        try:
+            embeddings, elapsed = await _run_in_embedding_executor(_encode_texts, _EMBEDDING_MODEL, texts)
+        except Exception as e:
+            _embedding_metrics["failed"] += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            _embedding_pending -= len(batch)
+
+        _embedding_metrics["completed"] += len(batch)
+        _embedding_metrics["batches"] += 1
+        _embedding_metrics["batched_texts"] += len(batch)
+        _embedding_metrics["max_batch_size"] = max(_embedding_metrics["max_batch_size"], len(batch))
+        _embedding_metrics["encode_seconds_total"] += elapsed
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+def _get_embedding_batcher() -> _EmbeddingBatcher:
+    """获取当前事件循环上的微批器（每个事件循环一个实例）"""
+    global _embedding_batcher
+    loop = asyncio.get_running_loop()
+    if _embedding_batcher is None or _embedding_batcher.loop is not loop:
+        _embedding_batcher = _EmbeddingBatcher(
+            max_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+            max_wait_ms=EMBEDDING_BATCH_MAX_WAIT_MS,
         )
-    return _db_pool
+    return _embedding_batcher
+
+
+async def get_db_pool() -> asyncpg.Pool:
+    """
+    获取与 Tortoise ORM 共用的 asyncpg 连接池
+
+    应用内由 register_tortoise 建立连接；运维脚本等未初始化 ORM 的场景在此按 TORTOISE_ORM 初始化。
+    连接在建立时已由 init_db_connection 注册 vector 类型。
+    """
+    global _owns_tortoise
+    # 延迟导入：缺少 DATABASE_URL 时 app.db 导入即报错
+    from app.db import TORTOISE_ORM, get_shared_db_pool
+
+    pool = get_shared_db_pool()
+    if pool is not None:
+        return pool
+    try:
+        connections.db_config
+    except ConfigurationError:
+        await Tortoise.init(config=TORTOISE_ORM)
+        _owns_tortoise = True
+    # Tortoise 在首次 acquire 时才创建连接池
+    async with connections.get("default").acquire_connection():
+        pass
+    return get_shared_db_pool()
+
+
+def get_db_pool_stats() -> dict:
+    """连接池使用情况（供监控接口展示）"""
+    from app.db import get_shared_db_pool
+
+    pool = get_shared_db_pool()
+    if pool is None:
+        return {"initialized": False}
+    size = pool.get_size()
+    idle = pool.get_idle_size()
+    return {
+        "initialized": True,
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+    }
 
 
 async def close_db_pool():
-    """关闭数据库连接池"""
-    global _db_pool
-    if _db_pool:
-        await _db_pool.close()
-        _db_pool = None
+    """关闭由本模块初始化的连接（应用内的连接池由 Tortoise 生命周期负责关闭）"""
+    global _owns_tortoise
+    if _owns_tortoise:
+        await Tortoise.close_connections()
+        _owns_tortoise = False
+
+
+def build_task_embedding_text(title: str, description: Optional[str]) -> str:
+    """拼接任务用于 embedding 的文本（标题 + 描述）"""
+    return f"{title}\n{description or ''}"
 
 
 def _truncate_text(text: str, max_length: int = _MAX_TEXT_LENGTH) -> str:
@@ -122,34 +659,113 @@ def _truncate_text(text: str, max_length: int = _MAX_TEXT_LENGTH) -> str:
     return text[:max_length] + "..."
 
 
-async def generate_embedding(text: str) -> List[float]:
+async def _generate_hash_embeddings_async(texts: List[str]) -> List[List[float]]:
+    """批量较大时 hash embedding 也放到线程池计算，避免阻塞事件循环"""
+    if len(texts) <= _HASH_INLINE_MAX_TEXTS:
+        return _generate_hash_embeddings(texts)
+    return await _run_in_embedding_executor(_generate_hash_embeddings, texts)
+
+
+async def generate_embeddings(texts: List[str]) -> List[List[float]]:
     """
-    生成文本的 embedding 向量
+    批量生成文本的 embedding 向量（供 outbox worker / 重建索引等批量场景使用）
+
+    模型后端按 EMBEDDING_BATCH_MAX_SIZE 分块提交到微批器，结果顺序与输入一致。
 
     Args:
-        text: 输入文本（任务标题 + 描述）
+        texts: 输入文本列表
 
     Returns:
-        embedding 向量
+        embedding 向量列表
 
     Raises:
-        RuntimeError: 生成 embedding 失败时抛出
+        RuntimeError: 生成 embedding 失败或推理队列已满时抛出
     """
     # 截断过长的文本
-    text = _truncate_text(text)
+    texts = [_truncate_text(text) for text in texts]
+    if not texts:
+        return []
 
-    global _EMBEDDING_BACKEND
-    model = get_embedding_model()
+    if _EMBEDDING_BACKEND == "hash":
+        return await _generate_hash_embeddings_async(texts)
+
+    # 模型首次加载（import torch + 读取权重）同样耗时，放到线程池里完成
+    model = _EMBEDDING_MODEL or await _run_in_embedding_executor(get_embedding_model)
     if model is None:
-        return _generate_hash_embedding(text)
+        return await _generate_hash_embeddings_async(texts)
 
+    chunk_size = max(1, min(EMBEDDING_BATCH_MAX_SIZE, EMBEDDING_QUEUE_MAX_SIZE))
     try:
-        embedding = model.encode(text, normalize_embeddings=True)
-        return embedding.tolist()
+        embeddings: List[List[float]] = []
+        for start in range(0, len(texts), chunk_size):
+            embeddings.extend(await _get_embedding_batcher().submit(texts[start:start + chunk_size]))
+        return embeddings
+    except EmbeddingQueueFullError:
+        raise
     except Exception as e:
-        logger.warning("生成 embedding 失败，切换到 hash embedding fallback: %s", e)
-        _EMBEDDING_BACKEND = "hash"
-        return _generate_hash_embedding(text)
+        # 不在运行中切换到 hash：hash 向量与已存储的模型向量不可比，混入后检索结果失真。
+        # 调用方按 RuntimeError 降级（检索返回失败提示，outbox 退避重试）
+        logger.warning("生成 embedding 失败: %s", e)
+        raise RuntimeError(f"生成 embedding 失败: {e}") from e
+
+
+async def generate_embedding(text: str) -> List[float]:
+    """
+    生成文本的 embedding 向量
+
+    Args:
+        text: 输入文本（任务标题 + 描述）
+
+    Returns:
+        embedding 向量
+
+    Raises:
+        RuntimeError: 生成 embedding 失败或推理队列已满时抛出
+    """
+    embeddings = await generate_embeddings([text])
+    return embeddings[0]
+
+
+async def get_query_embedding(text: str) -> List[float]:
+    """
+    生成检索用的查询向量，命中 LRU 缓存时不调用模型
+
+    Raises:
+        RuntimeError: 生成 embedding 失败或推理队列已满时抛出
+    """
+    truncated = _truncate_text(text)
+    cached = _query_embedding_cache.get((get_embedding_model_id(), truncated))
+    if cached is not None:
+        return cached
+
+    embedding = await generate_embedding(truncated)
+    # 生成过程中可能降级到 hash 后端，按生成后的模型标识写入缓存
+    _query_embedding_cache.put((get_embedding_model_id(), truncated), embedding)
+    return embedding
+
+
+def _build_scope_filter(
+    project_column: str,
+    organization_column: str,
+    project_ids: Optional[List[int]],
+    organization_id: Optional[int],
+    start_index: int,
+) -> tuple[str, list]:
+    """
+    生成租户范围过滤条件（只拼接实际传入的条件，便于规划器选用 project_id/organization_id 索引）
+
+    Returns:
+        (SQL 片段, 参数列表)，参数占位符从 $start_index 开始编号
+    """
+    clauses = []
+    params: list = []
+    if project_ids is not None:
+        params.append(list(project_ids))
+        clauses.append(f"AND {project_column} = ANY(${start_index + len(params) - 1}::int[])")
+    if organization_id is not None:
+        params.append(organization_id)
+        clauses.append(f"AND {organization_column} = ${start_index + len(params) - 1}")
+    return "\n".join(clauses), params
 
 
 async def _search_similar_tasks_by_text(
@@ -158,11 +774,25 @@ async def _search_similar_tasks_by_text(
     exclude_task_id: Optional[int] = None,
     limit: int = 5,
     threshold: float = 0.5,
+    project_ids: Optional[List[int]] = None,
+    organization_id: Optional[int] = None,
 ) -> List[dict]:
     """
-    在 embedding 模型不可用时，使用纯文本相似度兜底。
+    在 embedding 模型不可用时，使用 pg_trgm 文本相似度兜底。
+
+    在 Postgres 内通过 GIN trigram 索引召回并排序，覆盖全部任务：
+    - 标题：similarity(query, title)
+    - 标题 + 描述：word_similarity(query, 全文)，取全文中最相近的片段，避免长描述稀释
+    最终相似度取两者较大值。
     """
-    sql = """
+    query_text = " ".join(text_content.split()).lower()
+    if not query_text:
+        return []
+
+    scope_sql, scope_params = _build_scope_filter(
+        "t.project_id", "p.organization_id", project_ids, organization_id, start_index=4
+    )
+    sql = f"""
         SELECT
             t.id AS task_id,
             t.title,
@@ -170,29 +800,29 @@ async def _search_similar_tasks_by_text(
             t.status,
             t.priority,
             t.project_id,
-            t.created_at
+            t.created_at,
+            GREATEST(
+                similarity($1, lower(t.title)),
+                word_similarity($1, {_TASK_SEARCH_TEXT_SQL})
+            ) AS similarity
         FROM tasks t
-        WHERE t.id != $1
+        JOIN projects p ON p.id = t.project_id
+        WHERE t.id != $2
             AND (t.deleted_at IS NULL)
-        ORDER BY t.updated_at DESC, t.id DESC
-        LIMIT 500
+            AND (lower(t.title) % $1 OR $1 <% {_TASK_SEARCH_TEXT_SQL})
+            {scope_sql}
+        ORDER BY similarity DESC, t.id DESC
+        LIMIT $3
     """
-    rows = await conn.fetch(sql, exclude_task_id or 0)
-    query_text = " ".join(text_content.split()).lower()
-    if not query_text:
-        return []
+    async with conn.transaction():
+        # % / <% 运算符按会话阈值过滤（走 GIN 索引），阈值与请求一致
+        await conn.execute("SELECT set_config('pg_trgm.similarity_threshold', $1, true)", str(threshold))
+        await conn.execute("SELECT set_config('pg_trgm.word_similarity_threshold', $1, true)", str(threshold))
+        rows = await conn.fetch(sql, query_text, exclude_task_id or 0, limit, *scope_params)
 
     results = []
     for row in rows:
-        title_text = " ".join((row["title"] or "").split()).lower()
-        description_text = " ".join((row["description"] or "").split()).lower()
-        candidate_text = f"{title_text} {description_text}".strip()
-        if not candidate_text:
-            continue
-
-        full_similarity = SequenceMatcher(None, query_text, candidate_text).ratio()
-        title_similarity = SequenceMatcher(None, query_text, title_text).ratio() if title_text else 0.0
-        similarity = max(full_similarity, title_similarity)
+        similarity = float(row["similarity"])
         if similarity < threshold:
             continue
         results.append({
@@ -205,9 +835,66 @@ async def _search_similar_tasks_by_text(
             "similarity": round(similarity, 3),
             "created_at": row["created_at"].isoformat() if row["created_at"] else None,
         })
+    return results
+
+
+def _ivfflat_lists_for_rows(row_count: int) -> int:
+    """
+    按行数推导 ivfflat lists（pgvector 建议：100 万行以内 rows/1000，超过后 sqrt(rows)）
+    """
+    if VECTOR_IVFFLAT_LISTS > 0:
+        return VECTOR_IVFFLAT_LISTS
+    if row_count <= 1_000_000:
+        return max(1, row_count // 1000)
+    return int(math.sqrt(row_count))
+
+
+def _embedding_query_sql(param_sql: str) -> str:
+    """查询向量在 SQL 中的表达式（参数始终以 vector 传入，halfvec 存储时在库内转换）"""
+    if _embedding_storage == "halfvec":
+        return f"{param_sql}::vector::halfvec({_EMBEDDING_DIM})"
+    return f"{param_sql}::vector"
+
+
+def _build_vector_index_sql(
+    index_name: str,
+    index_type: str,
+    row_count: int = 0,
+    concurrently: bool = False,
+    quantization: Optional[str] = None,
+) -> str:
+    """
+    生成 task_embeddings 向量索引 DDL
 
-    results.sort(key=lambda item: item["similarity"], reverse=True)
-    return results[:limit]
+    Args:
+        index_name: 索引名
+        index_type: hnsw / ivfflat
+        row_count: 当前行数（ivfflat 自动推导 lists 使用）
+        concurrently: 是否使用 CREATE INDEX CONCURRENTLY（不能在事务中执行）
+        quantization: none / binary，默认 VECTOR_INDEX_QUANTIZATION
+    """
+    quantization = quantization or VECTOR_INDEX_QUANTIZATION
+    if quantization == "binary":
+        # 表达式需与 _build_ann_match_sql 中的排序表达式完全一致才能命中索引
+        target = f"(binary_quantize(embedding)::bit({_EMBEDDING_DIM})) bit_hamming_ops"
+    elif quantization == "none":
+        target = f"embedding {_embedding_storage}_cosine_ops"
+    else:
+        raise ValueError(f"不支持的向量索引量化方式: {quantization}")
+    create = "CREATE INDEX CONCURRENTLY" if concurrently else "CREATE INDEX"
+    if index_type == "hnsw":
+        method = "hnsw"
+        options = f"m = {VECTOR_HNSW_M}, ef_construction = {VECTOR_HNSW_EF_CONSTRUCTION}"
+    elif index_type == "ivfflat":
+        method = "ivfflat"
+        options = f"lists = {_ivfflat_lists_for_rows(row_count)}"
+    else:
+        raise ValueError(f"不支持的向量索引类型: {index_type}")
+    return (
+        f"{create} IF NOT EXISTS {index_name} "
+        f"ON task_embeddings USING {method} ({target}) "
+        f"WITH ({options})"
+    )
 
 
 async def init_pgvector():
@@ -215,33 +902,458 @@ async def init_pgvector():
     初始化 pgvector 扩展和表结构
 
     需要在 PostgreSQL 中先执行: CREATE EXTENSION IF NOT EXISTS vector;
+    同时创建 pg_trgm 扩展与 tasks 上的 trigram 索引（文本兜底检索使用）。
+    向量索引类型由 VECTOR_INDEX_TYPE 配置（hnsw / ivfflat），已存在时不会重建，
+    切换类型或调整参数请使用 rebuild_vector_index()。
     """
+    global _embedding_storage
     pool = await get_db_pool()
+    storage = VECTOR_STORAGE if VECTOR_STORAGE in VECTOR_STORAGE_TYPES else "vector"
 
     async with pool.acquire() as conn:
-        # 注册 vector 类型
-        await register_vector(conn)
-
-        # 创建任务向量表
-        await conn.execute("""
+        # 创建任务向量表（文本不再冗余存储，检索结果直接关联 tasks）
+        await conn.execute(f"""
             CREATE TABLE IF NOT EXISTS task_embeddings (
                 id SERIAL PRIMARY KEY,
-                task_id INTEGER NOT NULL UNIQUE,
-                embedding vector(384),
-                text_content TEXT,
+                task_id INTEGER NOT NULL,
+                embedding {storage}({_EMBEDDING_DIM}),
                 created_at TIMESTAMP DEFAULT NOW(),
                 updated_at TIMESTAMP DEFAULT NOW()
             )
         """)
+        await conn.execute("ALTER TABLE task_embeddings DROP COLUMN IF EXISTS text_content")
+        column_type = await conn.fetchval("""
+            SELECT format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = 'task_embeddings'::regclass AND attname = 'embedding'
+        """)
+        _embedding_storage = "halfvec" if str(column_type).startswith("halfvec") else "vector"
+        if _embedding_storage != storage:
+            logger.warning(
+                "task_embeddings.embedding 当前为 %s，与 VECTOR_STORAGE=%s 不一致，"
+                "请执行 python -m app.scripts.vector_admin storage 迁移",
+                column_type,
+                VECTOR_STORAGE,
+            )
+
+        # 租户范围列（冗余自 tasks/projects，检索时直接在向量表上过滤）
+        await conn.execute("""
+            ALTER TABLE task_embeddings
+                ADD COLUMN IF NOT EXISTS project_id INTEGER,
+                ADD COLUMN IF NOT EXISTS organization_id INTEGER
+        """)
+        # 内容哈希 + 模型标识（后端:模型名[:文件]）+ 维度：内容与模型都未变化时跳过重新 encode
+        await conn.execute("""
+            ALTER TABLE task_embeddings
+                ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64),
+                ADD COLUMN IF NOT EXISTS model_id VARCHAR(128),
+                ADD COLUMN IF NOT EXISTS embedding_dim SMALLINT
+        """)
+        # 同一任务可同时保留多个模型版本的向量（切换模型时在线迁移），检索只使用当前模型的版本。
+        # 记录模型标识之前写入的向量无法确定由哪个后端生成（此时模型尚未预热，后端可能回退），
+        # 先标记为 legacy，模型就绪后由 adopt_legacy_embeddings() 抽样核对来源再认领或重新生成
+        await conn.execute("""
+            UPDATE task_embeddings
+            SET model_id = COALESCE(model_id, $1), embedding_dim = COALESCE(embedding_dim, $2)
+            WHERE model_id IS NULL OR embedding_dim IS NULL
+        """, LEGACY_EMBEDDING_MODEL_ID, _EMBEDDING_DIM)
+        _legacy_embedding_state["pending"] = await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM task_embeddings WHERE model_id = $1)",
+            LEGACY_EMBEDDING_MODEL_ID,
+        )
+        _legacy_embedding_state["checked_at"] = time.monotonic()
+        await conn.execute("ALTER TABLE task_embeddings DROP CONSTRAINT IF EXISTS task_embeddings_task_id_key")
+        await conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS uq_task_embeddings_task_model
+            ON task_embeddings (task_id, model_id)
+        """)
+        await conn.execute("""
+            UPDATE task_embeddings te
+            SET project_id = t.project_id, organization_id = p.organization_id
+            FROM tasks t
+            LEFT JOIN projects p ON p.id = t.project_id
+            WHERE te.task_id = t.id AND te.project_id IS NULL
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_task_embeddings_project_id
+            ON task_embeddings (project_id)
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_task_embeddings_organization_project
+            ON task_embeddings (organization_id, project_id)
+        """)
 
         # 创建索引
+        row_count = await conn.fetchval("SELECT COUNT(*) FROM task_embeddings")
+        await conn.execute(_build_vector_index_sql(_VECTOR_INDEX_NAME, VECTOR_INDEX_TYPE, row_count))
+
+        # 文本兜底检索的 trigram 索引（表达式与 _TASK_SEARCH_TEXT_SQL 一致）
+        await conn.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
         await conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_task_embeddings_vector
-            ON task_embeddings USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = 100)
+            CREATE INDEX IF NOT EXISTS idx_tasks_title_trgm
+            ON tasks USING gin (lower(title) gin_trgm_ops)
         """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_tasks_search_text_trgm
+            ON tasks USING gin ((lower(title || ' ' || coalesce(description, ''))) gin_trgm_ops)
+        """)
+
+    # 让 vector 扩展就绪前建立的连接在下次 acquire 时重建，重新走 init 钩子注册类型
+    await pool.expire_connections()
+    logger.info("pgvector 初始化完成")
+
+
+_LEGACY_UNCOVERED_SQL = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM task_embeddings te
+        JOIN tasks t ON t.id = te.task_id AND t.deleted_at IS NULL
+        WHERE te.model_id = $1
+          AND NOT EXISTS (
+              SELECT 1 FROM task_embeddings cur
+              WHERE cur.task_id = te.task_id AND cur.model_id = $2
+          )
+    )
+"""
+
+
+def _cosine_similarity(a, b) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    if a.shape != b.shape:
+        return 0.0
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    return float(np.dot(a, b) / norm) if norm else 0.0
+
+
+async def adopt_legacy_embeddings() -> dict:
+    """
+    模型就绪后处理 legacy 向量（应用启动时在后台调用），返回 {"adopted": 认领条数, "reembed": 登记重新生成的任务数}
+
+    抽样用当前后端重新 encode 任务文本并与 legacy 向量比较：大部分一致说明历史向量就是当前模型生成的，
+    直接改标为当前模型标识，检索不中断、也无需重新 encode；不一致时保留 legacy 并登记 outbox 重新生成，
+    覆盖完成前向量检索按 hybrid 执行，尚未迁移的任务仍可由文本召回。
+    """
+    if not _legacy_embedding_state["pending"]:
+        return {"adopted": 0, "reembed": 0}
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        sample = await conn.fetch("""
+            SELECT te.embedding::vector::text AS embedding, t.title, t.description
+            FROM task_embeddings te
+            JOIN tasks t ON t.id = te.task_id AND t.deleted_at IS NULL
+            WHERE te.model_id = $1
+            ORDER BY te.updated_at DESC
+            LIMIT $2
+        """, LEGACY_EMBEDDING_MODEL_ID, _LEGACY_SAMPLE_SIZE)
+
+    matched = 0
+    if sample:
+        # 首次 encode 会触发模型加载；加载失败回退到 hash 时，get_embedding_model_id() 随之变化
+        embeddings = await generate_embeddings(
+            [build_task_embedding_text(row["title"], row["description"]) for row in sample]
+        )
+        matched = sum(
+            1
+            for row, embedding in zip(sample, embeddings)
+            if _cosine_similarity(json.loads(row["embedding"]), embedding) >= _LEGACY_MATCH_SIMILARITY
+        )
+    model_id = get_embedding_model_id()
+    adopt = bool(sample) and matched >= math.ceil(len(sample) * _LEGACY_MATCH_RATIO)
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # 多个 worker 进程同时启动时串行处理，避免重复登记
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('task_embeddings_legacy'))")
+            if adopt:
+                status = await conn.execute("""
+                    UPDATE task_embeddings te
+                    SET model_id = $2
+                    WHERE te.model_id = $1
+                      AND NOT EXISTS (
+                          SELECT 1 FROM task_embeddings cur
+                          WHERE cur.task_id = te.task_id AND cur.model_id = $2
+                      )
+                """, LEGACY_EMBEDDING_MODEL_ID, model_id)
+                result = {"adopted": int(status.split()[-1]), "reembed": 0}
+            else:
+                status = await conn.execute("""
+                    INSERT INTO task_embedding_outbox (task_id)
+                    SELECT DISTINCT te.task_id
+                    FROM task_embeddings te
+                    JOIN tasks t ON t.id = te.task_id
+                    WHERE te.model_id = $1
+                      AND NOT EXISTS (
+                          SELECT 1 FROM task_embeddings cur
+                          WHERE cur.task_id = te.task_id AND cur.model_id = $2
+                      )
+                      AND NOT EXISTS (
+                          SELECT 1 FROM task_embedding_outbox o WHERE o.task_id = te.task_id
+                      )
+                """, LEGACY_EMBEDDING_MODEL_ID, model_id)
+                result = {"adopted": 0, "reembed": int(status.split()[-1])}
+            _legacy_embedding_state["pending"] = await conn.fetchval(
+                _LEGACY_UNCOVERED_SQL, LEGACY_EMBEDDING_MODEL_ID, model_id
+            )
+            _legacy_embedding_state["checked_at"] = time.monotonic()
+
+    logger.info(
+        "legacy 向量抽样 %s 条、与 %s 一致 %s 条：认领 %s 条，登记重新生成 %s 个任务",
+        len(sample),
+        model_id,
+        matched,
+        result["adopted"],
+        result["reembed"],
+    )
+    return result
+
+
+async def _legacy_embeddings_pending() -> bool:
+    """是否仍有任务缺当前模型版本、只有 legacy 向量（仅在存在时按间隔复查，查询失败时保持原状态）"""
+    if not _legacy_embedding_state["pending"]:
+        return False
+    now = time.monotonic()
+    if now - _legacy_embedding_state["checked_at"] >= _LEGACY_RECHECK_SECONDS:
+        _legacy_embedding_state["checked_at"] = now
+        try:
+            pool = await get_db_pool()
+            async with pool.acquire() as conn:
+                _legacy_embedding_state["pending"] = await conn.fetchval(
+                    _LEGACY_UNCOVERED_SQL, LEGACY_EMBEDDING_MODEL_ID, get_embedding_model_id()
+                )
+        except Exception as e:
+            logger.warning("检查 legacy 向量覆盖情况失败: %s", e)
+    return _legacy_embedding_state["pending"]
+
+
+async def get_vector_index_info() -> dict:
+    """查询 task_embeddings 向量索引的定义、大小与表行数"""
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        row = await conn.fetchrow("""
+            SELECT
+                i.indexdef,
+                pg_relation_size(c.oid) AS index_bytes,
+                (SELECT COUNT(*) FROM task_embeddings) AS row_count
+            FROM pg_indexes i
+            JOIN pg_class c ON c.relname = i.indexname
+            WHERE i.tablename = 'task_embeddings' AND i.indexname = $1
+        """, _VECTOR_INDEX_NAME)
+
+    if row is None:
+        return {"index_name": _VECTOR_INDEX_NAME, "exists": False, "storage": _embedding_storage}
+    return {
+        "index_name": _VECTOR_INDEX_NAME,
+        "exists": True,
+        "definition": row["indexdef"],
+        "index_bytes": row["index_bytes"],
+        "row_count": row["row_count"],
+        "storage": _embedding_storage,
+    }
+
+
+async def rebuild_vector_index(
+    index_type: Optional[str] = None,
+    concurrently: bool = True,
+    quantization: Optional[str] = None,
+) -> dict:
+    """
+    重建 task_embeddings 向量索引（可切换 hnsw / ivfflat，ivfflat 会按当前行数重新训练 lists）
+
+    先以临时名称创建新索引，再删除旧索引并重命名；concurrently=True 时全程不阻塞读写。
+
+    Args:
+        index_type: 索引类型，默认使用 VECTOR_INDEX_TYPE
+        concurrently: 是否使用 CONCURRENTLY 创建/删除索引
+        quantization: none / binary，默认 VECTOR_INDEX_QUANTIZATION（需与检索配置一致）
+
+    Returns:
+        重建后的索引信息
+    """
+    index_type = index_type or VECTOR_INDEX_TYPE
+    concurrent_keyword = " CONCURRENTLY" if concurrently else ""
+    temp_index_name = f"{_VECTOR_INDEX_NAME}_rebuild"
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        row_count = await conn.fetchval("SELECT COUNT(*) FROM task_embeddings")
+        # 清理上次失败遗留的临时索引（CONCURRENTLY 失败会留下 INVALID 索引）
+        await conn.execute(f"DROP INDEX{concurrent_keyword} IF EXISTS {temp_index_name}")
+        await conn.execute(
+            _build_vector_index_sql(temp_index_name, index_type, row_count, concurrently, quantization)
+        )
+        await conn.execute(f"DROP INDEX{concurrent_keyword} IF EXISTS {_VECTOR_INDEX_NAME}")
+        await conn.execute(f"ALTER INDEX {temp_index_name} RENAME TO {_VECTOR_INDEX_NAME}")
+
+    logger.info("向量索引重建完成 (type=%s, rows=%s)", index_type, row_count)
+    return await get_vector_index_info()
+
+
+async def migrate_vector_storage(storage: Optional[str] = None) -> dict:
+    """
+    切换 task_embeddings.embedding 的存储类型（vector <-> halfvec）并按当前配置重建向量索引
+
+    ALTER COLUMN TYPE 会重写整表并持有排他锁，期间相似检索与向量写入阻塞，请在低峰期执行。
+
+    Args:
+        storage: vector / halfvec，默认 VECTOR_STORAGE
+
+    Returns:
+        迁移后的索引信息
+    """
+    global _embedding_storage
+    storage = storage or VECTOR_STORAGE
+    if storage not in VECTOR_STORAGE_TYPES:
+        raise ValueError(f"不支持的向量存储类型: {storage}")
+    pool = await get_db_pool()
+
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            # 旧索引的操作符类与新类型不匹配，先删除再在新列上重建
+            await conn.execute(f"DROP INDEX IF EXISTS {_VECTOR_INDEX_NAME}")
+            await conn.execute(f"""
+                ALTER TABLE task_embeddings
+                ALTER COLUMN embedding TYPE {storage}({_EMBEDDING_DIM})
+                USING embedding::{storage}({_EMBEDDING_DIM})
+            """)
+            _embedding_storage = storage
+            row_count = await conn.fetchval("SELECT COUNT(*) FROM task_embeddings")
+            await conn.execute(_build_vector_index_sql(_VECTOR_INDEX_NAME, VECTOR_INDEX_TYPE, row_count))
+
+    # 列类型变化后，已缓存的预编译语句结果类型失效，重建连接
+    await pool.expire_connections()
+    logger.info("向量存储类型已切换为 %s (rows=%s)", storage, row_count)
+    return await get_vector_index_info()
+
+
+async def _apply_vector_search_params(
+    conn: asyncpg.Connection,
+    ef_search: Optional[int],
+    probes: Optional[int],
+):
+    """设置本事务内的 ANN 检索参数（需在事务中调用）"""
+    if ef_search:
+        await conn.execute("SELECT set_config('hnsw.ef_search', $1, true)", str(ef_search))
+    if probes:
+        await conn.execute("SELECT set_config('ivfflat.probes', $1, true)", str(probes))
+
+
+async def filter_current_embedding_items(
+    conn: asyncpg.Connection,
+    items: List[tuple[int, List[float], str]],
+) -> List[tuple[int, List[float], str]]:
+    """
+    锁住任务行（FOR SHARE，需在写入向量的事务内调用），只保留仍未删除且文本与 encode 时一致的条目
+
+    encode 期间任务可能被修改或删除，其新状态由 outbox 重新同步；跳过这些过期结果，
+    避免用旧文本的向量覆盖 outbox 写入的新向量。
+    """
+    if not items:
+        return []
+    current = {
+        row["id"]: row
+        for row in await conn.fetch("""
+            SELECT id, title, description, deleted_at
+            FROM tasks
+            WHERE id = ANY($1::int[])
+            FOR SHARE
+        """, sorted({task_id for task_id, _, _ in items}))
+    }
+
+    def still_live_with(task_id: int, text: str) -> bool:
+        row = current.get(task_id)
+        return (
+            row is not None
+            and row["deleted_at"] is None
+            and build_task_embedding_text(row["title"], row["description"]) == text
+        )
+
+    return [item for item in items if still_live_with(item[0], item[2])]
+
+
+async def upsert_task_embeddings(conn: asyncpg.Connection, items: List[tuple[int, List[float], str]]):
+    """
+    批量写入任务 embedding（多行 upsert，单次往返）
+
+    project_id / organization_id 在写入时从 tasks、projects 取值，保证与任务归属一致；
+    同时记录内容哈希与模型标识，后续同步时内容未变可跳过 encode。
 
-        logger.info("pgvector 初始化完成")
+    Args:
+        conn: 已注册 vector 类型的连接
+        items: (task_id, embedding, text_content) 列表（text_content 只用于计算内容哈希，不入库）
+    """
+    if not items:
+        return
+    now = datetime.utcnow()
+    model_id = get_embedding_model_id()
+    await conn.executemany("""
+        INSERT INTO task_embeddings (
+            task_id, embedding, content_hash, model_id, embedding_dim, project_id, organization_id, updated_at
+        )
+        SELECT t.id, $2::vector, $3, $4, $5, t.project_id, p.organization_id, $6
+        FROM tasks t
+        LEFT JOIN projects p ON p.id = t.project_id
+        WHERE t.id = $1
+        ON CONFLICT (task_id, model_id) DO UPDATE SET
+            embedding = EXCLUDED.embedding,
+            content_hash = EXCLUDED.content_hash,
+            embedding_dim = EXCLUDED.embedding_dim,
+            project_id = EXCLUDED.project_id,
+            organization_id = EXCLUDED.organization_id,
+            updated_at = EXCLUDED.updated_at
+    """, [
+        (task_id, embedding, compute_content_hash(text_content), model_id, len(embedding), now)
+        for task_id, embedding, text_content in items
+    ])
+
+
+async def copy_task_embeddings(conn: asyncpg.Connection, items: List[tuple[int, List[float], str]]):
+    """
+    大批量写入任务 embedding（二进制 COPY 到临时表后一次性合并）
+
+    适用于回填等单批上百行的场景，比逐行 executemany 少大量往返与解析开销；
+    合并语义与 upsert_task_embeddings 一致。
+
+    Args:
+        conn: 已注册 vector 类型的连接
+        items: (task_id, embedding, text_content) 列表（text_content 只用于计算内容哈希，不入库）
+    """
+    if not items:
+        return
+    model_id = get_embedding_model_id()
+    async with conn.transaction():
+        await conn.execute(f"""
+            CREATE TEMP TABLE _task_embeddings_load (
+                task_id INTEGER,
+                embedding vector({_EMBEDDING_DIM}),
+                content_hash VARCHAR(64)
+            ) ON COMMIT DROP
+        """)
+        await conn.copy_records_to_table(
+            "_task_embeddings_load",
+            records=[
+                (task_id, embedding, compute_content_hash(text_content))
+                for task_id, embedding, text_content in items
+            ],
+            columns=["task_id", "embedding", "content_hash"],
+        )
+        await conn.execute("""
+            INSERT INTO task_embeddings (
+                task_id, embedding, content_hash, model_id, embedding_dim, project_id, organization_id, updated_at
+            )
+            SELECT l.task_id, l.embedding, l.content_hash, $1, $2, t.project_id, p.organization_id, $3
+            FROM _task_embeddings_load l
+            JOIN tasks t ON t.id = l.task_id
+            LEFT JOIN projects p ON p.id = t.project_id
+            ON CONFLICT (task_id, model_id) DO UPDATE SET
+                embedding = EXCLUDED.embedding,
+                content_hash = EXCLUDED.content_hash,
+                embedding_dim = EXCLUDED.embedding_dim,
+                project_id = EXCLUDED.project_id,
+                organization_id = EXCLUDED.organization_id,
+                updated_at = EXCLUDED.updated_at
+        """, model_id, _EMBEDDING_DIM, datetime.utcnow())
 
 
 async def upsert_task_embedding(task_id: int, text_content: str) -> bool:
@@ -265,16 +1377,7 @@ async def upsert_task_embedding(task_id: int, text_content: str) -> bool:
 
     try:
         async with pool.acquire() as conn:
-            await register_vector(conn)
-
-            await conn.execute("""
-                INSERT INTO task_embeddings (task_id, embedding, text_content, updated_at)
-                VALUES ($1, $2, $3, $4)
-                ON CONFLICT (task_id) DO UPDATE SET
-                    embedding = EXCLUDED.embedding,
-                    text_content = EXCLUDED.text_content,
-                    updated_at = EXCLUDED.updated_at
-            """, task_id, embedding, text_content, datetime.utcnow())
+            await upsert_task_embeddings(conn, [(task_id, embedding, text_content)])
 
         return True
     except Exception as e:
@@ -282,11 +1385,243 @@ async def upsert_task_embedding(task_id: int, text_content: str) -> bool:
         return False
 
 
+def _build_ann_match_sql(
+    query_sql: str,
+    exclude_sql: str,
+    limit_sql: str,
+    threshold_sql: str,
+    scope_sql: str,
+    model_sql: str,
+) -> str:
+    """
+    单条查询向量的 ANN 检索 SQL（单条检索与批量 LATERAL 检索共用），按余弦距离升序返回任务字段
+
+    只匹配 model_sql 指定模型版本的向量：迁移期间表中同时存在新旧模型的向量，不同模型的向量不可比。
+
+    binary 量化索引下先按 binary_quantize 的 hamming 距离召回 limit * VECTOR_BINARY_RERANK_FACTOR 条候选，
+    再用存储向量计算余弦距离重排并按阈值过滤。
+    """
+    distance_sql = f"te.embedding <=> {query_sql}"
+    columns_sql = f"""
+            te.task_id,
+            {distance_sql} AS distance,
+            t.title,
+            t.description,
+            t.status,
+            t.priority,
+            t.project_id,
+            t.created_at"""
+    if VECTOR_INDEX_QUANTIZATION != "binary":
+        return f"""
+        SELECT{columns_sql}
+        FROM task_embeddings te
+        JOIN tasks t ON te.task_id = t.id
+        WHERE te.task_id != {exclude_sql}
+            AND te.model_id = {model_sql}
+            AND (t.deleted_at IS NULL)
+            AND ({distance_sql}) <= {threshold_sql}
+            {scope_sql}
+        ORDER BY {distance_sql} ASC
+        LIMIT {limit_sql}
+        """
+    return f"""
+        SELECT candidates.*
+        FROM (
+            SELECT{columns_sql}
+            FROM task_embeddings te
+            JOIN tasks t ON te.task_id = t.id
+            WHERE te.task_id != {exclude_sql}
+                AND te.model_id = {model_sql}
+                AND (t.deleted_at IS NULL)
+                {scope_sql}
+            ORDER BY binary_quantize(te.embedding)::bit({_EMBEDDING_DIM}) <~> binary_quantize({query_sql})
+            LIMIT {limit_sql} * {max(1, VECTOR_BINARY_RERANK_FACTOR)}
+        ) candidates
+        WHERE candidates.distance <= {threshold_sql}
+        ORDER BY candidates.distance ASC
+        LIMIT {limit_sql}
+        """
+
+
+async def _search_similar_tasks_by_vector(
+    conn: asyncpg.Connection,
+    query_embedding: List[float],
+    exclude_task_id: Optional[int] = None,
+    limit: int = 5,
+    threshold: float = 0.5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    project_ids: Optional[List[int]] = None,
+    organization_id: Optional[int] = None,
+) -> List[dict]:
+    """pgvector 余弦距离检索"""
+    # 注意：pgvector 的 <=> 返回的是距离（0=相同，2=相反），需要转换为相似度
+    # 租户范围条件直接下推到 task_embeddings 上，小租户可走 project_id 索引精确扫描
+    scope_sql, scope_params = _build_scope_filter(
+        "te.project_id", "te.organization_id", project_ids, organization_id, start_index=6
+    )
+    sql = _build_ann_match_sql(
+        query_sql=_embedding_query_sql("$1"),
+        exclude_sql="$2",
+        limit_sql="$3",
+        threshold_sql="$4",
+        scope_sql=scope_sql,
+        model_sql="$5",
+    )
+    # distance 范围是 0-2，相似度 = 1 - distance/2
+    # threshold 是相似度阈值，转换为 distance 阈值
+    distance_threshold = (1 - threshold) * 2
+
+    async with conn.transaction():
+        await _apply_vector_search_params(
+            conn,
+            ef_search=ef_search or VECTOR_HNSW_EF_SEARCH,
+            probes=probes or VECTOR_IVFFLAT_PROBES,
+        )
+        if VECTOR_HNSW_ITERATIVE_SCAN:
+            # pgvector >= 0.8：按模型版本/租户过滤后结果不足时继续扫描 HNSW，避免召回不足
+            await conn.execute(
+                "SELECT set_config('hnsw.iterative_scan', $1, true)", VECTOR_HNSW_ITERATIVE_SCAN
+            )
+        rows = await conn.fetch(
+            sql,
+            query_embedding,
+            exclude_task_id or 0,
+            limit,
+            distance_threshold,
+            get_embedding_model_id(),
+            *scope_params,
+        )
+
+    results = []
+    for row in rows:
+        distance = float(row["distance"])  # 距离 0-2
+        similarity = 1 - distance / 2  # 转换为相似度 0-1
+        results.append({
+            "task_id": row["task_id"],
+            "title": row["title"],
+            "description": row["description"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "project_id": row["project_id"],
+            "similarity": round(similarity, 3),
+            "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+        })
+    return results
+
+
+def _fuse_ranked_results(ranked_lists: List[List[dict]], limit: int, rrf_k: int = SIMILARITY_HYBRID_RRF_K) -> List[dict]:
+    """
+    倒数排名融合（RRF）：score = Σ 1 / (k + rank)
+
+    只依赖各路结果的名次，不需要把余弦相似度与 trigram 相似度换算到同一尺度；
+    返回项的 similarity 取各路中的较大值用于展示。
+    """
+    scores: dict[int, float] = {}
+    items: dict[int, dict] = {}
+    for results in ranked_lists:
+        for rank, item in enumerate(results, start=1):
+            task_id = item["task_id"]
+            scores[task_id] = scores.get(task_id, 0.0) + 1.0 / (rrf_k + rank)
+            if task_id not in items or item["similarity"] > items[task_id]["similarity"]:
+                items[task_id] = item
+
+    ordered = sorted(scores, key=lambda task_id: (-scores[task_id], -items[task_id]["similarity"], -task_id))
+    return [items[task_id] for task_id in ordered[:limit]]
+
+
+async def _search_similar_tasks_hybrid(
+    text_content: str,
+    exclude_task_id: Optional[int],
+    limit: int,
+    threshold: float,
+    ef_search: Optional[int],
+    probes: Optional[int],
+    project_ids: Optional[List[int]],
+    organization_id: Optional[int],
+    latency_budget_ms: Optional[float],
+) -> tuple[List[dict], bool]:
+    """
+    混合检索：文本（pg_trgm）与向量两路并发召回后按 RRF 融合
+
+    两路各用一个连接并发执行，整体受延迟预算约束：超出预算的一路被取消，只融合已完成的结果；
+    向量一路失败（模型不可用、队列已满）时同样只返回文本召回结果。
+    调用方被取消时两路随之取消。
+
+    Returns:
+        (融合结果, 两路是否都正常完成)；有一路失败或超时的降级结果不应写入缓存
+    """
+    candidate_limit = limit * max(1, SIMILARITY_HYBRID_CANDIDATE_FACTOR)
+    pool = await get_db_pool()
+
+    async def run_lexical():
+        async with pool.acquire() as conn:
+            return await _search_similar_tasks_by_text(
+                conn=conn,
+                text_content=text_content,
+                exclude_task_id=exclude_task_id,
+                limit=candidate_limit,
+                threshold=threshold,
+                project_ids=project_ids,
+                organization_id=organization_id,
+            )
+
+    async def run_vector():
+        if _EMBEDDING_BACKEND == "hash":
+            # hash 向量不含语义信息，混合检索只保留文本召回，无需 encode
+            return []
+        query_embedding = await get_query_embedding(text_content)
+        async with pool.acquire() as conn:
+            return await _search_similar_tasks_by_vector(
+                conn=conn,
+                query_embedding=query_embedding,
+                exclude_task_id=exclude_task_id,
+                limit=candidate_limit,
+                threshold=threshold,
+                ef_search=ef_search,
+                probes=probes,
+                project_ids=project_ids,
+                organization_id=organization_id,
+            )
+
+    branches = {
+        "vector": asyncio.create_task(run_vector()),
+        "lexical": asyncio.create_task(run_lexical()),
+    }
+    budget_ms = latency_budget_ms or SIMILARITY_HYBRID_LATENCY_BUDGET_MS
+    try:
+        done, _ = await asyncio.wait(branches.values(), timeout=budget_ms / 1000)
+    finally:
+        # 超出预算或调用方被取消时取消未完成的一路，并等待取消完成，确保连接归还连接池
+        pending = [task for task in branches.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    ranked_lists = []
+    for name, task in branches.items():
+        if task not in done:
+            logger.warning("混合检索 %s 召回超出延迟预算 (%.0fms)，已忽略", name, budget_ms)
+        elif task.exception() is not None:
+            logger.warning("混合检索 %s 召回失败，已忽略: %s", name, task.exception())
+        else:
+            ranked_lists.append(task.result())
+
+    return _fuse_ranked_results(ranked_lists, limit), len(ranked_lists) == len(branches)
+
+
 async def search_similar_tasks(
     text_content: str,
     exclude_task_id: Optional[int] = None,
     limit: int = 5,
     threshold: float = 0.5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    project_ids: Optional[List[int]] = None,
+    organization_id: Optional[int] = None,
+    mode: str = "vector",
+    latency_budget_ms: Optional[float] = None,
 ) -> List[dict]:
     """
     搜索相似任务
@@ -296,62 +1631,333 @@ async def search_similar_tasks(
         exclude_task_id: 排除的任务 ID（创建新任务时排除自身）
         limit: 返回结果数量
         threshold: 相似度阈值 (0-1)，越高越严格
+        project_ids: 限定检索的项目 ID 列表（None 表示不限，空列表直接返回空结果）
+        organization_id: 限定检索的组织 ID
+        ef_search: HNSW 检索候选数（越大召回越高、越慢），默认 VECTOR_HNSW_EF_SEARCH
+        probes: ivfflat 检索探测 list 数，默认 VECTOR_IVFFLAT_PROBES
+        mode: 检索方式，vector（向量，hash 后端下自动改用文本）/ lexical（pg_trgm 文本）/ hybrid（两路融合）
+        latency_budget_ms: hybrid 模式的延迟预算，默认 SIMILARITY_HYBRID_LATENCY_BUDGET_MS
+
+    进程内参数相同的并发查询只执行一次（singleflight，按规范化后的文本执行），成功结果按
+    SIMILARITY_RESULT_CACHE_TTL_SECONDS 短期缓存，任务变化时由 publish_similarity_invalidation() 按项目失效。
 
     Returns:
-        相似任务列表，按相似度降序排列
+        相似任务列表，按相似度（hybrid 模式按融合得分）降序排列
 
     Raises:
-        RuntimeError: 生成 embedding 失败时抛出
+        RuntimeError: vector 模式下生成 embedding 失败时抛出
+        ValueError: 不支持的检索方式
+    """
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"不支持的检索方式: {mode}")
+    if project_ids is not None and not project_ids:
+        return []
+
+    scope = tuple(sorted(set(project_ids))) if project_ids is not None else None
+    # 合并键与实际执行使用同一规范化文本（折叠空白、小写；MiniLM 与 pg_trgm 都不区分大小写），
+    # 共享结果的请求得到的就是对自己文本的检索结果
+    normalized_text = " ".join(text_content.split()).lower()
+    key = (
+        normalized_text,
+        mode,
+        scope,
+        organization_id,
+        exclude_task_id,
+        limit,
+        threshold,
+        ef_search,
+        probes,
+        latency_budget_ms,
+    )
+    cached = _search_result_cache.get(key)
+    if cached is not None:
+        return list(cached)
+
+    future = _inflight_searches.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_run_similarity_search(
+            text_content=normalized_text,
+            exclude_task_id=exclude_task_id,
+            limit=limit,
+            threshold=threshold,
+            ef_search=ef_search,
+            probes=probes,
+            project_ids=list(scope) if scope is not None else None,
+            organization_id=organization_id,
+            mode=mode,
+            latency_budget_ms=latency_budget_ms,
+        ))
+        _inflight_searches[key] = future
+        future.add_done_callback(
+            lambda done, key=key, generation=_search_result_cache.generation: _finish_search(key, done, generation)
+        )
+    else:
+        _search_result_cache.coalesced += 1
+
+    try:
+        # shield：某个等待方被取消时不影响共享同一查询的其他请求
+        results, _ = await asyncio.shield(future)
+    except _SearchQueryFailed as e:
+        logger.error(f"搜索相似任务失败: {e}")
+        return []
+    return list(results)
+
+
+def _finish_search(key: tuple, future: asyncio.Future, generation: int):
+    if _inflight_searches.get(key) is future:
+        del _inflight_searches[key]
+    if future.cancelled() or future.exception() is not None:
+        return
+    results, cacheable = future.result()
+    if cacheable:
+        _search_result_cache.put(key, results, generation)
+
+
+async def _run_similarity_search(
+    text_content: str,
+    exclude_task_id: Optional[int],
+    limit: int,
+    threshold: float,
+    ef_search: Optional[int],
+    probes: Optional[int],
+    project_ids: Optional[List[int]],
+    organization_id: Optional[int],
+    mode: str,
+    latency_budget_ms: Optional[float],
+) -> tuple[List[dict], bool]:
     """
-    query_embedding = await generate_embedding(text_content)
+    执行一次相似检索（不经过合并与缓存），返回 (结果, 是否可缓存)
+
+    查询失败抛出 _SearchQueryFailed，由调用方降级且不写入缓存；hybrid 有一路失败或超时的降级结果不可缓存。
+    """
+    if mode == "hybrid":
+        try:
+            return await _search_similar_tasks_hybrid(
+                text_content=text_content,
+                exclude_task_id=exclude_task_id,
+                limit=limit,
+                threshold=threshold,
+                ef_search=ef_search,
+                probes=probes,
+                project_ids=project_ids,
+                organization_id=organization_id,
+                latency_budget_ms=latency_budget_ms,
+            )
+        except Exception as e:
+            raise _SearchQueryFailed(f"混合检索失败: {e}") from e
+
+    if mode == "vector" and _EMBEDDING_BACKEND != "hash" and await _legacy_embeddings_pending():
+        # 升级后 legacy 向量尚未被当前模型覆盖：按 hybrid 检索，缺当前版本向量的任务由文本召回
+        return await _run_similarity_search(
+            text_content, exclude_task_id, limit, threshold, ef_search, probes,
+            project_ids, organization_id, "hybrid", latency_budget_ms,
+        )
+
+    query_embedding = None
+    if mode == "vector" and _EMBEDDING_BACKEND != "hash":
+        query_embedding = await get_query_embedding(text_content)
 
     pool = await get_db_pool()
 
     try:
         async with pool.acquire() as conn:
-            if _EMBEDDING_BACKEND == "hash":
-                return await _search_similar_tasks_by_text(
+            if mode == "lexical" or _EMBEDDING_BACKEND == "hash":
+                results = await _search_similar_tasks_by_text(
                     conn=conn,
                     text_content=text_content,
                     exclude_task_id=exclude_task_id,
                     limit=limit,
                     threshold=threshold,
+                    project_ids=project_ids,
+                    organization_id=organization_id,
+                )
+            else:
+                results = await _search_similar_tasks_by_vector(
+                    conn=conn,
+                    query_embedding=query_embedding,
+                    exclude_task_id=exclude_task_id,
+                    limit=limit,
+                    threshold=threshold,
+                    ef_search=ef_search,
+                    probes=probes,
+                    project_ids=project_ids,
+                    organization_id=organization_id,
                 )
+    except Exception as e:
+        raise _SearchQueryFailed(str(e)) from e
+    return results, True
+
+
+def invalidate_similarity_cache(project_ids: Optional[List[int]] = None):
+    """失效本进程中相关项目的相似检索缓存（不传项目时全部失效）"""
+    _search_result_cache.invalidate(project_ids)
+
+
+async def publish_similarity_invalidation(project_ids: Optional[List[int]] = None):
+    """项目内任务或向量变化提交后调用：失效本进程缓存并通知其他 worker 进程"""
+    project_ids = sorted(set(project_ids)) if project_ids is not None else None
+    invalidate_similarity_cache(project_ids)
+    _invalidations["local"] += 1
+    if not SIMILARITY_CACHE_NOTIFY_ENABLED:
+        return
+    try:
+        await publish_notification(
+            SIMILARITY_INVALIDATION_CHANNEL,
+            {"origin": _ORIGIN, "project_ids": project_ids},
+        )
+    except Exception as e:
+        # 通知失败时其他进程最多在 TTL 内返回旧结果
+        _invalidations["publish_failed"] += 1
+        logger.warning("相似检索缓存失效通知发送失败: %s", e)
+
+
+def _handle_similarity_invalidation_notification(message: dict):
+    if message.get("origin") == _ORIGIN:
+        return
+    _invalidations["remote"] += 1
+    invalidate_similarity_cache(message.get("project_ids"))
+
 
-            await register_vector(conn)
+def register_similarity_cache_listener():
+    """订阅其他进程的检索缓存失效通知（应用启动时、启动监听之前调用）"""
+    subscribe_notifications(
+        SIMILARITY_INVALIDATION_CHANNEL,
+        _handle_similarity_invalidation_notification,
+        on_reconnect=invalidate_similarity_cache,
+    )
 
-            # 构建查询（使用余弦相似度）
-            # 注意：pgvector 的 <=> 返回的是距离（0=相同，2=相反），需要转换为相似度
-            sql = """
+
+def get_search_cache_metrics() -> dict:
+    """相似检索结果缓存与查询合并指标"""
+    return {
+        "size": len(_search_result_cache),
+        "ttl_seconds": _search_result_cache.ttl_seconds,
+        "hits": _search_result_cache.hits,
+        "misses": _search_result_cache.misses,
+        "coalesced": _search_result_cache.coalesced,
+        "inflight": len(_inflight_searches),
+        "invalidations": dict(_invalidations),
+    }
+
+
+def _format_vector_literal(embedding: List[float]) -> str:
+    """向量的文本表示（'[x1,x2,...]'），可在 SQL 中 ::vector 转换"""
+    return "[" + ",".join(str(float(value)) for value in embedding) + "]"
+
+
+async def search_similar_tasks_batch(
+    texts: List[str],
+    exclude_task_ids: Optional[List[Optional[int]]] = None,
+    limit: int = 5,
+    threshold: float = 0.5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    project_ids: Optional[List[int]] = None,
+    organization_id: Optional[int] = None,
+) -> List[List[dict]]:
+    """
+    批量搜索相似任务（导入 backlog、批量查重）
+
+    全部查询文本一次批量 encode，再用一条 LATERAL join SQL 为每条查询执行一次 ANN 检索，
+    无论查询条数多少都只有一次模型调用和一次数据库往返（hash 后端逐条走文本检索）。
+
+    Args:
+        texts: 查询文本列表
+        exclude_task_ids: 与 texts 一一对应的排除任务 ID（查重已有任务时排除自身）
+        其余参数同 search_similar_tasks
+
+    Returns:
+        与 texts 顺序一致的结果列表
+
+    Raises:
+        RuntimeError: 生成 embedding 失败时抛出
+        ValueError: exclude_task_ids 与 texts 长度不一致
+    """
+    if exclude_task_ids is None:
+        exclude_task_ids = [None] * len(texts)
+    if len(exclude_task_ids) != len(texts):
+        raise ValueError("exclude_task_ids 与 texts 长度不一致")
+    if not texts or (project_ids is not None and not project_ids):
+        return [[] for _ in texts]
+
+    # hash 后端走文本检索，不使用查询向量，无需 encode
+    embeddings = await generate_embeddings(texts) if _EMBEDDING_BACKEND != "hash" else []
+
+    pool = await get_db_pool()
+
+    try:
+        async with pool.acquire() as conn:
+            if _EMBEDDING_BACKEND == "hash":
+                return [
+                    await _search_similar_tasks_by_text(
+                        conn=conn,
+                        text_content=text,
+                        exclude_task_id=exclude_task_id,
+                        limit=limit,
+                        threshold=threshold,
+                        project_ids=project_ids,
+                        organization_id=organization_id,
+                    )
+                    for text, exclude_task_id in zip(texts, exclude_task_ids)
+                ]
+
+            scope_sql, scope_params = _build_scope_filter(
+                "te.project_id", "te.organization_id", project_ids, organization_id, start_index=6
+            )
+            match_sql = _build_ann_match_sql(
+                query_sql="queries.embedding",
+                exclude_sql="queries.exclude_id",
+                limit_sql="$3",
+                threshold_sql="$4",
+                scope_sql=scope_sql,
+                model_sql="$5",
+            )
+            sql = f"""
+                WITH queries AS (
+                    SELECT {_embedding_query_sql("q.embedding_text")} AS embedding, q.exclude_id, q.idx
+                    FROM unnest($1::text[], $2::int[]) WITH ORDINALITY AS q(embedding_text, exclude_id, idx)
+                )
                 SELECT
-                    te.task_id,
-                    te.embedding <=> $1::vector AS distance,
-                    te.text_content,
-                    t.title,
-                    t.description,
-                    t.status,
-                    t.priority,
-                    t.project_id,
-                    t.created_at
-                FROM task_embeddings te
-                JOIN tasks t ON te.task_id = t.id
-                WHERE te.task_id != $2
-                    AND (t.deleted_at IS NULL)
-                    AND (te.embedding <=> $1::vector) <= $4
-                ORDER BY te.embedding <=> $1::vector ASC
-                LIMIT $3
+                    queries.idx,
+                    matches.task_id,
+                    matches.distance,
+                    matches.title,
+                    matches.description,
+                    matches.status,
+                    matches.priority,
+                    matches.project_id,
+                    matches.created_at
+                FROM queries
+                CROSS JOIN LATERAL ({match_sql}) matches
+                ORDER BY queries.idx, matches.distance
             """
-            # distance 范围是 0-2，相似度 = 1 - distance/2
-            # threshold 是相似度阈值，转换为 distance 阈值
             distance_threshold = (1 - threshold) * 2
 
-            rows = await conn.fetch(sql, query_embedding, exclude_task_id or 0, limit, distance_threshold)
+            async with conn.transaction():
+                await _apply_vector_search_params(
+                    conn,
+                    ef_search=ef_search or VECTOR_HNSW_EF_SEARCH,
+                    probes=probes or VECTOR_IVFFLAT_PROBES,
+                )
+                if VECTOR_HNSW_ITERATIVE_SCAN:
+                    await conn.execute(
+                        "SELECT set_config('hnsw.iterative_scan', $1, true)", VECTOR_HNSW_ITERATIVE_SCAN
+                    )
+                rows = await conn.fetch(
+                    sql,
+                    [_format_vector_literal(embedding) for embedding in embeddings],
+                    [exclude_task_id or 0 for exclude_task_id in exclude_task_ids],
+                    limit,
+                    distance_threshold,
+                    get_embedding_model_id(),
+                    *scope_params,
+                )
 
-            results = []
+            results: List[List[dict]] = [[] for _ in texts]
             for row in rows:
-                distance = float(row["distance"])  # 距离 0-2
-                similarity = 1 - distance / 2  # 转换为相似度 0-1
-                results.append({
+                similarity = 1 - float(row["distance"]) / 2
+                # WITH ORDINALITY 从 1 开始
+                results[row["idx"] - 1].append({
                     "task_id": row["task_id"],
                     "title": row["title"],
                     "description": row["description"],
@@ -361,11 +1967,10 @@ async def search_similar_tasks(
                     "similarity": round(similarity, 3),
                     "created_at": row["created_at"].isoformat() if row["created_at"] else None,
                 })
-
             return results
     except Exception as e:
-        logger.error(f"搜索相似任务失败: {e}")
-        return []
+        logger.error(f"批量搜索相似任务失败: {e}")
+        return [[] for _ in texts]
 
 
 async def delete_task_embedding(task_id: int) -> bool:
@@ -118,14 +118,21 @@ def list_tasks(json_output: bool = typer.Option(False, "--json", help="以 JSON
     # 1. 初始化 API 客户端
     api = client()
 
-    # 2. 发送请求
+    # 2. 发送请求（列表接口分页返回，沿 X-Next-Cursor 响应头取完所有页）
     try:
-        response = api.get("/tasks/")
-        if response.status_code != 200:
-            console.print(f"[red]Error fetching tasks: {response.text}[/red]")
-            raise typer.Exit(1)
-
-        tasks = response.json()
+        tasks = []
+        endpoint = "/tasks/"
+        while True:
+            response = api.get(endpoint)
+            if response.status_code != 200:
+                console.print(f"[red]Error fetching tasks: {response.text}[/red]")
+                raise typer.Exit(1)
+
+            tasks.extend(response.json())
+            next_cursor = response.headers.get("X-Next-Cursor")
+            if not next_cursor:
+                break
+            endpoint = f"/tasks/?cursor={next_cursor}"
     except Exception as e:
         console.print(f"[red]Connection error: {e}[/red]")
         raise typer.Exit(1)
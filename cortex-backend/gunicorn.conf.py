@@ -0,0 +1,27 @@
+"""
+Gunicorn 配置（多 worker 部署）
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+preload_app 在 master 进程中导入应用并预加载 embedding 模型，fork 出的 worker
+以写时复制方式共享模型权重占用的内存页；各 worker 启动（lifespan）时再各自做一次预热 encode。
+"""
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# 预热期间 worker 尚未响应心跳，超时需覆盖模型加载耗时
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+
+def when_ready(server):
+    """master 就绪后、fork worker 前加载模型（只加载不推理，推理线程池留给 worker 各自创建）"""
+    from app.core.config import EMBEDDING_PRELOAD
+    from app.services.vector_store import preload_embedding_model
+
+    if EMBEDDING_PRELOAD:
+        preload_embedding_model()
+        server.log.info("embedding 模型已在 master 进程预加载")
@@ -0,0 +1,31 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "project_duplicate_scans" (
+    "project_id" INT NOT NULL PRIMARY KEY REFERENCES "projects" ("id") ON DELETE CASCADE,
+    "threshold" DOUBLE PRECISION,
+    "model_id" VARCHAR(128),
+    "task_count" INT NOT NULL DEFAULT 0,
+    "pairs" JSONB NOT NULL,
+    "clusters" JSONB NOT NULL,
+    "watermark" TIMESTAMPTZ,
+    "computed_at" TIMESTAMPTZ,
+    "refresh_mode" VARCHAR(16),
+    "changed_tasks" INT NOT NULL DEFAULT 0,
+    "duration_seconds" DOUBLE PRECISION NOT NULL DEFAULT 0,
+    "running_since" TIMESTAMPTZ
+);
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "project_duplicate_scans";
+"""
+
+
+MODELS_STATE = ""
@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "task_embedding_outbox" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "attempts" INT NOT NULL DEFAULT 0,
+    "last_error" TEXT,
+    "available_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "task_id" INT NOT NULL REFERENCES "tasks" ("id") ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS "idx_task_embedding_outbox_available_at" ON "task_embedding_outbox" ("available_at");
+CREATE INDEX IF NOT EXISTS "idx_task_embedding_outbox_task_id" ON "task_embedding_outbox" ("task_id");
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "task_embedding_outbox";
+"""
+
+
+MODELS_STATE = ""
@@ -0,0 +1,18 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX IF NOT EXISTS "idx_task_comments_task_created" ON "task_comments" ("task_id", "created_at" DESC, "id" DESC);
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_task_comments_task_created";
+"""
+
+
+MODELS_STATE = ""
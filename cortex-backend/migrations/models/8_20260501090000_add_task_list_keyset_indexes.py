@@ -0,0 +1,22 @@
+from tortoise import BaseDBAsyncClient
+
+RUN_IN_TRANSACTION = True
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX IF NOT EXISTS "idx_tasks_project_created" ON "tasks" ("project_id", "created_at" DESC, "id" DESC) WHERE "deleted_at" IS NULL;
+        CREATE INDEX IF NOT EXISTS "idx_tasks_project_status_created" ON "tasks" ("project_id", "status", "created_at" DESC, "id" DESC) WHERE "deleted_at" IS NULL;
+        CREATE INDEX IF NOT EXISTS "idx_tasks_assignee_created" ON "tasks" ("assignee_id", "created_at" DESC, "id" DESC) WHERE "deleted_at" IS NULL;
+"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_tasks_project_created";
+        DROP INDEX IF EXISTS "idx_tasks_project_status_created";
+        DROP INDEX IF EXISTS "idx_tasks_assignee_created";
+"""
+
+
+MODELS_STATE = ""
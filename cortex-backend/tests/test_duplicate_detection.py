@@ -0,0 +1,199 @@
+import unittest
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+
+from app.services import duplicate_detection
+
+
+class _FakeConn:
+    """模拟 task_embeddings 查询与 project_duplicate_scans 共享结果表"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.since_args = []
+        self.full_loads = 0
+        self.scans = {}
+
+    async def fetchval(self, sql, *args):
+        if "project_duplicate_scans" in sql:
+            scan = self.scans.get(args[0])
+            return scan["threshold"] if scan and scan.get("computed_at") else None
+        return datetime(2026, 4, 20, 10, 0, 0)
+
+    async def fetch(self, sql, *args):
+        if "te.embedding, te.updated_at" in sql:
+            self.since_args.append(args[2] if len(args) > 2 else None)
+            if len(args) > 2:
+                return [row for row in self.rows if row["updated_at"] >= args[2]]
+            self.full_loads += 1
+            return self.rows
+        return [{"task_id": row["task_id"]} for row in self.rows]
+
+    async def fetchrow(self, sql, *args):
+        if "INSERT INTO project_duplicate_scans" in sql:
+            scan = self.scans.setdefault(args[0], {"pairs": "[]"})
+            if scan.get("running"):
+                return None
+            scan["running"] = True
+            return {key: scan.get(key) for key in ("threshold", "model_id", "pairs", "watermark")}
+        scan = self.scans.get(args[0])
+        if scan is None:
+            return None
+        return {
+            "running": scan.get("running", False),
+            "threshold": scan.get("threshold"),
+            "task_count": scan.get("task_count"),
+            "clusters": scan.get("clusters", "[]"),
+            "computed_at": scan.get("computed_at"),
+            "refresh_mode": scan.get("refresh_mode"),
+            "changed_tasks": scan.get("changed_tasks"),
+            "duration_seconds": scan.get("duration_seconds", 0.0),
+        }
+
+    async def execute(self, sql, *args):
+        scan = self.scans[args[0]]
+        scan["running"] = False
+        if "pairs = $5" in sql:
+            keys = ["threshold", "model_id", "task_count", "pairs", "clusters", "watermark",
+                    "refresh_mode", "changed_tasks", "duration_seconds"]
+            scan.update(zip(keys, args[1:]))
+            scan["computed_at"] = datetime(2026, 4, 20, 10, 0, 1, tzinfo=timezone.utc)
+
+
+class _FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def _row(task_id, embedding, updated_at=datetime(2026, 4, 1)):
+    return {"task_id": task_id, "embedding": np.asarray(embedding, dtype=np.float32), "updated_at": updated_at}
+
+
+class DuplicateDetectionTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        duplicate_detection._working_sets.clear()
+        duplicate_detection._scheduled_refreshes.clear()
+
+    def test_blocked_similarity_matches_dense_computation(self):
+        rng = np.random.default_rng(7)
+        matrix = duplicate_detection._normalize_rows(rng.normal(size=(37, 8)).astype(np.float32))
+        matrix[20] = matrix[3]
+        matrix[31] = matrix[3] * 0.999 + matrix[5] * 0.001
+
+        blocked = duplicate_detection._find_similar_pairs(matrix, matrix, 0.6, block_size=5, upper_triangle=True)
+
+        dense = matrix @ matrix.T
+        expected = {(i, j) for i in range(37) for j in range(i + 1, 37) if dense[i, j] >= 0.6}
+        self.assertEqual({(i, j) for i, j, _ in blocked}, expected)
+        self.assertIn((3, 20), expected)
+
+    def test_clusters_merge_transitive_pairs(self):
+        clusters = duplicate_detection._build_clusters(
+            [1, 2, 3, 4, 5],
+            {(1, 2): 0.95, (2, 3): 0.93, (4, 5): 0.99},
+        )
+
+        self.assertEqual(
+            clusters,
+            [
+                {"task_ids": [1, 2, 3], "size": 3, "max_similarity": 0.95},
+                {"task_ids": [4, 5], "size": 2, "max_similarity": 0.99},
+            ],
+        )
+
+    async def test_refresh_is_incremental_after_first_scan(self):
+        rows = [
+            _row(1, [1.0, 0.0, 0.0]),
+            _row(2, [0.99, 0.01, 0.0]),
+            _row(3, [0.0, 1.0, 0.0]),
+            _row(4, [0.0, 0.0, 1.0]),
+        ]
+        conn = _FakeConn(rows)
+
+        with patch.object(duplicate_detection, "get_db_pool", AsyncMock(return_value=_FakePool(conn))):
+            first = await duplicate_detection.refresh_project_duplicates(7, threshold=0.9, block_size=2)
+
+            # 任务 4 改成与任务 3 重复，任务 2 被删除
+            conn.rows = [
+                rows[0],
+                rows[2],
+                _row(4, [0.0, 0.98, 0.02], updated_at=datetime(2026, 4, 21)),
+            ]
+            second = await duplicate_detection.refresh_project_duplicates(7, threshold=0.9, block_size=2)
+
+        self.assertEqual(first["refresh_mode"], "full")
+        self.assertEqual([cluster["task_ids"] for cluster in first["clusters"]], [[1, 2]])
+        self.assertEqual(second["refresh_mode"], "incremental")
+        self.assertEqual(second["changed_tasks"], 1)
+        self.assertEqual(second["task_count"], 3)
+        self.assertEqual([cluster["task_ids"] for cluster in second["clusters"]], [[3, 4]])
+        # 第二次只按水位拉取变化的向量（水位为第一次扫描开始时的数据库时间）
+        self.assertEqual(conn.since_args, [None, datetime(2026, 4, 20, 10, 0, 0)])
+
+    async def test_incremental_refresh_reloads_vectors_in_process_without_working_set(self):
+        rows = [_row(1, [1.0, 0.0]), _row(2, [0.99, 0.01]), _row(3, [0.0, 1.0])]
+        conn = _FakeConn(rows)
+
+        with patch.object(duplicate_detection, "get_db_pool", AsyncMock(return_value=_FakePool(conn))):
+            await duplicate_detection.refresh_project_duplicates(7, threshold=0.9)
+            # 模拟另一个 worker：本进程没有向量矩阵，但表中有上次的任务对与水位
+            duplicate_detection._working_sets.clear()
+            conn.rows = rows + [_row(4, [0.01, 0.99], updated_at=datetime(2026, 4, 21))]
+            result = await duplicate_detection.refresh_project_duplicates(7, threshold=0.9)
+
+        self.assertEqual(result["status"], "ready")
+        self.assertEqual(result["refresh_mode"], "incremental")
+        self.assertEqual(result["changed_tasks"], 1)
+        self.assertEqual(conn.full_loads, 2)
+        self.assertEqual([cluster["task_ids"] for cluster in result["clusters"]], [[1, 2], [3, 4]])
+
+    async def test_scan_running_elsewhere_returns_stored_status(self):
+        conn = _FakeConn([_row(1, [1.0, 0.0])])
+        conn.scans[7] = {"pairs": "[]", "running": True}
+
+        with patch.object(duplicate_detection, "get_db_pool", AsyncMock(return_value=_FakePool(conn))):
+            result = await duplicate_detection.refresh_project_duplicates(7, threshold=0.9)
+
+        self.assertEqual(result, {"project_id": 7, "status": "running"})
+        self.assertEqual(conn.since_args, [])
+
+    def test_working_sets_are_bounded(self):
+        with patch.object(duplicate_detection, "DUPLICATE_SCAN_CACHE_PROJECTS", 2):
+            for project_id in (1, 2, 3):
+                duplicate_detection._remember_working_set(
+                    project_id, duplicate_detection._ProjectDuplicateState(0.9, "model")
+                )
+
+        self.assertEqual(list(duplicate_detection._working_sets), [2, 3])
+
+    async def test_threshold_change_forces_full_scan(self):
+        conn = _FakeConn([_row(1, [1.0, 0.0]), _row(2, [0.8, 0.6])])
+
+        with patch.object(duplicate_detection, "get_db_pool", AsyncMock(return_value=_FakePool(conn))):
+            await duplicate_detection.refresh_project_duplicates(7, threshold=0.9)
+            result = await duplicate_detection.refresh_project_duplicates(7, threshold=0.75)
+
+        self.assertEqual(result["refresh_mode"], "full")
+        self.assertEqual([cluster["task_ids"] for cluster in result["clusters"]], [[1, 2]])
+
+    async def test_scheduled_refresh_skips_projects_never_scanned(self):
+        conn = _FakeConn([_row(1, [1.0, 0.0])])
+
+        with patch.object(duplicate_detection, "get_db_pool", AsyncMock(return_value=_FakePool(conn))), patch.object(
+            duplicate_detection, "refresh_project_duplicates", AsyncMock()
+        ) as refresh_mock:
+            await duplicate_detection._refresh_if_scanned(3)
+
+        refresh_mock.assert_not_awaited()
+        self.assertNotIn(3, duplicate_detection._scheduled_refreshes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+from app.services import embedding_backfill
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for row in self.rows:
+            yield row
+
+
+class _FakeConn:
+    def __init__(self, rows=None):
+        self.rows = rows or []
+        self.cursor_args = None
+        self.transactions = []
+
+    @asynccontextmanager
+    async def transaction(self, **kwargs):
+        self.transactions.append(kwargs)
+        yield
+
+    async def fetch(self, sql, *args):
+        # 写入前复核任务当前状态（FOR SHARE）
+        return [row for row in self.rows if row["id"] in args[0]]
+
+    def cursor(self, sql, *args, prefetch=None):
+        self.cursor_args = (args, prefetch)
+        return _FakeCursor([row for row in self.rows if row["id"] > args[0]])
+
+
+class _FakePool:
+    def __init__(self, read_conn, write_conn):
+        self.conns = [read_conn, write_conn]
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conns.pop(0)
+
+
+def _task_row(task_id, title, content_hash=None, model_id=None):
+    return {
+        "id": task_id,
+        "title": title,
+        "description": None,
+        "deleted_at": None,
+        "content_hash": content_hash,
+        "model_id": model_id,
+    }
+
+
+class EmbeddingBackfillTests(unittest.IsolatedAsyncioTestCase):
+    async def _run_backfill(self, rows, current_rows=None, **kwargs):
+        read_conn = _FakeConn(rows)
+        write_conn = _FakeConn(rows if current_rows is None else current_rows)
+        checkpoints = []
+
+        async def fake_generate(texts):
+            return [[float(idx)] for idx, _ in enumerate(texts)]
+
+        with patch.object(
+            embedding_backfill, "get_db_pool", AsyncMock(return_value=_FakePool(read_conn, write_conn))
+        ), patch.object(
+            embedding_backfill, "generate_embeddings", AsyncMock(side_effect=fake_generate)
+        ) as generate_mock, patch.object(
+            embedding_backfill, "copy_task_embeddings", AsyncMock()
+        ) as copy_mock:
+            progress = await embedding_backfill.backfill_task_embeddings(
+                on_progress=lambda p: checkpoints.append(p.last_task_id),
+                **kwargs,
+            )
+        return progress, read_conn, generate_mock, copy_mock, checkpoints
+
+    async def test_backfill_streams_in_batches_and_reports_checkpoints(self):
+        rows = [_task_row(task_id, f"任务 {task_id}") for task_id in range(1, 6)]
+
+        progress, read_conn, generate_mock, copy_mock, checkpoints = await self._run_backfill(rows, batch_size=2)
+
+        self.assertEqual(read_conn.cursor_args, ((0, embedding_backfill.get_embedding_model_id()), 2))
+        self.assertEqual(read_conn.transactions, [{"readonly": True}])
+        self.assertEqual(checkpoints, [2, 4, 5])
+        self.assertEqual(generate_mock.await_count, 3)
+        self.assertEqual([item[0] for call in copy_mock.await_args_list for item in call.args[1]], [1, 2, 3, 4, 5])
+        self.assertEqual((progress.scanned, progress.encoded, progress.batches), (5, 5, 3))
+
+    async def test_backfill_resumes_after_checkpoint_and_skips_unchanged(self):
+        model_id = embedding_backfill.get_embedding_model_id()
+        unchanged_text = embedding_backfill.build_task_embedding_text("已同步", None)
+        rows = [
+            _task_row(1, "已处理"),
+            _task_row(2, "已同步", embedding_backfill.compute_content_hash(unchanged_text), model_id),
+            _task_row(3, "重复"),
+            _task_row(4, "重复"),
+        ]
+
+        progress, read_conn, generate_mock, copy_mock, _ = await self._run_backfill(rows, start_after_id=1)
+
+        self.assertEqual(read_conn.cursor_args[0], (1, model_id))
+        generate_mock.assert_awaited_once_with([embedding_backfill.build_task_embedding_text("重复", None)])
+        self.assertEqual([item[0] for item in copy_mock.await_args.args[1]], [3, 4])
+        self.assertEqual(progress.to_dict()["skipped"], 1)
+        self.assertEqual(progress.last_task_id, 4)
+
+    async def test_backfill_force_reencodes_unchanged_tasks(self):
+        model_id = embedding_backfill.get_embedding_model_id()
+        text = embedding_backfill.build_task_embedding_text("已同步", None)
+        rows = [_task_row(1, "已同步", embedding_backfill.compute_content_hash(text), model_id)]
+
+        progress, _, generate_mock, _, _ = await self._run_backfill(rows, force=True)
+
+        generate_mock.assert_awaited_once_with([text])
+        self.assertEqual((progress.encoded, progress.skipped), (1, 0))
+
+    async def test_backfill_skips_tasks_changed_after_snapshot(self):
+        rows = [_task_row(1, "旧标题"), _task_row(2, "未修改"), _task_row(3, "将被删除")]
+        current_rows = [_task_row(1, "新标题"), _task_row(2, "未修改"), {**_task_row(3, "将被删除"), "deleted_at": "x"}]
+
+        progress, _, generate_mock, copy_mock, _ = await self._run_backfill(rows, current_rows=current_rows)
+
+        self.assertEqual(generate_mock.await_count, 1)
+        # 回填期间被修改/删除的任务由 outbox 同步，不用快照里的旧文本覆盖
+        self.assertEqual([item[0] for item in copy_mock.await_args.args[1]], [2])
+        self.assertEqual((progress.encoded, progress.to_dict()["stale"]), (1, 2))
+
+    async def test_version_stats_report_coverage_of_live_tasks(self):
+        model_id = embedding_backfill.get_embedding_model_id()
+
+        class _StatsConn:
+            async def fetchval(self, sql, *args):
+                return 4
+
+            async def fetch(self, sql, *args):
+                return [
+                    {"model_id": "onnx:all-MiniLM-L6-v2:model_quantized", "embedding_dim": 384,
+                     "embeddings": 2, "covered": 2, "last_updated_at": None},
+                    {"model_id": model_id, "embedding_dim": 384, "embeddings": 5, "covered": 4, "last_updated_at": None},
+                ]
+
+        class _StatsPool:
+            @asynccontextmanager
+            async def acquire(self):
+                yield _StatsConn()
+
+        with patch.object(embedding_backfill, "get_db_pool", AsyncMock(return_value=_StatsPool())):
+            stats = await embedding_backfill.get_embedding_version_stats()
+
+        self.assertEqual(stats["active_model_id"], model_id)
+        self.assertEqual(
+            [(v["coverage"], v["active"]) for v in stats["versions"]],
+            [(0.5, False), (1.0, True)],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+from app.services import embedding_outbox
+
+
+class _FakeConn:
+    def __init__(self, entries, tasks, embeddings=None):
+        self.entries = entries
+        self.tasks = tasks
+        self.embeddings = embeddings or []
+        self.executed = []
+        self.upserted = []
+        # encode 之后写入前复核到的任务状态（None 表示未变化）
+        self.tasks_at_write = None
+        self.in_transaction = False
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+
+    async def fetch(self, sql, *args):
+        if "FROM task_embedding_outbox" in sql:
+            return self.entries
+        if "FROM task_embeddings" in sql:
+            return self.embeddings
+        if "FOR SHARE" in sql and self.tasks_at_write is not None:
+            return self.tasks_at_write
+        return self.tasks
+
+    async def execute(self, sql, *args):
+        self.executed.append((" ".join(sql.split()), args))
+
+    async def executemany(self, sql, rows):
+        self.upserted.extend(rows)
+
+
+class _FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.in_use = False
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.in_use = True
+        try:
+            yield self.conn
+        finally:
+            self.in_use = False
+
+
+class EmbeddingOutboxTests(unittest.IsolatedAsyncioTestCase):
+    async def test_drain_upserts_live_tasks_and_removes_deleted_ones(self):
+        conn = _FakeConn(
+            entries=[
+                {"id": 1, "task_id": 10},
+                {"id": 2, "task_id": 10},
+                {"id": 3, "task_id": 11},
+            ],
+            tasks=[
+                {"id": 10, "title": "修复登录", "description": "token 过期", "project_id": 3, "deleted_at": None},
+                {"id": 11, "title": "旧任务", "description": None, "project_id": 3, "deleted_at": "2026-03-01"},
+            ],
+        )
+
+        with patch.object(embedding_outbox, "get_db_pool", AsyncMock(return_value=_FakePool(conn))), patch.object(
+            embedding_outbox, "generate_embeddings", AsyncMock(return_value=[[0.1, 0.2]])
+        ) as generate_mock:
+            processed = await embedding_outbox.drain_embedding_outbox(batch_size=10)
+
+        self.assertEqual(processed, 3)
+        generate_mock.assert_awaited_once_with(["修复登录\ntoken 过期"])
+        self.assertEqual([row[0] for row in conn.upserted], [10])
+        statements = [sql for sql, _ in conn.executed]
+        self.assertTrue(any(sql.startswith("DELETE FROM task_embeddings") for sql in statements))
+        self.assertEqual(conn.executed[-1][1], ([1, 2, 3],))
+        self.assertTrue(conn.executed[-1][0].startswith("DELETE FROM task_embedding_outbox"))
+
+    async def test_drain_skips_unchanged_tasks_and_dedupes_identical_texts(self):
+        model_id = embedding_outbox.get_embedding_model_id()
+        conn = _FakeConn(
+            entries=[{"id": 1, "task_id": 10}, {"id": 2, "task_id": 11}, {"id": 3, "task_id": 12}],
+            tasks=[
+                {"id": 10, "title": "修复登录", "description": None, "project_id": 3, "deleted_at": None},
+                {"id": 11, "title": "修复登录", "description": None, "project_id": 3, "deleted_at": None},
+                {"id": 12, "title": "旧任务", "description": None, "project_id": 3, "deleted_at": None},
+            ],
+            embeddings=[
+                {
+                    "task_id": 12,
+                    "content_hash": embedding_outbox.compute_content_hash(
+                        embedding_outbox.build_task_embedding_text("旧任务", None)
+                    ),
+                    "model_id": model_id,
+                },
+            ],
+        )
+
+        with patch.object(embedding_outbox, "get_db_pool", AsyncMock(return_value=_FakePool(conn))), patch.object(
+            embedding_outbox, "generate_embeddings", AsyncMock(return_value=[[0.1, 0.2]])
+        ) as generate_mock:
+            processed = await embedding_outbox.drain_embedding_outbox(batch_size=10)
+
+        self.assertEqual(processed, 3)
+        text = embedding_outbox.build_task_embedding_text("修复登录", None)
+        generate_mock.assert_awaited_once_with([text])
+        self.assertEqual([row[0] for row in conn.upserted], [10, 11])
+        self.assertEqual(conn.upserted[0][2], embedding_outbox.compute_content_hash(text))
+        self.assertEqual(conn.upserted[0][3], model_id)
+
+    async def test_drain_encodes_outside_transaction_and_connection(self):
+        conn = _FakeConn(
+            entries=[{"id": 1, "task_id": 10}],
+            tasks=[{"id": 10, "title": "修复登录", "description": None, "project_id": 3, "deleted_at": None}],
+        )
+        pool = _FakePool(conn)
+        encode_states = []
+
+        async def encode(texts):
+            encode_states.append((pool.in_use, conn.in_transaction))
+            return [[0.1, 0.2]]
+
+        with patch.object(embedding_outbox, "get_db_pool", AsyncMock(return_value=pool)), patch.object(
+            embedding_outbox, "generate_embeddings", AsyncMock(side_effect=encode)
+        ):
+            processed = await embedding_outbox.drain_embedding_outbox(batch_size=10)
+
+        self.assertEqual(processed, 1)
+        self.assertEqual(encode_states, [(False, False)])
+
+    async def test_drain_skips_results_made_stale_during_encode(self):
+        conn = _FakeConn(
+            entries=[{"id": 1, "task_id": 10}, {"id": 2, "task_id": 11}],
+            tasks=[
+                {"id": 10, "title": "修复登录", "description": None, "project_id": 3, "deleted_at": None},
+                {"id": 11, "title": "旧任务", "description": None, "project_id": 3, "deleted_at": "2026-03-01"},
+            ],
+        )
+        # encode 期间任务 10 被改名、任务 11 被恢复，新的 outbox 记录会重新同步
+        conn.tasks_at_write = [
+            {"id": 10, "title": "修复登录回调", "description": None, "deleted_at": None},
+            {"id": 11, "title": "旧任务", "description": None, "deleted_at": None},
+        ]
+
+        with patch.object(embedding_outbox, "get_db_pool", AsyncMock(return_value=_FakePool(conn))), patch.object(
+            embedding_outbox, "generate_embeddings", AsyncMock(return_value=[[0.1, 0.2]])
+        ):
+            processed = await embedding_outbox.drain_embedding_outbox(batch_size=10)
+
+        self.assertEqual(processed, 2)
+        self.assertEqual(conn.upserted, [])
+        self.assertEqual(len(conn.executed), 1)
+        self.assertTrue(conn.executed[0][0].startswith("DELETE FROM task_embedding_outbox"))
+
+    async def test_drain_keeps_entries_for_retry_when_sync_fails(self):
+        conn = _FakeConn(
+            entries=[{"id": 5, "task_id": 20}],
+            tasks=[{"id": 20, "title": "实现评论", "description": None, "project_id": 3, "deleted_at": None}],
+        )
+
+        with patch.object(embedding_outbox, "get_db_pool", AsyncMock(return_value=_FakePool(conn))), patch.object(
+            embedding_outbox, "generate_embeddings", AsyncMock(side_effect=RuntimeError("model down"))
+        ):
+            processed = await embedding_outbox.drain_embedding_outbox(batch_size=10)
+
+        self.assertEqual(processed, 0)
+        self.assertEqual(len(conn.executed), 1)
+        sql, args = conn.executed[0]
+        self.assertTrue(sql.startswith("UPDATE task_embedding_outbox"))
+        self.assertEqual(args[0], [5])
+        self.assertIn("model down", args[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from app.services import notifications, permission_cache
+
+
+def _values_query(result):
+    return SimpleNamespace(values_list=AsyncMock(return_value=result))
+
+
+class PermissionCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        permission_cache.clear_permission_cache()
+        self.addCleanup(permission_cache.clear_permission_cache)
+
+    async def test_visible_projects_are_cached_until_project_invalidation(self):
+        with patch.object(
+            permission_cache.ProjectMember, "filter", return_value=_values_query([3, 8])
+        ) as member_filter, patch.object(
+            permission_cache.Project,
+            "filter",
+            side_effect=[_values_query([3, 5]), _values_query([(3, 11), (5, 12)])] * 2,
+        ) as project_filter:
+            first = await permission_cache.get_visible_projects(7)
+            second = await permission_cache.get_visible_projects(7)
+            self.assertEqual(member_filter.call_count, 1)
+
+            permission_cache.invalidate_permission_cache(project_ids=[8])
+            await permission_cache.get_visible_projects(7)
+            self.assertEqual(member_filter.call_count, 1)
+
+            # 项目 5 在用户 7 的可见项目中，失效后重新查询
+            permission_cache.invalidate_permission_cache(project_ids=[5])
+            await permission_cache.get_visible_projects(7)
+
+        self.assertEqual(first, {3: 11, 5: 12})
+        self.assertEqual(second, first)
+        self.assertEqual(member_filter.call_count, 2)
+        self.assertEqual(project_filter.call_args_list[0].kwargs, {"owner_id": 7, "deleted_at__isnull": True})
+        self.assertEqual(project_filter.call_args_list[1].kwargs, {"id__in": [3, 5, 8], "deleted_at__isnull": True})
+
+    async def test_invalidation_during_load_is_not_overwritten(self):
+        async def load_members(*args, **kwargs):
+            permission_cache.invalidate_permission_cache(project_ids=[3])
+            return [1, 2]
+
+        query = SimpleNamespace(values_list=AsyncMock(side_effect=load_members))
+        with patch.object(permission_cache.ProjectMember, "filter", return_value=query):
+            await permission_cache.get_project_member_ids(3)
+            await permission_cache.get_project_member_ids(3)
+
+        self.assertEqual(query.values_list.await_count, 2)
+
+    async def test_cached_user_is_returned_as_copy(self):
+        user = SimpleNamespace(id=7, username="alice")
+
+        with patch.object(permission_cache.User, "get_or_none", AsyncMock(return_value=user)) as get_user:
+            first = await permission_cache.get_cached_user(7)
+            first.username = "changed"
+            second = await permission_cache.get_cached_user(7)
+
+        get_user.assert_awaited_once_with(id=7)
+        self.assertEqual(second.username, "alice")
+
+    async def test_publish_invalidates_locally_and_notifies_other_workers(self):
+        permission_cache._project_members_cache.put(3, frozenset({1}), permission_cache._project_members_cache.generation)
+
+        with patch.object(permission_cache, "publish_notification", AsyncMock()) as publish_mock:
+            await permission_cache.publish_permission_invalidation(user_ids=[9, 9], project_ids=[3])
+
+        self.assertEqual(len(permission_cache._project_members_cache), 0)
+        channel, message = publish_mock.await_args.args
+        self.assertEqual(channel, permission_cache.PERMISSION_INVALIDATION_CHANNEL)
+        self.assertEqual((message["user_ids"], message["project_ids"]), ([9], [3]))
+
+    def test_remote_notification_invalidates_and_own_notification_is_skipped(self):
+        cache = permission_cache._project_members_cache
+        cache.put(3, frozenset({1}), cache.generation)
+
+        permission_cache._handle_invalidation_notification({"origin": permission_cache._ORIGIN, "project_ids": [3]})
+        self.assertEqual(len(cache), 1)
+
+        permission_cache._handle_invalidation_notification({"origin": "other", "project_ids": [3]})
+        self.assertEqual(len(cache), 0)
+
+
+class PostgresListenerTests(unittest.IsolatedAsyncioTestCase):
+    def test_dispatch_routes_json_payload_to_channel_handlers(self):
+        listener = notifications.PostgresListener(dsn=None)
+        handler = Mock()
+        other = Mock()
+        listener.subscribe("permissions", handler)
+        listener.subscribe("tasks", other)
+
+        listener._dispatch(None, 1, "permissions", json.dumps({"user_ids": [7]}))
+        listener._dispatch(None, 1, "permissions", "not json")
+
+        handler.assert_called_once_with({"user_ids": [7]})
+        other.assert_not_called()
+
+    async def test_listener_reconnects_after_connection_failure(self):
+        listener = notifications.PostgresListener(dsn=None)
+        attempts = []
+
+        async def fail_then_block(reconnected):
+            attempts.append(reconnected)
+            if len(attempts) == 1:
+                raise OSError("connection refused")
+            await asyncio.Event().wait()
+
+        with patch.object(listener, "_listen_once", side_effect=fail_then_block), patch.object(
+            notifications, "_INITIAL_RECONNECT_DELAY_SECONDS", 0
+        ):
+            task = listener.start()
+            for _ in range(5):
+                await asyncio.sleep(0)
+            await listener.stop()
+
+        self.assertTrue(task.done())
+        # 第二次连接标记为重连，LISTEN 生效后订阅方整体失效本地状态
+        self.assertEqual(attempts, [False, True])
+
+if __name__ == "__main__":
+    unittest.main()
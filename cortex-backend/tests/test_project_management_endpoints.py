@@ -1,7 +1,7 @@
 import unittest
 from datetime import datetime
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, Mock, call, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from fastapi import HTTPException
 
@@ -62,8 +62,6 @@ class ProjectManagementEndpointTests(unittest.IsolatedAsyncioTestCase):
             created_at=datetime(2026, 3, 7, 8, 0, 0),
             updated_at=datetime(2026, 3, 7, 8, 5, 0),
         )
-        joined_query = SimpleNamespace(values_list=AsyncMock(return_value=[3, 8]))
-        owned_query = SimpleNamespace(values_list=AsyncMock(return_value=[3, 5]))
         final_query = SimpleNamespace(
             order_by=Mock(),
             all=AsyncMock(return_value=[project]),
@@ -71,23 +69,17 @@ class ProjectManagementEndpointTests(unittest.IsolatedAsyncioTestCase):
         final_query.order_by.return_value = final_query
         member = SimpleNamespace(id=7, username="owner", email="owner@example.com")
 
-        with patch.object(projects_endpoint.ProjectMember, "filter", return_value=joined_query) as member_filter, patch.object(
-            projects_endpoint.Project, "filter", side_effect=[owned_query, final_query]
+        with patch.object(
+            projects_endpoint, "get_visible_projects", AsyncMock(return_value={8: 11, 3: 11, 5: 12})
+        ) as visible_mock, patch.object(
+            projects_endpoint.Project, "filter", return_value=final_query
         ) as project_filter, patch.object(
             projects_endpoint, "_get_project_members", AsyncMock(return_value=[member])
         ):
             result = await projects_endpoint.read_my_projects(current_user=current_user)
 
-        member_filter.assert_called_once_with(user_id=7)
-        joined_query.values_list.assert_awaited_once_with("project_id", flat=True)
-        owned_query.values_list.assert_awaited_once_with("id", flat=True)
-        self.assertEqual(
-            project_filter.call_args_list,
-            [
-                call(owner_id=7, deleted_at__isnull=True),
-                call(id__in=[3, 5, 8], deleted_at__isnull=True),
-            ],
-        )
+        visible_mock.assert_awaited_once_with(7)
+        project_filter.assert_called_once_with(id__in=[3, 5, 8], deleted_at__isnull=True)
         final_query.order_by.assert_called_once_with("-updated_at", "-id")
         self.assertEqual(len(result), 1)
         self.assertEqual(result[0]["name"], "Owned Project")
@@ -95,18 +87,13 @@ class ProjectManagementEndpointTests(unittest.IsolatedAsyncioTestCase):
 
     async def test_read_my_projects_returns_empty_when_no_visible_project(self):
         current_user = SimpleNamespace(id=9)
-        joined_query = SimpleNamespace(values_list=AsyncMock(return_value=[]))
-        owned_query = SimpleNamespace(values_list=AsyncMock(return_value=[]))
 
-        with patch.object(projects_endpoint.ProjectMember, "filter", return_value=joined_query) as member_filter, patch.object(
-            projects_endpoint.Project, "filter", return_value=owned_query
+        with patch.object(projects_endpoint, "get_visible_projects", AsyncMock(return_value={})), patch.object(
+            projects_endpoint.Project, "filter"
         ) as project_filter:
             result = await projects_endpoint.read_my_projects(current_user=current_user)
 
-        member_filter.assert_called_once_with(user_id=9)
-        joined_query.values_list.assert_awaited_once_with("project_id", flat=True)
-        owned_query.values_list.assert_awaited_once_with("id", flat=True)
-        project_filter.assert_called_once_with(owner_id=9, deleted_at__isnull=True)
+        project_filter.assert_not_called()
         self.assertEqual(result, [])
 
     async def test_create_project_returns_serializable_payload(self):
@@ -126,7 +113,7 @@ class ProjectManagementEndpointTests(unittest.IsolatedAsyncioTestCase):
             projects_endpoint.ProjectMember, "create", AsyncMock()
         ) as member_create_mock, patch.object(
             projects_endpoint, "_get_project_members", AsyncMock(return_value=[member])
-        ):
+        ), patch.object(projects_endpoint, "publish_permission_invalidation", AsyncMock()) as invalidate_mock:
             result = await projects_endpoint.create_project(
                 project_in=ProjectCreate(name="AI Review", description="回写 PR 评论"),
                 current_user=current_user,
@@ -139,6 +126,7 @@ class ProjectManagementEndpointTests(unittest.IsolatedAsyncioTestCase):
             owner=current_user,
         )
         member_create_mock.assert_awaited_once_with(project=project, user=current_user)
+        invalidate_mock.assert_awaited_once_with(user_ids=[7])
         self.assertEqual(result["owner_id"], 7)
         self.assertEqual(result["organization_id"], 11)
         self.assertEqual(result["members"], [member])
@@ -196,7 +184,9 @@ class ProjectManagementEndpointTests(unittest.IsolatedAsyncioTestCase):
 
         with patch.object(projects_endpoint, "get_project_by_id", AsyncMock(return_value=project)), patch.object(
             projects_endpoint.Task, "filter"
-        ) as task_filter:
+        ) as task_filter, patch.object(
+            projects_endpoint, "publish_permission_invalidation", AsyncMock()
+        ) as invalidate_mock:
             task_filter.return_value.count = AsyncMock(return_value=0)
 
             result = await projects_endpoint.delete_project(
@@ -206,6 +196,7 @@ class ProjectManagementEndpointTests(unittest.IsolatedAsyncioTestCase):
 
         task_filter.assert_called_once_with(project=project, deleted_at__isnull=True)
         project.save.assert_awaited_once()
+        invalidate_mock.assert_awaited_once_with(project_ids=[9])
         self.assertIsInstance(project.deleted_at, datetime)
         self.assertEqual(result["message"], "项目已删除")
 
@@ -2,54 +2,59 @@ import unittest
 from types import SimpleNamespace
 from unittest.mock import AsyncMock, patch
 
-from fastapi import HTTPException
+from fastapi import BackgroundTasks, HTTPException
 from app.api.v1.endpoints import similarity as similarity_endpoint
-from app.schemas.similarity import SimilaritySearchRequest
-
-
-class _FakeCommentQuerySet:
-    def __init__(self, comments):
-        self.comments = comments
-        self.order_args = None
-        self.limit_value = None
-
-    def order_by(self, *args):
-        self.order_args = args
-        return self
-
-    def limit(self, value):
-        self.limit_value = value
-        return self
-
-    async def all(self):
-        return self.comments
+from app.schemas.similarity import SimilarityBatchSearchRequest, SimilaritySearchRequest
 
 
 class SimilarityEndpointTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        visible_patch = patch.object(
+            similarity_endpoint, "_get_visible_project_ids", AsyncMock(return_value=[3, 4])
+        )
+        self.visible_project_ids_mock = visible_patch.start()
+        self.addCleanup(visible_patch.stop)
+
     def test_similarity_router_paths_do_not_repeat_prefix(self):
         paths = {route.path for route in similarity_endpoint.router.routes}
         self.assertIn("/search", paths)
         self.assertIn("/health", paths)
         self.assertNotIn("/similarity/search", paths)
 
-    async def test_build_recommendation_combines_description_and_latest_comments(self):
-        fake_comments = [
-            SimpleNamespace(content=" 优先修复鉴权头格式 "),
-            SimpleNamespace(content="补充回归测试，覆盖 401 场景"),
-        ]
-        fake_qs = _FakeCommentQuerySet(fake_comments)
+    def test_build_recommendation_combines_description_and_latest_comments(self):
+        recommendation = similarity_endpoint._build_recommendation(
+            description="修复登录接口超时问题",
+            comments=[" 优先修复鉴权头格式 ", "补充回归测试，覆盖 401 场景", "  "],
+        )
 
-        with patch.object(similarity_endpoint.TaskComment, "filter", return_value=fake_qs) as filter_mock:
-            recommendation = await similarity_endpoint._build_recommendation(
-                task_id=8,
-                description="修复登录接口超时问题",
+        self.assertEqual(recommendation, "修复登录接口超时问题 / 优先修复鉴权头格式 / 补充回归测试，覆盖 401 场景")
+
+    async def test_fetch_latest_comments_uses_single_window_query(self):
+        connection = SimpleNamespace(
+            execute_query_dict=AsyncMock(
+                return_value=[
+                    {"task_id": 8, "content": "最新评论"},
+                    {"task_id": 8, "content": "次新评论"},
+                    {"task_id": 9, "content": "唯一评论"},
+                ]
             )
+        )
+
+        with patch.object(similarity_endpoint.connections, "get", return_value=connection):
+            comments = await similarity_endpoint._fetch_latest_comments([8, 9, 10])
+
+        connection.execute_query_dict.assert_awaited_once()
+        sql, params = connection.execute_query_dict.await_args.args
+        self.assertIn("ROW_NUMBER() OVER (PARTITION BY task_id ORDER BY created_at DESC, id DESC)", sql)
+        self.assertEqual(params, [[8, 9, 10], 2])
+        self.assertEqual(comments, {8: ["最新评论", "次新评论"], 9: ["唯一评论"]})
+
+    async def test_fetch_latest_comments_skips_query_for_empty_results(self):
+        with patch.object(similarity_endpoint.connections, "get") as get_connection:
+            comments = await similarity_endpoint._fetch_latest_comments([])
 
-        filter_mock.assert_called_once_with(task_id=8)
-        self.assertEqual(fake_qs.order_args, ("-created_at", "-id"))
-        self.assertEqual(fake_qs.limit_value, 2)
-        self.assertIn("修复登录接口超时问题", recommendation)
-        self.assertIn("优先修复鉴权头格式", recommendation)
+        self.assertEqual(comments, {})
+        get_connection.assert_not_called()
 
     async def test_search_similar_includes_recommendation_field(self):
         current_user = SimpleNamespace(id=1)
@@ -68,15 +73,15 @@ class SimilarityEndpointTests(unittest.IsolatedAsyncioTestCase):
         ]
 
         with patch.object(similarity_endpoint, "search_similar_tasks", AsyncMock(return_value=fake_results)), patch.object(
-            similarity_endpoint, "_build_recommendation", AsyncMock(return_value="建议先校验 token 格式")
-        ) as recommendation_mock:
+            similarity_endpoint, "_fetch_latest_comments", AsyncMock(return_value={11: ["建议先校验 token 格式"]})
+        ) as comments_mock:
             response = await similarity_endpoint.search_similar(request=request, current_user=current_user)
 
-        recommendation_mock.assert_awaited_once_with(task_id=11, description="修复 token 解析")
+        comments_mock.assert_awaited_once_with([11])
         self.assertTrue(response.success)
         self.assertEqual(response.total, 1)
         self.assertEqual(response.results[0].task_id, 11)
-        self.assertEqual(response.results[0].recommendation, "建议先校验 token 格式")
+        self.assertEqual(response.results[0].recommendation, "修复 token 解析 / 建议先校验 token 格式")
 
     async def test_search_similar_keeps_results_when_recommendation_fails(self):
         current_user = SimpleNamespace(id=1)
@@ -95,7 +100,7 @@ class SimilarityEndpointTests(unittest.IsolatedAsyncioTestCase):
         ]
 
         with patch.object(similarity_endpoint, "search_similar_tasks", AsyncMock(return_value=fake_results)), patch.object(
-            similarity_endpoint, "_build_recommendation", AsyncMock(side_effect=RuntimeError("db down"))
+            similarity_endpoint, "_fetch_latest_comments", AsyncMock(side_effect=RuntimeError("db down"))
         ):
             response = await similarity_endpoint.search_similar(request=request, current_user=current_user)
 
@@ -104,6 +109,135 @@ class SimilarityEndpointTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(response.results[0].task_id, 11)
         self.assertIsNone(response.results[0].recommendation)
 
+    async def test_search_similar_limits_search_to_visible_projects(self):
+        current_user = SimpleNamespace(id=1)
+        request = SimilaritySearchRequest(text="登录失败", organization_id=2)
+
+        with patch.object(similarity_endpoint, "search_similar_tasks", AsyncMock(return_value=[])) as search_mock:
+            response = await similarity_endpoint.search_similar(request=request, current_user=current_user)
+
+        self.visible_project_ids_mock.assert_awaited_once_with(user_id=1, organization_id=2)
+        self.assertEqual(search_mock.await_args.kwargs["project_ids"], [3, 4])
+        self.assertEqual(search_mock.await_args.kwargs["organization_id"], 2)
+        self.assertTrue(response.success)
+
+    async def test_search_similar_passes_hybrid_mode_and_latency_budget(self):
+        current_user = SimpleNamespace(id=1)
+        request = SimilaritySearchRequest(text="ERR_401 登录", mode="hybrid", latency_budget_ms=150)
+
+        with patch.object(similarity_endpoint, "search_similar_tasks", AsyncMock(return_value=[])) as search_mock:
+            await similarity_endpoint.search_similar(request=request, current_user=current_user)
+
+        self.assertEqual(search_mock.await_args.kwargs["mode"], "hybrid")
+        self.assertEqual(search_mock.await_args.kwargs["latency_budget_ms"], 150)
+
+    async def test_search_similar_batch_returns_results_by_input_index(self):
+        current_user = SimpleNamespace(id=1)
+        request = SimilarityBatchSearchRequest(texts=["登录失败", "导出报表"], exclude_task_ids=[None, 7])
+        fake_results = [
+            [
+                {
+                    "task_id": 11,
+                    "title": "修复登录",
+                    "description": "修复 token 解析",
+                    "status": "DONE",
+                    "priority": "HIGH",
+                    "project_id": 3,
+                    "similarity": 0.82,
+                    "created_at": None,
+                }
+            ],
+            [],
+        ]
+
+        with patch.object(
+            similarity_endpoint, "search_similar_tasks_batch", AsyncMock(return_value=fake_results)
+        ) as batch_mock, patch.object(
+            similarity_endpoint, "_fetch_latest_comments", AsyncMock(return_value={})
+        ) as comments_mock:
+            response = await similarity_endpoint.search_similar_batch(request=request, current_user=current_user)
+
+        self.assertEqual(batch_mock.await_args.kwargs["texts"], ["登录失败", "导出报表"])
+        self.assertEqual(batch_mock.await_args.kwargs["exclude_task_ids"], [None, 7])
+        self.assertEqual(batch_mock.await_args.kwargs["project_ids"], [3, 4])
+        comments_mock.assert_awaited_once_with([11])
+        self.assertTrue(response.success)
+        self.assertEqual([(item.index, item.query, item.total) for item in response.results], [(0, "登录失败", 1), (1, "导出报表", 0)])
+        self.assertEqual(response.results[0].results[0].recommendation, "修复 token 解析")
+
+    def test_batch_request_rejects_misaligned_exclude_ids(self):
+        with self.assertRaises(ValueError):
+            SimilarityBatchSearchRequest(texts=["登录失败", "导出报表"], exclude_task_ids=[1])
+
+    async def test_scan_project_duplicates_schedules_background_refresh(self):
+        current_user = SimpleNamespace(id=1)
+        background_tasks = BackgroundTasks()
+
+        with patch.object(
+            similarity_endpoint,
+            "get_project_duplicates",
+            AsyncMock(return_value={"project_id": 4, "status": "not_scanned"}),
+        ):
+            response = await similarity_endpoint.scan_project_duplicates(
+                project_id=4,
+                background_tasks=background_tasks,
+                threshold=0.9,
+                full=False,
+                current_user=current_user,
+            )
+
+        self.assertEqual(response.status, "scheduled")
+        self.assertEqual(len(background_tasks.tasks), 1)
+        task = background_tasks.tasks[0]
+        self.assertIs(task.func, similarity_endpoint.refresh_project_duplicates)
+        self.assertEqual(task.args, (4,))
+        self.assertEqual(task.kwargs, {"threshold": 0.9, "full": False})
+
+    async def test_scan_project_duplicates_skips_scan_running_in_another_worker(self):
+        background_tasks = BackgroundTasks()
+
+        with patch.object(
+            similarity_endpoint,
+            "get_project_duplicates",
+            AsyncMock(return_value={"project_id": 4, "status": "running"}),
+        ):
+            response = await similarity_endpoint.scan_project_duplicates(
+                project_id=4,
+                background_tasks=background_tasks,
+                threshold=0.9,
+                full=False,
+                current_user=SimpleNamespace(id=1),
+            )
+
+        self.assertEqual(response.status, "running")
+        self.assertEqual(background_tasks.tasks, [])
+
+    async def test_get_project_duplicates_rejects_invisible_project(self):
+        with self.assertRaises(HTTPException) as context:
+            await similarity_endpoint.get_project_duplicate_clusters(project_id=9, current_user=SimpleNamespace(id=1))
+
+        self.assertEqual(context.exception.status_code, 403)
+
+    async def test_search_similar_narrows_to_requested_project(self):
+        current_user = SimpleNamespace(id=1)
+        request = SimilaritySearchRequest(text="登录失败", project_id=4)
+
+        with patch.object(similarity_endpoint, "search_similar_tasks", AsyncMock(return_value=[])) as search_mock:
+            await similarity_endpoint.search_similar(request=request, current_user=current_user)
+
+        self.assertEqual(search_mock.await_args.kwargs["project_ids"], [4])
+
+    async def test_search_similar_rejects_invisible_project(self):
+        current_user = SimpleNamespace(id=1)
+        request = SimilaritySearchRequest(text="登录失败", project_id=99)
+
+        with patch.object(similarity_endpoint, "search_similar_tasks", AsyncMock()) as search_mock:
+            with self.assertRaises(HTTPException) as ctx:
+                await similarity_endpoint.search_similar(request=request, current_user=current_user)
+
+        self.assertEqual(ctx.exception.status_code, 403)
+        search_mock.assert_not_awaited()
+
     async def test_search_similar_degrades_when_embedding_service_unavailable(self):
         current_user = SimpleNamespace(id=1)
         request = SimilaritySearchRequest(text="登录失败", limit=2, threshold=0.5)
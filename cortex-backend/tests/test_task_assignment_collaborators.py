@@ -1,6 +1,7 @@
 import unittest
+from contextlib import nullcontext
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from fastapi import HTTPException
 
@@ -28,8 +29,12 @@ class TaskAssignmentCollaboratorTests(unittest.IsolatedAsyncioTestCase):
         ) as task_create, patch.object(
             tasks_endpoint, "_replace_task_collaborators", AsyncMock()
         ) as replace_collaborators, patch.object(
-            tasks_endpoint, "upsert_task_embedding", AsyncMock()
-        ) as upsert_embedding, patch.object(
+            tasks_endpoint, "in_transaction", side_effect=lambda: nullcontext()
+        ), patch.object(
+            tasks_endpoint, "enqueue_task_embedding", AsyncMock()
+        ) as enqueue_embedding, patch.object(
+            tasks_endpoint, "wake_embedding_outbox_worker"
+        ) as wake_worker, patch.object(
             tasks_endpoint, "_serialize_task", return_value={"id": 101, "collaborator_ids": [10]}
         ) as serialize_task:
             result = await tasks_endpoint.create_task(task_in=task_in, current_user=current_user)
@@ -47,7 +52,8 @@ class TaskAssignmentCollaboratorTests(unittest.IsolatedAsyncioTestCase):
             assignee_id=9,
         )
         replace_collaborators.assert_awaited_once_with(101, [10])
-        upsert_embedding.assert_awaited_once_with(101, "实现 AI 代码审查\n支持回写 PR 评论")
+        enqueue_embedding.assert_awaited_once_with(101)
+        wake_worker.assert_called_once_with()
         serialize_task.assert_called_once_with(created_task, [10])
         self.assertEqual(result, {"id": 101, "collaborator_ids": [10]})
 
@@ -95,8 +101,12 @@ class TaskAssignmentCollaboratorTests(unittest.IsolatedAsyncioTestCase):
         ), patch.object(
             tasks_endpoint, "_replace_task_collaborators", AsyncMock()
         ) as replace_collaborators, patch.object(
-            tasks_endpoint, "upsert_task_embedding", AsyncMock()
-        ) as upsert_embedding, patch.object(
+            tasks_endpoint, "in_transaction", side_effect=lambda: nullcontext()
+        ), patch.object(
+            tasks_endpoint, "enqueue_task_embedding", AsyncMock()
+        ) as enqueue_embedding, patch.object(
+            tasks_endpoint, "wake_embedding_outbox_worker"
+        ), patch.object(
             tasks_endpoint, "_serialize_task", return_value={"id": 5, "assignee_id": 8, "collaborator_ids": [9]}
         ) as serialize_task:
             result = await tasks_endpoint.update_task(
@@ -109,7 +119,7 @@ class TaskAssignmentCollaboratorTests(unittest.IsolatedAsyncioTestCase):
         get_project.assert_awaited_once_with(id=3, deleted_at__isnull=True)
         task.save.assert_awaited_once()
         replace_collaborators.assert_awaited_once_with(5, [9])
-        upsert_embedding.assert_awaited_once_with(5, "新标题\n旧描述")
+        enqueue_embedding.assert_awaited_once_with(5)
         serialize_task.assert_called_once_with(task, [9])
         self.assertEqual(task.assignee_id, 8)
         self.assertEqual(task.title, "新标题")
@@ -137,6 +147,10 @@ class TaskAssignmentCollaboratorTests(unittest.IsolatedAsyncioTestCase):
         ), patch.object(
             tasks_endpoint, "_replace_task_collaborators", AsyncMock()
         ) as replace_collaborators, patch.object(
+            tasks_endpoint, "in_transaction", side_effect=lambda: nullcontext()
+        ), patch.object(
+            tasks_endpoint, "enqueue_task_embedding", AsyncMock()
+        ) as enqueue_embedding, patch.object(
             tasks_endpoint, "_serialize_task", return_value={"id": 5, "assignee_id": 9, "collaborator_ids": [8]}
         ) as serialize_task:
             result = await tasks_endpoint.update_task(
@@ -147,27 +161,49 @@ class TaskAssignmentCollaboratorTests(unittest.IsolatedAsyncioTestCase):
 
         collaborator_map_mock.assert_awaited_once_with([5])
         replace_collaborators.assert_awaited_once_with(5, [8])
+        enqueue_embedding.assert_not_awaited()
         serialize_task.assert_called_once_with(task, [8])
         self.assertEqual(task.assignee_id, 9)
         self.assertEqual(result, {"id": 5, "assignee_id": 9, "collaborator_ids": [8]})
 
     async def test_ensure_task_access_allows_collaborator(self):
         current_user = SimpleNamespace(id=10)
-        task = SimpleNamespace(id=5, assignee_id=7, project_id=3)
-        collaborator_qs = SimpleNamespace(exists=AsyncMock(return_value=True))
+        task = SimpleNamespace(id=5, direct_access=True, project_active=False, project_access=False)
+        task_qs = SimpleNamespace(first=AsyncMock(return_value=task))
+        filter_qs = SimpleNamespace(annotate=Mock(return_value=task_qs))
 
-        with patch.object(tasks_endpoint.Task, "get_or_none", AsyncMock(return_value=task)), patch.object(
-            tasks_endpoint.TaskCollaborator, "filter", return_value=collaborator_qs
+        with patch.object(tasks_endpoint.Task, "filter", return_value=filter_qs) as task_filter, patch.object(
+            tasks_endpoint.TaskCollaborator, "filter"
         ) as collaborator_filter, patch.object(
             tasks_endpoint.Project, "get_or_none", AsyncMock()
         ) as get_project:
             result = await tasks_endpoint._ensure_task_access(task_id=5, current_user=current_user)
 
-        collaborator_filter.assert_called_once_with(task_id=5, user_id=10)
-        collaborator_qs.exists.assert_awaited_once_with()
+        # 任务与访问判定在同一条查询中取回，不再逐条查询协作者/项目/成员
+        task_filter.assert_called_once_with(id=5, deleted_at__isnull=True)
+        task_qs.first.assert_awaited_once_with()
+        collaborator_filter.assert_not_called()
         get_project.assert_not_awaited()
         self.assertEqual(result, task)
 
+    async def test_ensure_task_access_checks_project_membership_in_same_query(self):
+        current_user = SimpleNamespace(id=10)
+        member_task = SimpleNamespace(id=5, direct_access=False, project_active=True, project_access=True)
+        outsider_task = SimpleNamespace(id=6, direct_access=False, project_active=True, project_access=False)
+        filter_qs = SimpleNamespace(
+            annotate=Mock(return_value=SimpleNamespace(first=AsyncMock(side_effect=[member_task, outsider_task])))
+        )
+
+        with patch.object(tasks_endpoint.Task, "filter", return_value=filter_qs):
+            result = await tasks_endpoint._ensure_task_access(task_id=5, current_user=current_user)
+            with self.assertRaises(HTTPException) as context:
+                await tasks_endpoint._ensure_task_access(task_id=6, current_user=current_user)
+
+        self.assertEqual(result, member_task)
+        self.assertEqual(context.exception.status_code, 403)
+        access_sql = filter_qs.annotate.call_args.kwargs["project_access"].sql
+        self.assertIn("p.owner_id = 10", access_sql)
+        self.assertIn("pm.user_id = 10", access_sql)
 
 if __name__ == "__main__":
     unittest.main()
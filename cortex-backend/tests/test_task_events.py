@@ -0,0 +1,173 @@
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from app.api.v1.endpoints import tasks as tasks_endpoint
+from app.services import task_events
+
+
+def _event(cursor, event_type="task.updated", project_id=7):
+    return {
+        "id": task_events.format_task_event_cursor(cursor),
+        "cursor": cursor,
+        "type": event_type,
+        "project_id": project_id,
+        "task_id": 42,
+        "payload": {"id": 42, "status": "DONE"},
+        "created_at": "2026-05-01T09:00:00+00:00",
+    }
+
+
+def _parse_sse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+    return fields.get("id"), fields.get("event"), json.loads(fields["data"])
+
+
+class TaskEventStreamTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.check_access = AsyncMock(return_value=True)
+
+    async def test_stream_starts_at_head_and_wakes_on_project_notification(self):
+        fetch_mock = AsyncMock(side_effect=[[], [_event((500, 12), "task.created")], []])
+
+        with patch.object(task_events, "get_latest_task_event_cursor", AsyncMock(return_value=(498, 11))), patch.object(
+            task_events, "fetch_task_events", fetch_mock
+        ):
+            stream = task_events.stream_task_events(7, None, self.check_access, heartbeat_seconds=10)
+            next_chunk = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0)
+            self.assertEqual(fetch_mock.await_args.args[:2], (7, (498, 11)))
+
+            # 其他项目的通知不会唤醒
+            task_events._handle_task_event_notification({"id": 99, "project_id": 8})
+            await asyncio.sleep(0)
+            self.assertEqual(fetch_mock.await_count, 1)
+
+            task_events._handle_task_event_notification({"id": 12, "project_id": 7})
+            chunk = await next_chunk
+            await stream.aclose()
+
+        self.assertEqual(_parse_sse(chunk)[:2], ("500-12", "task.created"))
+        self.assertEqual(_parse_sse(chunk)[2]["payload"]["status"], "DONE")
+        self.assertNotIn(7, task_events._project_waiters)
+
+    async def test_stream_resumes_after_last_event_id_in_commit_order(self):
+        # id 9 的事务先提交（xid 更小），排在 id 6 之前
+        fetch_mock = AsyncMock(side_effect=[[_event((40, 9), "comment.created"), _event((41, 6))], []])
+
+        with patch.object(task_events, "is_task_event_cursor_expired", AsyncMock(return_value=False)), patch.object(
+            task_events, "fetch_task_events", fetch_mock
+        ):
+            stream = task_events.stream_task_events(7, (39, 5), self.check_access, heartbeat_seconds=10, batch_size=2)
+            chunks = [await stream.__anext__(), await stream.__anext__()]
+            next_fetch = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0)
+            next_fetch.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await next_fetch
+
+        self.assertEqual(fetch_mock.await_args_list[0].args[:2], (7, (39, 5)))
+        self.assertEqual(fetch_mock.await_args_list[1].args[:2], (7, (41, 6)))
+        self.assertEqual([_parse_sse(chunk)[0] for chunk in chunks], ["40-9", "41-6"])
+
+    async def test_expired_cursor_sends_reset_before_new_events(self):
+        with patch.object(task_events, "is_task_event_cursor_expired", AsyncMock(return_value=True)), patch.object(
+            task_events, "get_latest_task_event_cursor", AsyncMock(return_value=(80, 30))
+        ), patch.object(task_events, "fetch_task_events", AsyncMock(return_value=[_event((81, 31))])) as fetch_mock:
+            stream = task_events.stream_task_events(7, (3, 2), self.check_access)
+            reset = await stream.__anext__()
+            event = await stream.__anext__()
+            await stream.aclose()
+
+        self.assertEqual(_parse_sse(reset)[:2], ("80-30", "reset"))
+        self.assertEqual(fetch_mock.await_args.args[:2], (7, (80, 30)))
+        self.assertEqual(_parse_sse(event)[0], "81-31")
+
+    async def test_idle_stream_sends_heartbeat_and_ends_when_access_is_lost(self):
+        self.check_access.side_effect = [True, False]
+
+        with patch.object(task_events, "get_latest_task_event_cursor", AsyncMock(return_value=(0, 0))), patch.object(
+            task_events, "fetch_task_events", AsyncMock(return_value=[])
+        ):
+            chunks = [
+                chunk
+                async for chunk in task_events.stream_task_events(7, None, self.check_access, heartbeat_seconds=0)
+            ]
+
+        self.assertEqual(chunks, [": keep-alive\n\n"])
+        self.assertEqual(self.check_access.await_count, 2)
+
+    async def test_busy_stream_rechecks_access_and_ends_when_revoked(self):
+        self.check_access.return_value = False
+        fetch_mock = AsyncMock(side_effect=[[_event((50, 1))], [_event((51, 2))], [_event((52, 3))]])
+
+        with patch.object(task_events, "is_task_event_cursor_expired", AsyncMock(return_value=False)), patch.object(
+            task_events, "fetch_task_events", fetch_mock
+        ), patch.object(task_events.time, "monotonic", side_effect=[0, 1, 2, 20]):
+            # 每批读满 batch_size，事件流从不空闲，也不会走心跳分支
+            chunks = [
+                chunk
+                async for chunk in task_events.stream_task_events(
+                    7, (49, 0), self.check_access, heartbeat_seconds=15, batch_size=1
+                )
+            ]
+
+        self.assertEqual([_parse_sse(chunk)[0] for chunk in chunks], ["50-1", "51-2"])
+        self.check_access.assert_awaited_once()
+
+    async def test_lag_monitor_warns_when_events_are_held_back(self):
+        with patch.object(task_events, "get_task_events_delivery_lag", AsyncMock(return_value=95.04)), patch.object(
+            task_events.asyncio, "sleep", AsyncMock(side_effect=asyncio.CancelledError)
+        ), self.assertLogs(task_events.logger, level="WARNING") as logs, patch.dict(task_events._stats):
+            with self.assertRaises(asyncio.CancelledError):
+                await task_events.run_task_events_lag_monitor(interval_seconds=30, warn_seconds=60)
+            self.assertEqual(task_events._stats["delivery_lag_seconds"], 95.0)
+
+        self.assertIn("长事务阻塞", logs.output[0])
+
+    def test_listener_reconnect_wakes_every_stream(self):
+        waiters = [asyncio.Event(), asyncio.Event()]
+        with patch.dict(task_events._project_waiters, {7: {waiters[0]}, 8: {waiters[1]}}, clear=True):
+            task_events._wake_all_streams()
+
+        self.assertTrue(all(waiter.is_set() for waiter in waiters))
+
+    def test_parse_task_event_cursor(self):
+        self.assertEqual(task_events.parse_task_event_cursor("1024-77"), (1024, 77))
+        for value in ("77", "a-1", "-1-2", ""):
+            with self.assertRaises(ValueError):
+                task_events.parse_task_event_cursor(value)
+
+
+class ProjectEventsEndpointTests(unittest.IsolatedAsyncioTestCase):
+    async def test_last_event_id_header_takes_precedence_over_query(self):
+        current_user = SimpleNamespace(id=11)
+
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()) as ensure_access, patch.object(
+            tasks_endpoint, "stream_task_events", return_value=iter(())
+        ) as stream_mock:
+            response = await tasks_endpoint.stream_project_events(
+                project_id=7, last_event_id="20-3", last_event_id_header="21-9", current_user=current_user
+            )
+
+        ensure_access.assert_awaited_once_with(project_id=7, current_user=current_user)
+        self.assertEqual(stream_mock.call_args.args[:2], (7, (21, 9)))
+        self.assertEqual(response.media_type, "text/event-stream")
+
+    async def test_malformed_last_event_id_is_rejected(self):
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()), patch.object(
+            tasks_endpoint, "stream_task_events"
+        ) as stream_mock:
+            with self.assertRaises(tasks_endpoint.HTTPException) as ctx:
+                await tasks_endpoint.stream_project_events(
+                    project_id=7, last_event_id="9", last_event_id_header=None, current_user=SimpleNamespace(id=11)
+                )
+
+        self.assertEqual(ctx.exception.status_code, 400)
+        stream_mock.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,44 +1,58 @@
 import unittest
+from contextlib import nullcontext
 from datetime import datetime, UTC
 from types import SimpleNamespace
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, Mock, patch
 
 from fastapi import HTTPException
 
 from app.api.v1.endpoints import tasks as tasks_endpoint
+from app.schemas.task import TaskListQuery
+
+
+def _task_list_queryset(tasks):
+    queryset = Mock()
+    queryset.filter.return_value = queryset
+    queryset.order_by.return_value = queryset
+    queryset.limit.return_value = queryset
+    queryset.all = AsyncMock(return_value=tasks)
+    return queryset
 
 
 class TaskSoftDeleteEndpointTests(unittest.IsolatedAsyncioTestCase):
     async def test_read_my_tasks_filters_soft_deleted_records(self):
         current_user = SimpleNamespace(id=11)
         fake_tasks = [SimpleNamespace(id=1), SimpleNamespace(id=2)]
-        assigned_qs = SimpleNamespace(values_list=AsyncMock(return_value=[1, 2]))
-        collaborated_qs = SimpleNamespace(values_list=AsyncMock(return_value=[2, 3]))
-        task_qs = SimpleNamespace(all=AsyncMock(return_value=fake_tasks))
+        task_qs = _task_list_queryset(fake_tasks)
+        annotated_qs = SimpleNamespace(filter=Mock(return_value=task_qs))
         serialized_tasks = [{"id": 1}, {"id": 2}]
+        response = SimpleNamespace(headers={})
 
-        with patch.object(tasks_endpoint.Task, "filter", side_effect=[assigned_qs, task_qs]) as filter_mock, patch.object(
-            tasks_endpoint.TaskCollaborator, "filter", return_value=collaborated_qs
+        with patch.object(tasks_endpoint.Task, "annotate", return_value=annotated_qs) as annotate_mock, patch.object(
+            tasks_endpoint.TaskCollaborator, "filter"
         ) as collaborator_filter, patch.object(
             tasks_endpoint, "_serialize_tasks", AsyncMock(return_value=serialized_tasks)
         ) as serialize_mock:
-            result = await tasks_endpoint.read_my_tasks(current_user=current_user)
-
-        self.assertEqual(
-            [call.kwargs for call in filter_mock.call_args_list],
-            [
-                {"assignee": current_user, "deleted_at__isnull": True},
-                {"id__in": [1, 2, 3], "deleted_at__isnull": True},
-            ],
-        )
-        collaborator_filter.assert_called_once_with(user_id=11)
+            result = await tasks_endpoint.read_my_tasks(
+                response=response, query=TaskListQuery(), current_user=current_user
+            )
+
+        # 访问范围用 EXISTS 子查询与分页在同一条 SQL 中完成，不预先加载任务 ID 列表
+        access_sql = annotate_mock.call_args.kwargs["direct_access"].sql
+        self.assertIn('"tasks"."assignee_id" = 11', access_sql)
+        self.assertIn("tc.user_id = 11", access_sql)
+        annotated_qs.filter.assert_called_once_with(direct_access=True, deleted_at__isnull=True)
+        collaborator_filter.assert_not_called()
+        task_qs.order_by.assert_called_once_with("-created_at", "-id")
+        task_qs.limit.assert_called_once_with(tasks_endpoint.TASK_LIST_DEFAULT_PAGE_SIZE + 1)
         serialize_mock.assert_awaited_once_with(fake_tasks)
         self.assertEqual(result, serialized_tasks)
+        self.assertNotIn(tasks_endpoint.NEXT_CURSOR_HEADER, response.headers)
 
     async def test_get_project_tasks_filters_soft_deleted_records(self):
         current_user = SimpleNamespace(id=11)
         fake_tasks = [SimpleNamespace(id=3)]
-        fake_qs = SimpleNamespace(all=AsyncMock(return_value=fake_tasks))
+        fake_qs = _task_list_queryset(fake_tasks)
         serialized_tasks = [{"id": 3}]
 
         with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()) as ensure_project_access, patch.object(
@@ -46,18 +60,83 @@ class TaskSoftDeleteEndpointTests(unittest.IsolatedAsyncioTestCase):
         ) as filter_mock, patch.object(
             tasks_endpoint, "_serialize_tasks", AsyncMock(return_value=serialized_tasks)
         ) as serialize_mock:
-            result = await tasks_endpoint.get_project_tasks(project_id=7, current_user=current_user)
+            result = await tasks_endpoint.get_project_tasks(
+                project_id=7,
+                response=SimpleNamespace(headers={}),
+                query=TaskListQuery(),
+                current_user=current_user,
+            )
 
         ensure_project_access.assert_awaited_once_with(project_id=7, current_user=current_user)
         filter_mock.assert_called_once_with(project_id=7, deleted_at__isnull=True)
         serialize_mock.assert_awaited_once_with(fake_tasks)
         self.assertEqual(result, serialized_tasks)
 
+    async def test_get_project_tasks_applies_filters_and_returns_next_cursor(self):
+        created_at = datetime(2026, 5, 1, 9, 30, tzinfo=UTC)
+        fake_tasks = [SimpleNamespace(id=9, created_at=created_at), SimpleNamespace(id=8, created_at=created_at)]
+        fake_qs = _task_list_queryset(fake_tasks)
+        response = SimpleNamespace(headers={})
+        query = TaskListQuery(limit=1, status=["TODO", "IN_PROGRESS"], assignee_id=5, updated_since=created_at)
+
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()), patch.object(
+            tasks_endpoint.Task, "filter", return_value=fake_qs
+        ) as filter_mock, patch.object(
+            tasks_endpoint, "_serialize_tasks", AsyncMock(return_value=[{"id": 9}])
+        ) as serialize_mock:
+            await tasks_endpoint.get_project_tasks(
+                project_id=7, response=response, query=query, current_user=SimpleNamespace(id=11)
+            )
+
+        filter_mock.assert_called_once_with(
+            project_id=7,
+            deleted_at__isnull=True,
+            status__in=["TODO", "IN_PROGRESS"],
+            assignee_id=5,
+            updated_at__gte=created_at,
+        )
+        fake_qs.limit.assert_called_once_with(2)
+        serialize_mock.assert_awaited_once_with(fake_tasks[:1])
+        cursor = response.headers[tasks_endpoint.NEXT_CURSOR_HEADER]
+        self.assertEqual(tasks_endpoint._decode_task_cursor(cursor), (created_at, 9))
+
+    async def test_get_project_tasks_continues_after_cursor(self):
+        created_at = datetime(2026, 5, 1, 9, 30, tzinfo=UTC)
+        cursor = tasks_endpoint._encode_task_cursor(SimpleNamespace(id=9, created_at=created_at))
+        fake_qs = _task_list_queryset([])
+
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()), patch.object(
+            tasks_endpoint.Task, "filter", return_value=fake_qs
+        ), patch.object(tasks_endpoint, "_serialize_tasks", AsyncMock(return_value=[])):
+            await tasks_endpoint.get_project_tasks(
+                project_id=7,
+                response=SimpleNamespace(headers={}),
+                query=TaskListQuery(cursor=cursor),
+                current_user=SimpleNamespace(id=11),
+            )
+
+        self.assertEqual(fake_qs.filter.call_args.kwargs, {"created_at__lte": created_at})
+
+    async def test_get_project_tasks_rejects_invalid_cursor(self):
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()), patch.object(
+            tasks_endpoint.Task, "filter", return_value=_task_list_queryset([])
+        ):
+            with self.assertRaises(HTTPException) as ctx:
+                await tasks_endpoint.get_project_tasks(
+                    project_id=7,
+                    response=SimpleNamespace(headers={}),
+                    query=TaskListQuery(cursor="not-a-cursor"),
+                    current_user=SimpleNamespace(id=11),
+                )
+
+        self.assertEqual(ctx.exception.status_code, 400)
+
     async def test_restore_task_clears_deleted_at_and_rebuilds_embedding(self):
         current_user = SimpleNamespace(id=5)
         deleted_time = datetime.now(UTC)
         fake_task = SimpleNamespace(
             id=42,
+            project_id=7,
             title="Fix login",
             description="repair oauth callback",
             deleted_at=deleted_time,
@@ -65,14 +144,19 @@ class TaskSoftDeleteEndpointTests(unittest.IsolatedAsyncioTestCase):
         )
 
         with patch.object(tasks_endpoint, "_ensure_task_restore_access", AsyncMock(return_value=fake_task)) as ensure_access, patch.object(
-            tasks_endpoint, "upsert_task_embedding", AsyncMock(return_value=True)
-        ) as upsert_embedding:
+            tasks_endpoint, "in_transaction", side_effect=lambda: nullcontext()
+        ), patch.object(
+            tasks_endpoint, "enqueue_task_embedding", AsyncMock()
+        ) as enqueue_embedding, patch.object(
+            tasks_endpoint, "wake_embedding_outbox_worker"
+        ) as wake_worker:
             result = await tasks_endpoint.restore_task(task_id=42, current_user=current_user)
 
         ensure_access.assert_awaited_once_with(task_id=42, current_user=current_user)
         self.assertIsNone(fake_task.deleted_at)
         fake_task.save.assert_awaited_once()
-        upsert_embedding.assert_awaited_once_with(42, "Fix login\nrepair oauth callback")
+        enqueue_embedding.assert_awaited_once_with(42)
+        wake_worker.assert_called_once_with()
         self.assertEqual(result, {"message": "Task restored successfully"})
 
     async def test_restore_task_rejects_non_deleted_task(self):
@@ -92,59 +176,57 @@ class TaskSoftDeleteEndpointTests(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(context.exception.status_code, 400)
         self.assertEqual(context.exception.detail, "Task is not deleted")
 
-    async def test_restore_task_succeeds_even_if_embedding_rebuild_fails(self):
+    async def test_delete_task_sets_deleted_at_and_enqueues_embedding_sync(self):
         current_user = SimpleNamespace(id=5)
-        deleted_time = datetime.now(UTC)
-        fake_task = SimpleNamespace(
-            id=42,
-            title="Fix login",
-            description="repair oauth callback",
-            deleted_at=deleted_time,
-            save=AsyncMock(),
-        )
-
-        with patch.object(tasks_endpoint, "_ensure_task_restore_access", AsyncMock(return_value=fake_task)), patch.object(
-            tasks_endpoint, "upsert_task_embedding", AsyncMock(side_effect=RuntimeError("embedding failed"))
+        fake_task = SimpleNamespace(id=42, project_id=7, deleted_at=None, save=AsyncMock())
+
+        with patch.object(tasks_endpoint, "_ensure_task_access", AsyncMock(return_value=fake_task)), patch.object(
+            tasks_endpoint, "in_transaction", side_effect=lambda: nullcontext()
+        ), patch.object(
+            tasks_endpoint, "enqueue_task_embedding", AsyncMock()
+        ) as enqueue_embedding, patch.object(
+            tasks_endpoint, "wake_embedding_outbox_worker"
         ):
-            result = await tasks_endpoint.restore_task(task_id=42, current_user=current_user)
+            result = await tasks_endpoint.delete_task(task_id=42, current_user=current_user)
 
-        self.assertEqual(result, {"message": "Task restored successfully"})
-        self.assertIsNone(fake_task.deleted_at)
+        self.assertEqual(result, {"message": "Task deleted successfully"})
+        self.assertIsNotNone(fake_task.deleted_at)
         fake_task.save.assert_awaited_once()
+        enqueue_embedding.assert_awaited_once_with(42)
 
     async def test_ensure_task_restore_access_rejects_deleted_project_even_for_assignee(self):
         current_user = SimpleNamespace(id=9)
-        fake_task = SimpleNamespace(id=8, assignee_id=9, project_id=100)
+        fake_task = SimpleNamespace(id=8, direct_access=True, project_active=False, project_access=False)
+        task_qs = SimpleNamespace(first=AsyncMock(return_value=fake_task))
+        filter_qs = SimpleNamespace(annotate=Mock(return_value=task_qs))
 
-        with patch.object(tasks_endpoint.Task, "get_or_none", AsyncMock(return_value=fake_task)) as get_task, patch.object(
-            tasks_endpoint.Project, "get_or_none", AsyncMock(return_value=None)
+        with patch.object(tasks_endpoint.Task, "filter", return_value=filter_qs) as filter_mock, patch.object(
+            tasks_endpoint.Project, "get_or_none", AsyncMock()
         ) as get_project:
             with self.assertRaises(HTTPException) as context:
                 await tasks_endpoint._ensure_task_restore_access(task_id=8, current_user=current_user)
 
-        get_task.assert_awaited_once_with(id=8)
-        get_project.assert_awaited_once_with(id=100, deleted_at__isnull=True)
+        filter_mock.assert_called_once_with(id=8)
+        task_qs.first.assert_awaited_once_with()
+        get_project.assert_not_awaited()
         self.assertEqual(context.exception.status_code, 404)
         self.assertEqual(context.exception.detail, "Project not found")
 
     async def test_ensure_task_restore_access_rejects_user_without_project_access(self):
         current_user = SimpleNamespace(id=9)
-        fake_task = SimpleNamespace(id=8, assignee_id=1, project_id=100)
-        fake_project = SimpleNamespace(owner_id=2)
-        collaborator_qs = SimpleNamespace(exists=AsyncMock(return_value=False))
-
-        with patch.object(tasks_endpoint.Task, "get_or_none", AsyncMock(return_value=fake_task)), patch.object(
-            tasks_endpoint.Project, "get_or_none", AsyncMock(return_value=fake_project)
-        ), patch.object(tasks_endpoint.TaskCollaborator, "filter", return_value=collaborator_qs), patch.object(
-            tasks_endpoint, "_is_project_member", AsyncMock(return_value=False)
-        ):
+        fake_task = SimpleNamespace(id=8, direct_access=False, project_active=True, project_access=False)
+        filter_qs = SimpleNamespace(annotate=Mock(return_value=SimpleNamespace(first=AsyncMock(return_value=fake_task))))
+
+        with patch.object(tasks_endpoint.Task, "filter", return_value=filter_qs):
             with self.assertRaises(HTTPException) as context:
                 await tasks_endpoint._ensure_task_restore_access(task_id=8, current_user=current_user)
 
-        collaborator_qs.exists.assert_awaited_once_with()
+        self.assertEqual(
+            set(filter_qs.annotate.call_args.kwargs),
+            {"direct_access", "project_active", "project_access"},
+        )
         self.assertEqual(context.exception.status_code, 403)
         self.assertEqual(context.exception.detail, "No access to task")
 
-
 if __name__ == "__main__":
     unittest.main()
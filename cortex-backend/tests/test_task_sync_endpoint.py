@@ -0,0 +1,130 @@
+import unittest
+from datetime import datetime, timedelta, UTC
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import tasks as tasks_endpoint
+
+
+def _sync_queryset(tasks):
+    queryset = Mock()
+    queryset.filter.return_value = queryset
+    queryset.order_by.return_value = queryset
+    queryset.limit.return_value = queryset
+    queryset.all = AsyncMock(return_value=tasks)
+    return queryset
+
+
+class TaskSyncEndpointTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.current_user = SimpleNamespace(id=11)
+        self.old = datetime(2026, 5, 1, 9, 0, tzinfo=UTC)
+        serialize_patch = patch.object(
+            tasks_endpoint,
+            "_serialize_tasks",
+            AsyncMock(side_effect=lambda tasks: [{"id": task.id} for task in tasks]),
+        )
+        serialize_patch.start()
+        self.addCleanup(serialize_patch.stop)
+
+    async def test_project_sync_returns_tombstones_and_last_position(self):
+        tasks = [
+            SimpleNamespace(id=3, updated_at=self.old, deleted_at=None),
+            SimpleNamespace(id=5, updated_at=self.old + timedelta(minutes=1), deleted_at=self.old),
+        ]
+        queryset = _sync_queryset(tasks)
+
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()) as ensure_access, patch.object(
+            tasks_endpoint.Task, "filter", return_value=queryset
+        ) as filter_mock:
+            result = await tasks_endpoint.sync_tasks(
+                since=None, project_id=7, limit=10, current_user=self.current_user
+            )
+
+        ensure_access.assert_awaited_once_with(project_id=7, current_user=self.current_user)
+        # 不过滤 deleted_at：软删除的任务作为墓碑下发
+        filter_mock.assert_called_once_with(project_id=7)
+        queryset.order_by.assert_called_once_with("updated_at", "id")
+        self.assertEqual([task["id"] for task in result["tasks"]], [3, 5])
+        self.assertFalse(result["has_more"])
+        self.assertEqual(
+            tasks_endpoint._decode_keyset_token(result["watermark"], "Invalid watermark"),
+            (self.old + timedelta(minutes=1), 5),
+        )
+
+    async def test_sync_continues_after_watermark_and_reports_more(self):
+        since = tasks_endpoint._encode_keyset_token(self.old, 3)
+        tasks = [
+            SimpleNamespace(id=4, updated_at=self.old),
+            SimpleNamespace(id=9, updated_at=datetime.now(UTC)),
+        ]
+        queryset = _sync_queryset(tasks)
+
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()), patch.object(
+            tasks_endpoint.Task, "filter", return_value=queryset
+        ):
+            result = await tasks_endpoint.sync_tasks(
+                since=since, project_id=7, limit=1, current_user=self.current_user
+            )
+
+        self.assertEqual(queryset.filter.call_args.kwargs, {"updated_at__gte": self.old})
+        queryset.limit.assert_called_once_with(2)
+        self.assertTrue(result["has_more"])
+        self.assertEqual([task["id"] for task in result["tasks"]], [4])
+        self.assertEqual(tasks_endpoint._decode_keyset_token(result["watermark"], ""), (self.old, 4))
+
+    async def test_last_page_watermark_stays_behind_recent_writes(self):
+        recent = datetime.now(UTC)
+        queryset = _sync_queryset([SimpleNamespace(id=8, updated_at=recent)])
+
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()), patch.object(
+            tasks_endpoint.Task, "filter", return_value=queryset
+        ):
+            result = await tasks_endpoint.sync_tasks(
+                since=None, project_id=7, limit=10, current_user=self.current_user
+            )
+
+        watermark, task_id = tasks_endpoint._decode_keyset_token(result["watermark"], "")
+        self.assertLess(watermark, recent)
+        self.assertEqual(task_id, 0)
+
+    async def test_sync_without_project_covers_visible_projects_and_direct_tasks(self):
+        queryset = _sync_queryset([])
+        annotated_qs = SimpleNamespace(filter=Mock(return_value=queryset))
+
+        with patch.object(
+            tasks_endpoint, "get_visible_projects", AsyncMock(return_value={7: None, 3: 1})
+        ), patch.object(
+            tasks_endpoint.Task, "annotate", return_value=annotated_qs
+        ) as annotate_mock, patch.object(tasks_endpoint.TaskCollaborator, "filter") as collaborator_filter:
+            result = await tasks_endpoint.sync_tasks(
+                since=None, project_id=None, limit=10, current_user=self.current_user
+            )
+
+        self.assertIn("tc.user_id = 11", annotate_mock.call_args.kwargs["direct_access"].sql)
+        collaborator_filter.assert_not_called()
+        scope = annotated_qs.filter.call_args.args[0]
+        self.assertEqual(scope.join_type, "OR")
+        self.assertEqual(
+            [child.filters for child in scope.children],
+            [{"direct_access": True}, {"project_id__in": [3, 7]}],
+        )
+        self.assertEqual(result["tasks"], [])
+
+    async def test_invalid_watermark_is_rejected(self):
+        with patch.object(tasks_endpoint, "_ensure_project_access", AsyncMock()), patch.object(
+            tasks_endpoint.Task, "filter", return_value=_sync_queryset([])
+        ):
+            with self.assertRaises(HTTPException) as ctx:
+                await tasks_endpoint.sync_tasks(
+                    since="bm90LWpzb24", project_id=7, limit=10, current_user=self.current_user
+                )
+
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(ctx.exception.detail, "Invalid watermark")
+
+
+if __name__ == "__main__":
+    unittest.main()
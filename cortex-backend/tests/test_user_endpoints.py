@@ -0,0 +1,64 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock, patch
+
+from fastapi import HTTPException
+
+from app.api.v1.endpoints import login as login_endpoint
+from app.api.v1.endpoints import users as users_endpoint
+from app.schemas.user import UserUpdateProfile
+
+
+class UserWriteEndpointTests(unittest.IsolatedAsyncioTestCase):
+    async def test_update_user_me_refetches_row_and_writes_only_changed_fields(self):
+        cached_user = SimpleNamespace(id=7, username="stale", hashed_password="stale-hash")
+        fresh_user = SimpleNamespace(id=7, username="alice", hashed_password="fresh-hash", save=AsyncMock())
+        exists_query = SimpleNamespace(exclude=Mock(return_value=SimpleNamespace(exists=AsyncMock(return_value=False))))
+
+        with patch.object(
+            users_endpoint.UserModel, "get_or_none", AsyncMock(return_value=fresh_user)
+        ) as get_user, patch.object(users_endpoint.UserModel, "filter", return_value=exists_query), patch.object(
+            users_endpoint, "publish_permission_invalidation", AsyncMock()
+        ) as publish_mock:
+            result = await users_endpoint.update_user_me(
+                UserUpdateProfile(username="bob"), current_user=cached_user
+            )
+
+        get_user.assert_awaited_once_with(id=7)
+        fresh_user.save.assert_awaited_once_with(update_fields=["username", "updated_at"])
+        publish_mock.assert_awaited_once_with(user_ids=[7])
+        self.assertIs(result, fresh_user)
+        self.assertEqual(fresh_user.username, "bob")
+
+    async def test_update_user_me_checks_old_password_against_fresh_row(self):
+        fresh_user = SimpleNamespace(id=7, username="alice", hashed_password="fresh-hash", save=AsyncMock())
+
+        with patch.object(
+            users_endpoint.UserModel, "get_or_none", AsyncMock(return_value=fresh_user)
+        ), patch.object(users_endpoint, "verify_password", return_value=False) as verify_mock:
+            with self.assertRaises(HTTPException):
+                await users_endpoint.update_user_me(
+                    UserUpdateProfile(password="new-secret", old_password="old"),
+                    current_user=SimpleNamespace(id=7, hashed_password="stale-hash"),
+                )
+
+        verify_mock.assert_called_once_with("old", "fresh-hash")
+        fresh_user.save.assert_not_awaited()
+
+    async def test_login_saves_last_login_only_and_invalidates_cached_user(self):
+        user = SimpleNamespace(id=7, hashed_password="hash", last_login_at=None, save=AsyncMock())
+        query = SimpleNamespace(first=AsyncMock(return_value=user))
+        form = SimpleNamespace(username="alice@example.com", password="secret")
+
+        with patch.object(login_endpoint.User, "filter", return_value=query), patch.object(
+            login_endpoint.security, "verify_password", return_value=True
+        ), patch.object(login_endpoint, "publish_permission_invalidation", AsyncMock()) as publish_mock:
+            await login_endpoint.login_access_token(form)
+
+        user.save.assert_awaited_once_with(update_fields=["last_login_at"])
+        publish_mock.assert_awaited_once_with(user_ids=[7])
+        self.assertIsNotNone(user.last_login_at)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from app.services import vector_store
+
+
+class _FakeModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, normalize_embeddings=True):
+        self.calls.append((list(texts), threading.current_thread().name))
+        return np.ones((len(texts), vector_store._EMBEDDING_DIM), dtype=np.float32)
+
+
+class VectorStoreExecutorTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.original_backend = vector_store._EMBEDDING_BACKEND
+        self.original_model = vector_store._EMBEDDING_MODEL
+        self.model = _FakeModel()
+        vector_store._EMBEDDING_BACKEND = "sentence_transformers"
+        vector_store._EMBEDDING_MODEL = self.model
+
+    def tearDown(self):
+        vector_store._EMBEDDING_BACKEND = self.original_backend
+        vector_store._EMBEDDING_MODEL = self.original_model
+        vector_store.shutdown_embedding_executor()
+
+    async def test_generate_embedding_runs_encode_in_executor_thread(self):
+        before = vector_store.get_embedding_metrics()["completed"]
+
+        embedding = await vector_store.generate_embedding("修复登录接口")
+
+        self.assertEqual(len(embedding), vector_store._EMBEDDING_DIM)
+        self.assertEqual(len(self.model.calls), 1)
+        texts, thread_name = self.model.calls[0]
+        self.assertEqual(texts, ["修复登录接口"])
+        self.assertTrue(thread_name.startswith("embedding"))
+        self.assertEqual(vector_store.get_embedding_metrics()["completed"], before + 1)
+
+    async def test_generate_embedding_rejects_when_queue_is_full(self):
+        before = vector_store.get_embedding_metrics()["rejected"]
+
+        with patch.object(vector_store, "EMBEDDING_QUEUE_MAX_SIZE", 0):
+            with self.assertRaises(RuntimeError):
+                await vector_store.generate_embedding("修复登录接口")
+
+        self.assertEqual(self.model.calls, [])
+        self.assertEqual(vector_store.get_embedding_metrics()["rejected"], before + 1)
+        self.assertEqual(vector_store._EMBEDDING_BACKEND, "sentence_transformers")
+
+    async def test_concurrent_requests_are_encoded_in_one_batch(self):
+        texts = [f"任务 {idx}" for idx in range(5)]
+
+        embeddings = await asyncio.gather(*[vector_store.generate_embedding(text) for text in texts])
+
+        self.assertEqual(len(embeddings), 5)
+        self.assertEqual(len(self.model.calls), 1)
+        self.assertEqual(self.model.calls[0][0], texts)
+        self.assertEqual(vector_store.get_embedding_metrics()["pending"], 0)
+
+    async def test_batches_are_split_by_max_batch_size(self):
+        texts = [f"任务 {idx}" for idx in range(5)]
+
+        with patch.object(vector_store, "EMBEDDING_BATCH_MAX_SIZE", 2):
+            vector_store._embedding_batcher = None
+            await asyncio.gather(*[vector_store.generate_embedding(text) for text in texts])
+            vector_store._embedding_batcher = None
+
+        self.assertEqual([len(call[0]) for call in self.model.calls], [2, 2, 1])
+
+    async def test_encode_failure_raises_without_switching_backend(self):
+        def broken_encode(texts, normalize_embeddings=True):
+            raise MemoryError("out of memory")
+
+        self.model.encode = broken_encode
+
+        with self.assertRaises(RuntimeError):
+            await vector_store.generate_embedding("修复登录接口")
+
+        # 运行中不切换到 hash：hash 向量与已存储的模型向量不可比
+        self.assertEqual(vector_store._EMBEDDING_BACKEND, "sentence_transformers")
+        self.assertEqual(vector_store.get_embedding_model_id(), "sentence_transformers:all-MiniLM-L6-v2")
+
+
+class EmbeddingWarmUpTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.original_backend = vector_store._EMBEDDING_BACKEND
+        self.original_model = vector_store._EMBEDDING_MODEL
+        self.original_status = dict(vector_store._embedding_model_status)
+        vector_store._EMBEDDING_BACKEND = "sentence_transformers"
+        vector_store._EMBEDDING_MODEL = None
+        vector_store._embedding_model_status.update(state="not_loaded", load_seconds=None, warmup_seconds=None, error=None)
+
+    def tearDown(self):
+        vector_store._EMBEDDING_BACKEND = self.original_backend
+        vector_store._EMBEDDING_MODEL = self.original_model
+        vector_store._embedding_model_status.update(self.original_status)
+        vector_store.shutdown_embedding_executor()
+
+    async def test_warm_up_loads_model_and_encodes_once_in_executor(self):
+        model = _FakeModel()
+
+        def fake_load():
+            vector_store._EMBEDDING_MODEL = model
+            return model
+
+        self.assertFalse(vector_store.get_embedding_model_status()["ready"])
+        with patch.object(vector_store, "_load_embedding_model", side_effect=fake_load):
+            status = await vector_store.warm_up_embedding_model()
+
+        self.assertEqual(status["state"], "ready")
+        self.assertTrue(status["ready"])
+        self.assertEqual(len(model.calls), 1)
+        self.assertTrue(model.calls[0][1].startswith("embedding"))
+
+    async def test_hash_fallback_is_reported_ready(self):
+        def fake_load():
+            vector_store._EMBEDDING_BACKEND = "hash"
+            return None
+
+        with patch.object(vector_store, "_load_embedding_model", side_effect=fake_load):
+            status = await vector_store.warm_up_embedding_model()
+
+        self.assertEqual((status["state"], status["ready"], status["backend"]), ("fallback", True, "hash"))
+
+    def test_lazy_loading_does_not_block_readiness_when_preload_disabled(self):
+        with patch.object(vector_store, "EMBEDDING_PRELOAD", False):
+            self.assertTrue(vector_store.get_embedding_model_status()["ready"])
+
+
+if __name__ == "__main__":
+    unittest.main()
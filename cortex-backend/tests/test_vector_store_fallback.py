@@ -1,5 +1,7 @@
+import hashlib
 import math
 import unittest
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 from app.services import vector_store
@@ -9,12 +11,36 @@ class _FakeConn:
     def __init__(self, rows):
         self.rows = rows
         self.last_sql = ""
+        self.last_args = ()
+        self.executed = []
 
-    async def fetch(self, sql, _exclude_task_id):
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, sql, *args):
+        self.executed.append((sql, args))
+
+    async def fetch(self, sql, *args):
         self.last_sql = sql
+        self.last_args = args
         return self.rows
 
 
+def _reference_hash_embedding(text):
+    vector = [0.0] * vector_store._EMBEDDING_DIM
+    for token in vector_store._tokenize_text(text):
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "big") % vector_store._EMBEDDING_DIM
+        sign = 1.0 if digest[4] % 2 == 0 else -1.0
+        vector[index] += sign
+
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm > 0:
+        vector = [v / norm for v in vector]
+    return vector
+
+
 class VectorStoreFallbackTests(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.original_backend = vector_store._EMBEDDING_BACKEND
@@ -30,7 +56,32 @@ class VectorStoreFallbackTests(unittest.IsolatedAsyncioTestCase):
         norm = math.sqrt(sum(v * v for v in embedding))
         self.assertAlmostEqual(norm, 1.0, places=6)
 
-    async def test_text_fallback_returns_ranked_results(self):
+    def test_vectorized_hash_embeddings_match_reference_bit_for_bit(self):
+        texts = [
+            "修复登录接口 token 失效",
+            "fix login token token token",
+            "",
+            "!!!",
+            "实现AI代码审查回写PR评论区功能 " * 50,
+        ]
+
+        embeddings = vector_store._generate_hash_embeddings(texts)
+
+        self.assertEqual(len(embeddings), len(texts))
+        for text, embedding in zip(texts, embeddings):
+            self.assertEqual(embedding, _reference_hash_embedding(text))
+            self.assertTrue(all(type(value) is float for value in embedding))
+
+    async def test_generate_embeddings_batch_uses_hash_backend(self):
+        vector_store._EMBEDDING_BACKEND = "hash"
+        texts = [f"任务 {idx} 登录" for idx in range(40)]
+
+        embeddings = await vector_store.generate_embeddings(texts)
+
+        self.assertEqual(embeddings, [_reference_hash_embedding(text) for text in texts])
+        self.assertEqual(await vector_store.generate_embeddings([]), [])
+
+    async def test_text_fallback_ranks_with_trigram_index_in_sql(self):
         rows = [
             {
                 "task_id": 1,
@@ -40,44 +91,31 @@ class VectorStoreFallbackTests(unittest.IsolatedAsyncioTestCase):
                 "priority": "HIGH",
                 "project_id": 10,
                 "created_at": datetime(2026, 3, 7, 10, 0, 0),
-            },
-            {
-                "task_id": 2,
-                "title": "优化项目列表分页",
-                "description": "减少查询耗时",
-                "status": "IN_PROGRESS",
-                "priority": "LOW",
-                "project_id": 11,
-                "created_at": datetime(2026, 3, 7, 10, 0, 0),
+                "similarity": 0.61234,
             },
         ]
         conn = _FakeConn(rows)
 
         results = await vector_store._search_similar_tasks_by_text(
             conn=conn,
-            text_content="登录失败 token 过期",
+            text_content="  登录失败   Token 过期 ",
             limit=3,
             threshold=0.2,
+            project_ids=[10],
         )
 
         self.assertIn("FROM tasks", conn.last_sql)
+        self.assertIn("lower(t.title) % $1", conn.last_sql)
+        self.assertIn(f"$1 <% {vector_store._TASK_SEARCH_TEXT_SQL}", conn.last_sql)
+        self.assertIn("AND t.project_id = ANY($4::int[])", conn.last_sql)
+        self.assertNotIn("LIMIT 500", conn.last_sql)
+        self.assertEqual(conn.last_args, ("登录失败 token 过期", 0, 3, [10]))
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]["task_id"], 1)
-        self.assertGreaterEqual(results[0]["similarity"], 0.2)
+        self.assertEqual(results[0]["similarity"], 0.612)
 
-    async def test_text_fallback_keeps_high_title_similarity_with_long_description(self):
-        rows = [
-            {
-                "task_id": 3,
-                "title": "实现AI代码审查回写PR评论区功能",
-                "description": " ".join(["这是一个很长的任务描述"] * 80),
-                "status": "TODO",
-                "priority": "HIGH",
-                "project_id": 12,
-                "created_at": datetime(2026, 3, 7, 11, 0, 0),
-            },
-        ]
-        conn = _FakeConn(rows)
+    async def test_text_fallback_applies_request_threshold_to_trigram_operators(self):
+        conn = _FakeConn([])
 
         results = await vector_store._search_similar_tasks_by_text(
             conn=conn,
@@ -86,10 +124,22 @@ class VectorStoreFallbackTests(unittest.IsolatedAsyncioTestCase):
             threshold=0.5,
         )
 
-        self.assertEqual(len(results), 1)
-        self.assertEqual(results[0]["task_id"], 3)
-        self.assertGreaterEqual(results[0]["similarity"], 0.5)
+        self.assertEqual(results, [])
+        self.assertEqual(
+            conn.executed,
+            [
+                ("SELECT set_config('pg_trgm.similarity_threshold', $1, true)", ("0.5",)),
+                ("SELECT set_config('pg_trgm.word_similarity_threshold', $1, true)", ("0.5",)),
+            ],
+        )
+
+    async def test_text_fallback_skips_blank_query(self):
+        conn = _FakeConn([])
+
+        results = await vector_store._search_similar_tasks_by_text(conn=conn, text_content="   ")
 
+        self.assertEqual(results, [])
+        self.assertEqual(conn.last_sql, "")
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import time
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+from app.services import vector_store
+
+
+class _FakePool:
+    def __init__(self):
+        self.acquired = 0
+
+    @asynccontextmanager
+    async def acquire(self):
+        self.acquired += 1
+        yield object()
+
+
+def _item(task_id, similarity):
+    return {
+        "task_id": task_id,
+        "title": f"任务 {task_id}",
+        "description": None,
+        "status": "TODO",
+        "priority": "MEDIUM",
+        "project_id": 3,
+        "similarity": similarity,
+        "created_at": None,
+    }
+
+
+class HybridSearchTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        vector_store.invalidate_similarity_cache()
+        self.original_backend = vector_store._EMBEDDING_BACKEND
+        vector_store._EMBEDDING_BACKEND = "sentence_transformers"
+        self.pool = _FakePool()
+        pool_patch = patch.object(vector_store, "get_db_pool", AsyncMock(return_value=self.pool))
+        embedding_patch = patch.object(vector_store, "get_query_embedding", AsyncMock(return_value=[0.0] * 384))
+        pool_patch.start()
+        self.embedding_mock = embedding_patch.start()
+        self.addCleanup(pool_patch.stop)
+        self.addCleanup(embedding_patch.stop)
+
+    def tearDown(self):
+        vector_store._EMBEDDING_BACKEND = self.original_backend
+
+    def test_rrf_prefers_tasks_ranked_by_both_branches(self):
+        vector_results = [_item(1, 0.9), _item(2, 0.8), _item(3, 0.7)]
+        lexical_results = [_item(3, 0.95), _item(4, 0.6), _item(2, 0.55)]
+
+        fused = vector_store._fuse_ranked_results([vector_results, lexical_results], limit=3, rrf_k=60)
+
+        self.assertEqual([item["task_id"] for item in fused], [3, 2, 1])
+        # 展示的相似度取两路中的较大值
+        self.assertEqual(fused[0]["similarity"], 0.95)
+
+    async def test_hybrid_runs_both_branches_with_candidate_limit(self):
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_vector", AsyncMock(return_value=[_item(1, 0.9), _item(2, 0.8)])
+        ) as vector_mock, patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(2, 0.7), _item(5, 0.6)])
+        ) as text_mock, patch.object(vector_store, "SIMILARITY_HYBRID_CANDIDATE_FACTOR", 3):
+            results = await vector_store.search_similar_tasks("ERR_401 登录", limit=2, mode="hybrid", project_ids=[3])
+
+        self.assertEqual([item["task_id"] for item in results], [2, 1])
+        self.assertEqual(vector_mock.await_args.kwargs["limit"], 6)
+        self.assertEqual(text_mock.await_args.kwargs["limit"], 6)
+        self.assertEqual(text_mock.await_args.kwargs["project_ids"], [3])
+        self.assertEqual(self.pool.acquired, 2)
+
+    async def test_hybrid_drops_branch_exceeding_latency_budget(self):
+        async def slow_vector_search(**kwargs):
+            await asyncio.sleep(1)
+            return [_item(1, 0.9)]
+
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_vector", AsyncMock(side_effect=slow_vector_search)
+        ), patch.object(vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(5, 0.6)])):
+            results = await vector_store.search_similar_tasks("ERR_401", mode="hybrid", latency_budget_ms=20)
+
+        self.assertEqual([item["task_id"] for item in results], [5])
+
+    async def test_hybrid_keeps_lexical_results_when_embedding_fails(self):
+        self.embedding_mock.side_effect = vector_store.EmbeddingQueueFullError("queue full")
+
+        with patch.object(vector_store, "_search_similar_tasks_by_vector", AsyncMock()) as vector_mock, patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(5, 0.6)])
+        ):
+            results = await vector_store.search_similar_tasks("ERR_401", mode="hybrid")
+
+        vector_mock.assert_not_awaited()
+        self.assertEqual([item["task_id"] for item in results], [5])
+
+    async def test_hybrid_skips_encoding_on_hash_backend(self):
+        vector_store._EMBEDDING_BACKEND = "hash"
+
+        with patch.object(vector_store, "_search_similar_tasks_by_vector", AsyncMock()) as vector_mock, patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(5, 0.6)])
+        ):
+            results = await vector_store.search_similar_tasks("ERR_401", mode="hybrid")
+
+        self.embedding_mock.assert_not_awaited()
+        vector_mock.assert_not_awaited()
+        self.assertEqual([item["task_id"] for item in results], [5])
+
+    async def test_degraded_hybrid_results_are_not_cached(self):
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_vector", AsyncMock(side_effect=OSError("connection reset"))
+        ) as vector_mock, patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(side_effect=OSError("connection reset"))
+        ):
+            first = await vector_store.search_similar_tasks("ERR_401", mode="hybrid")
+            second = await vector_store.search_similar_tasks("ERR_401", mode="hybrid")
+
+        self.assertEqual((first, second), ([], []))
+        self.assertEqual(vector_mock.await_count, 2)
+        self.assertEqual(vector_store.get_search_cache_metrics()["size"], 0)
+
+    async def test_cancelling_caller_cancels_hybrid_branches(self):
+        started = asyncio.Event()
+        cancelled = []
+
+        async def hanging_search(**kwargs):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_vector", AsyncMock(side_effect=hanging_search)
+        ), patch.object(vector_store, "_search_similar_tasks_by_text", AsyncMock(side_effect=hanging_search)):
+            search = asyncio.create_task(vector_store._search_similar_tasks_hybrid(
+                text_content="ERR_401",
+                exclude_task_id=None,
+                limit=5,
+                threshold=0.5,
+                ef_search=None,
+                probes=None,
+                project_ids=None,
+                organization_id=None,
+                latency_budget_ms=10000,
+            ))
+            await started.wait()
+            await asyncio.sleep(0)
+            search.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await search
+
+        self.assertEqual(cancelled, [True, True])
+
+    async def test_lexical_mode_skips_embedding(self):
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(5, 0.6)])
+        ) as text_mock:
+            results = await vector_store.search_similar_tasks("ERR_401", mode="lexical")
+
+        self.embedding_mock.assert_not_awaited()
+        text_mock.assert_awaited_once()
+        self.assertEqual(len(results), 1)
+
+    async def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            await vector_store.search_similar_tasks("ERR_401", mode="bm25")
+
+
+class _LegacyConn:
+    def __init__(self, sample=(), uncovered=False):
+        self.sample = list(sample)
+        self.uncovered = uncovered
+        self.executed = []
+
+    async def fetch(self, sql, *args):
+        return self.sample
+
+    async def fetchval(self, sql, *args):
+        return self.uncovered
+
+    async def execute(self, sql, *args):
+        self.executed.append(sql)
+        if "UPDATE task_embeddings" in sql:
+            return "UPDATE 3"
+        if "INSERT INTO task_embedding_outbox" in sql:
+            return "INSERT 0 2"
+        return "SELECT 1"
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+
+class _LegacyPool:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+def _legacy_row(embedding, title="登录失败"):
+    return {"embedding": json.dumps(embedding), "title": title, "description": None}
+
+
+class LegacyEmbeddingTransitionTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        vector_store.invalidate_similarity_cache()
+        self.original_backend = vector_store._EMBEDDING_BACKEND
+        self.original_state = dict(vector_store._legacy_embedding_state)
+        vector_store._EMBEDDING_BACKEND = "sentence_transformers"
+        vector_store._legacy_embedding_state.update(pending=True, checked_at=time.monotonic())
+        self.conn = _LegacyConn(uncovered=True)
+        pool_patch = patch.object(vector_store, "get_db_pool", AsyncMock(return_value=_LegacyPool(self.conn)))
+        embedding_patch = patch.object(vector_store, "get_query_embedding", AsyncMock(return_value=[0.0] * 384))
+        pool_patch.start()
+        embedding_patch.start()
+        self.addCleanup(pool_patch.stop)
+        self.addCleanup(embedding_patch.stop)
+
+    def tearDown(self):
+        vector_store._EMBEDDING_BACKEND = self.original_backend
+        vector_store._legacy_embedding_state.update(self.original_state)
+
+    async def test_search_between_upgrade_and_reembedding_recalls_legacy_tasks(self):
+        # 升级后任务 7 只有 legacy 向量：当前模型的向量检索查不到，由文本一路召回
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_vector", AsyncMock(return_value=[])
+        ), patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(7, 0.6)])
+        ) as text_mock:
+            results = await vector_store.search_similar_tasks("登录失败", mode="vector")
+
+        self.assertEqual([item["task_id"] for item in results], [7])
+        text_mock.assert_awaited_once()
+
+        # 重新生成完成后（复查到已全部覆盖）回到纯向量检索
+        vector_store.invalidate_similarity_cache()
+        self.conn.uncovered = False
+        vector_store._legacy_embedding_state["checked_at"] = 0.0
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_vector", AsyncMock(return_value=[_item(7, 0.9)])
+        ), patch.object(vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[])) as text_mock:
+            results = await vector_store.search_similar_tasks("登录失败", mode="vector")
+
+        self.assertEqual(results[0]["similarity"], 0.9)
+        text_mock.assert_not_awaited()
+        self.assertFalse(vector_store._legacy_embedding_state["pending"])
+
+    async def test_adopts_legacy_vectors_produced_by_current_model(self):
+        self.conn.sample = [_legacy_row([1.0, 0.0, 0.0]), _legacy_row([0.0, 1.0, 0.0], title="导出超时")]
+        self.conn.uncovered = False
+        with patch.object(
+            vector_store, "generate_embeddings", AsyncMock(return_value=[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])
+        ):
+            result = await vector_store.adopt_legacy_embeddings()
+
+        self.assertEqual(result, {"adopted": 3, "reembed": 0})
+        self.assertFalse(any("task_embedding_outbox" in sql for sql in self.conn.executed))
+        self.assertFalse(vector_store._legacy_embedding_state["pending"])
+
+    async def test_reembeds_legacy_vectors_from_other_backend(self):
+        self.conn.sample = [_legacy_row([1.0, 0.0, 0.0]), _legacy_row([0.0, 1.0, 0.0], title="导出超时")]
+        with patch.object(
+            vector_store, "generate_embeddings", AsyncMock(return_value=[[0.0, 0.0, 1.0], [0.0, 1.0, 0.0]])
+        ):
+            result = await vector_store.adopt_legacy_embeddings()
+
+        self.assertEqual(result, {"adopted": 0, "reembed": 2})
+        self.assertFalse(any("UPDATE task_embeddings" in sql for sql in self.conn.executed))
+        # 覆盖完成前检索继续按 hybrid 兜底
+        self.assertTrue(vector_store._legacy_embedding_state["pending"])
+
+
+class SearchCoalescingTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        vector_store.invalidate_similarity_cache()
+        pool_patch = patch.object(vector_store, "get_db_pool", AsyncMock(return_value=_FakePool()))
+        pool_patch.start()
+        self.addCleanup(pool_patch.stop)
+
+    async def test_concurrent_identical_queries_share_one_search(self):
+        release = asyncio.Event()
+
+        async def slow_text_search(**kwargs):
+            await release.wait()
+            return [_item(5, 0.6)]
+
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(side_effect=slow_text_search)
+        ) as text_mock:
+            searches = [
+                asyncio.create_task(vector_store.search_similar_tasks(text, mode="lexical", project_ids=scope))
+                for text, scope in [("ERR_401 登录", [3, 4]), ("  err_401   登录", [4, 3]), ("ERR_401 登录", [4, 3, 3])]
+            ]
+            await asyncio.sleep(0)
+            self.assertEqual(vector_store.get_search_cache_metrics()["inflight"], 1)
+            release.set()
+            results = await asyncio.gather(*searches)
+
+        text_mock.assert_awaited_once()
+        # 共享的查询按规范化文本执行，而不是第一个请求的原始文本
+        self.assertEqual(text_mock.await_args.kwargs["text_content"], "err_401 登录")
+        self.assertEqual(text_mock.await_args.kwargs["project_ids"], [3, 4])
+        self.assertEqual([[item["task_id"] for item in result] for result in results], [[5], [5], [5]])
+        self.assertGreaterEqual(vector_store.get_search_cache_metrics()["coalesced"], 2)
+
+    async def test_cached_results_are_invalidated_by_project(self):
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(5, 0.6)])
+        ) as text_mock:
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            self.assertEqual(text_mock.await_count, 1)
+
+            vector_store.invalidate_similarity_cache([4])
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            self.assertEqual(text_mock.await_count, 1)
+
+            vector_store.invalidate_similarity_cache([3])
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            self.assertEqual(text_mock.await_count, 2)
+
+    async def test_invalidation_is_broadcast_and_applied_from_other_workers(self):
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(return_value=[_item(5, 0.6)])
+        ) as text_mock, patch.object(vector_store, "publish_notification", AsyncMock()) as publish_mock:
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            await vector_store.publish_similarity_invalidation([3, 3])
+
+            publish_mock.assert_awaited_once_with(
+                vector_store.SIMILARITY_INVALIDATION_CHANNEL, {"origin": vector_store._ORIGIN, "project_ids": [3]}
+            )
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            self.assertEqual(text_mock.await_count, 2)
+
+            # 自己发出的通知回传时忽略，其他进程的通知失效本进程缓存
+            vector_store._handle_similarity_invalidation_notification({"origin": vector_store._ORIGIN, "project_ids": [3]})
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            self.assertEqual(text_mock.await_count, 2)
+
+            vector_store._handle_similarity_invalidation_notification({"origin": "other", "project_ids": [3]})
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            self.assertEqual(text_mock.await_count, 3)
+
+    async def test_failed_search_is_not_cached(self):
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(side_effect=[OSError("connection reset"), [_item(5, 0.6)]])
+        ) as text_mock:
+            first = await vector_store.search_similar_tasks("ERR_401", mode="lexical")
+            second = await vector_store.search_similar_tasks("ERR_401", mode="lexical")
+
+        self.assertEqual(first, [])
+        self.assertEqual([item["task_id"] for item in second], [5])
+        self.assertEqual(text_mock.await_count, 2)
+
+    async def test_invalidation_during_search_skips_caching(self):
+        async def text_search(**kwargs):
+            vector_store.invalidate_similarity_cache([3])
+            return [_item(5, 0.6)]
+
+        with patch.object(
+            vector_store, "_search_similar_tasks_by_text", AsyncMock(side_effect=text_search)
+        ) as text_mock:
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+            await vector_store.search_similar_tasks("ERR_401", mode="lexical", project_ids=[3])
+
+        self.assertEqual(text_mock.await_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import importlib.util
+import os
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+
+from app.services import vector_store
+
+
+def _has_modules(*names):
+    return all(importlib.util.find_spec(name) is not None for name in names)
+
+
+class _FakeTokenizer:
+    def __init__(self):
+        self.truncation = None
+
+    def enable_truncation(self, max_length):
+        self.truncation = max_length
+
+    def enable_padding(self):
+        pass
+
+    def encode_batch(self, texts):
+        # 第一条 3 个 token，第二条 1 个 token + 2 个 padding
+        return [
+            SimpleNamespace(ids=[101, 7, 102], attention_mask=[1, 1, 1], type_ids=[0, 0, 0]),
+            SimpleNamespace(ids=[101, 0, 0], attention_mask=[1, 0, 0], type_ids=[0, 0, 0]),
+        ]
+
+
+class _FakeSession:
+    def __init__(self, input_names):
+        self.input_names = input_names
+        self.feeds = None
+
+    def get_inputs(self):
+        return [SimpleNamespace(name=name) for name in self.input_names]
+
+    def run(self, output_names, feeds):
+        self.feeds = feeds
+        token_embeddings = np.array([
+            [[1.0, 0.0], [3.0, 0.0], [2.0, 6.0]],
+            [[0.0, 2.0], [100.0, 100.0], [100.0, 100.0]],
+        ], dtype=np.float32)
+        return [token_embeddings]
+
+
+class OnnxEmbeddingModelTests(unittest.TestCase):
+    def test_encode_mean_pools_over_attention_mask_and_normalizes(self):
+        tokenizer = _FakeTokenizer()
+        session = _FakeSession(["input_ids", "attention_mask", "token_type_ids"])
+        model = vector_store._OnnxEmbeddingModel(session, tokenizer)
+
+        embeddings = model.encode(["a", "b"], normalize_embeddings=True)
+
+        # 第一条均值 (2, 2) 归一化；第二条 padding 位置不参与池化
+        np.testing.assert_allclose(embeddings, [[0.70710677, 0.70710677], [0.0, 1.0]], rtol=1e-6)
+        self.assertEqual(tokenizer.truncation, vector_store._EMBEDDING_MAX_SEQ_LENGTH)
+        self.assertEqual(sorted(session.feeds), ["attention_mask", "input_ids", "token_type_ids"])
+        self.assertEqual(session.feeds["input_ids"].dtype, np.int64)
+
+    def test_encode_skips_token_type_ids_when_model_has_no_such_input(self):
+        session = _FakeSession(["input_ids", "attention_mask"])
+        model = vector_store._OnnxEmbeddingModel(session, _FakeTokenizer())
+
+        embeddings = model.encode(["a", "b"], normalize_embeddings=False)
+
+        self.assertNotIn("token_type_ids", session.feeds)
+        np.testing.assert_allclose(embeddings, [[2.0, 2.0], [0.0, 2.0]])
+
+    def test_model_id_distinguishes_onnx_files(self):
+        with patch.object(vector_store, "_EMBEDDING_BACKEND", "onnx"), patch.object(
+            vector_store, "EMBEDDING_ONNX_MODEL_FILE", "model_quantized.onnx"
+        ):
+            self.assertEqual(vector_store.get_embedding_model_id(), "onnx:all-MiniLM-L6-v2:model_quantized")
+
+    def test_missing_onnx_model_falls_back_to_hash(self):
+        with patch.object(vector_store, "_EMBEDDING_BACKEND", "onnx"), patch.object(
+            vector_store, "_EMBEDDING_MODEL", None
+        ), patch.object(vector_store._OnnxEmbeddingModel, "load", side_effect=FileNotFoundError("model.onnx")):
+            self.assertIsNone(vector_store._load_embedding_model())
+            self.assertEqual(vector_store._EMBEDDING_BACKEND, "hash")
+
+
+@unittest.skipUnless(
+    _has_modules("onnxruntime", "tokenizers", "sentence_transformers")
+    and os.path.exists(os.path.join(vector_store.EMBEDDING_ONNX_MODEL_DIR, vector_store.EMBEDDING_ONNX_MODEL_FILE)),
+    "需要 onnxruntime / sentence-transformers 与导出的 ONNX 模型",
+)
+class OnnxParityTests(unittest.TestCase):
+    def test_onnx_output_matches_sentence_transformers(self):
+        from sentence_transformers import SentenceTransformer
+
+        texts = ["修复登录接口在 token 过期后返回 500 的问题", "Fix OAuth callback redirect loop on Safari", "短"]
+        reference = SentenceTransformer(vector_store._EMBEDDING_MODEL_NAME).encode(texts, normalize_embeddings=True)
+        onnx_model = vector_store._OnnxEmbeddingModel.load(
+            vector_store.EMBEDDING_ONNX_MODEL_DIR, vector_store.EMBEDDING_ONNX_MODEL_FILE
+        )
+
+        embeddings = onnx_model.encode(texts, normalize_embeddings=True)
+
+        self.assertEqual(embeddings.shape, (len(texts), vector_store._EMBEDDING_DIM))
+        # int8 量化后仍应与 PyTorch 输出高度一致
+        self.assertGreater(float(np.min(np.sum(reference * embeddings, axis=1))), 0.98)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,7 +4,7 @@ import { Typography, Card, Spin, Tag, Button, Modal, Form, Input, Select, messag
 import { PlusOutlined, MoreOutlined, ClockCircleOutlined, TeamOutlined, UserDeleteOutlined, SearchOutlined, UserOutlined } from '@ant-design/icons';
 import { DragDropContext, Droppable, Draggable, type DropResult } from '@hello-pangea/dnd';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
-import { getTasksByProject, updateTask, createTask } from './service';
+import { getTasksByProject, updateTask, createTask, subscribeProjectEvents } from './service';
 import { getProjects, getProjectMembers, addProjectMember, removeProjectMember, searchUsers } from '../projects/service';
 import { buildSimilarityQueryText, searchSimilarTasks, resolveSimilaritySearchErrorMessage } from './similarityService';
 import { type Task, TaskStatus, type Project, type User } from '../../types';
@@ -78,6 +78,23 @@ export const KanbanBoard: React.FC = () => {
 
     const isLoading = isLoadingTasks || isLoadingProjects;
 
+    // 订阅项目任务变更事件：其他成员的修改推送到达后刷新，替代轮询
+    useEffect(() => {
+        if (!projectId) return;
+        const refreshTasks = () => queryClient.invalidateQueries({ queryKey: ['tasks', projectId] });
+        return subscribeProjectEvents(
+            projectId,
+            (event) => {
+                if (event.type === 'comment.created') {
+                    queryClient.invalidateQueries({ queryKey: ['task-comments', event.task_id] });
+                } else {
+                    refreshTasks();
+                }
+            },
+            refreshTasks,
+        );
+    }, [projectId, queryClient]);
+
     // 成员管理 - 不依赖 drawer 打开状态，直接加载
     const { data: members = [] } = useQuery({
         queryKey: ['projectMembers', projectId],
@@ -4,18 +4,28 @@ import type { Task, TaskUpdate, TaskCreate, TaskComment, TaskCommentListResponse
 
 const filterActiveTasks = (tasks: Task[]): Task[] => tasks.filter((task) => !task.deleted_at);
 
+// 任务列表接口按游标分页，沿 X-Next-Cursor 响应头取完所有页
+const fetchAllTaskPages = async (url: string): Promise<Task[]> => {
+  const tasks: Task[] = [];
+  let cursor: string | undefined;
+  do {
+    const response = await http.get<Task[]>(url, { params: cursor ? { cursor } : undefined });
+    tasks.push(...response.data);
+    cursor = response.headers['x-next-cursor'] || undefined;
+  } while (cursor);
+  return tasks;
+};
+
 // 获取指定项目的任务列表
 // 后端接口：GET /api/v1/tasks/project/{project_id}
 export const getTasksByProject = async (projectId: string): Promise<Task[]> => {
-  const response = await http.get<Task[]>(`/tasks/project/${projectId}`);
-  return filterActiveTasks(response.data);
+  return filterActiveTasks(await fetchAllTaskPages(`/tasks/project/${projectId}`));
 };
 
 // 获取当前用户的任务列表
 // 后端接口：GET /api/v1/tasks/
 export const getMyTasks = async (): Promise<Task[]> => {
-  const response = await http.get<Task[]>('/tasks/');
-  return filterActiveTasks(response.data);
+  return filterActiveTasks(await fetchAllTaskPages('/tasks/'));
 };
 
 // 更新任务（用于拖拽后保存状态）
@@ -64,3 +74,80 @@ export const restoreTask = async (taskId: number): Promise<{ message: string }>
   const response = await http.post<{ message: string }>(`/tasks/${taskId}/restore`);
   return response.data;
 };
+
+export type TaskEvent = {
+  id: number;
+  type: 'task.created' | 'task.updated' | 'task.deleted' | 'task.restored' | 'comment.created';
+  project_id: number;
+  task_id: number;
+  payload: Record<string, unknown>;
+  created_at: string;
+};
+
+// 订阅项目任务变更事件流（SSE），返回取消订阅函数
+// 后端接口：GET /api/v1/tasks/project/{project_id}/events
+// EventSource 无法携带 Authorization 头，这里用 fetch 读取流；断线后带 Last-Event-ID 续传，收到 reset 事件时调用 onReset
+export const subscribeProjectEvents = (
+  projectId: string,
+  onEvent: (event: TaskEvent) => void,
+  onReset: () => void,
+): (() => void) => {
+  const controller = new AbortController();
+  let lastEventId: string | undefined;
+
+  const connect = async () => {
+    const token = localStorage.getItem('access_token');
+    const response = await fetch(`/api/v1/tasks/project/${projectId}/events`, {
+      headers: {
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
+        ...(lastEventId ? { 'Last-Event-ID': lastEventId } : {}),
+      },
+      signal: controller.signal,
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`事件流连接失败: ${response.status}`);
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) return;
+      buffer += value;
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary >= 0) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let eventName = 'message';
+        let data = '';
+        for (const line of block.split('\n')) {
+          if (line.startsWith('id: ')) lastEventId = line.slice(4);
+          else if (line.startsWith('event: ')) eventName = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        if (!data) continue; // 心跳注释行
+        if (eventName === 'reset') onReset();
+        else onEvent(JSON.parse(data) as TaskEvent);
+      }
+    }
+  };
+
+  const run = async () => {
+    let delay = 1000;
+    while (!controller.signal.aborted) {
+      try {
+        await connect();
+        delay = 1000;
+      } catch {
+        if (controller.signal.aborted) return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, delay));
+      delay = Math.min(delay * 2, 30000);
+    }
+  };
+
+  void run();
+  return () => controller.abort();
+};
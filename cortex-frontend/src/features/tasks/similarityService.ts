@@ -28,8 +28,12 @@ export type SimilaritySearchResponse = {
 export type SimilaritySearchParams = {
   text: string;
   exclude_task_id?: number;
+  project_id?: number;
+  organization_id?: number;
   limit?: number;
   threshold?: number;
+  mode?: 'vector' | 'lexical' | 'hybrid';
+  latency_budget_ms?: number;
 };
 
 const SIMILARITY_TEXT_MAX_LENGTH = 900;